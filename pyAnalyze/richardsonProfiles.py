@@ -4,8 +4,8 @@ import numpy as np
 import argparse
 import matplotlib.pyplot as plt
 from plotTools import addToPlot
-from netcdfTools import netcdfDataset, readVariableFromDataset
-from analysisTools import sensibleIds, groundOffset
+from netcdfTools import netcdfDataset, streamedProfiles
+from analysisTools import stabilityProfiles
 from utilities import filesFromList
 ''' 
 Description: A script to perform quadrant analysis on velocity data stored in a NETCDF file.
@@ -28,6 +28,8 @@ parser.add_argument("-vn", "--vnames",  type=str, nargs=2, default=['u','v'],\
   help="Name of the horizontal velocity variables in the NETCDF file. Default=['u','v'] ")
 parser.add_argument("-ptn", "--ptname",  type=str, default='pt',\
   help="Name of the potential temperature variable in the NETCDF file. Default='pt' ")
+parser.add_argument("-wn", "--wname",  type=str, default='w',\
+  help="Name of the vertical velocity variable for the flux based L and Rf. Default='w' ")
 parser.add_argument("-c", "--coarse", type=int, default=1,\
   help="Coarsening level. Int > 1.")
 args = parser.parse_args()    
@@ -37,6 +39,7 @@ fileKey   = args.fileKey
 cl        = abs(args.coarse)
 vnames    = args.vnames
 ptname    = args.ptname
+wname     = args.wname
 
 #==========================================================# 
 
@@ -46,34 +49,39 @@ fileNos, fileList = filesFromList( fileKey+'*' )
 fig = plt.figure(num=1, figsize=(12,10))
 fig2= plt.figure(num=2, figsize=(12,10))
 fig3= plt.figure(num=3, figsize=(12,10))
+fig4= plt.figure(num=4, figsize=(12,10))
+fig5= plt.figure(num=5, figsize=(12,10))
 
 for fn in fileNos:
   ds, varList, paramList = netcdfDataset(fileList[fn], verbose=False)
-  u1, veldict = readVariableFromDataset( vnames[0], ds, cl=1 )
-  u2, veldict = readVariableFromDataset( vnames[1], ds, cl=1 )
-  
-  umag = np.sqrt( u1**2 + u2**2 ); u1 = None; u2 = None 
-
-  pt, ptdict = readVariableFromDataset( ptname, ds, cl=1 )
-  ptdict = None
+  un, vn = vnames
+  for dstr in ds.variables[un].dimensions:
+    if( 'z' in dstr ): z = ds.variables[dstr][::cl]
 
-  if( len(veldict.keys()) == 4 ):
-    umag = np.mean( umag, axis=(0,2,3) )
-    pt   = np.mean( pt  , axis=(0,2,3) )
-  if( len(veldict.keys()) == 2 ):
-    umag = np.mean( umag, axis=(0) )
-    pt   = np.mean( pt  , axis=(0) )
+  if( ds.variables[un].ndim == 2 ):
+    # (time, z) profile data: small enough to read at once.
+    P = dict()
+    P['umag'] = np.mean( np.sqrt( ds.variables[un][:]**2 + ds.variables[vn][:]**2 ), axis=0 )[::cl]
+    P['pt']   = np.mean( ds.variables[ptname][:], axis=0 )[::cl]
+  else:
+    # Profiles averaged over (time, y, x), accumulated over time blocks.
+    exprDict = dict()
+    exprDict['umag'] = ( [un, vn], lambda u, v: np.sqrt( u**2 + v**2 ) )
+    exprDict['pt']   = ( [ptname], None )
+    if( wname in varList ):
+      prod = lambda a, b: a*b
+      exprDict['u'] = ( [un], None ); exprDict['v'] = ( [vn], None )
+      exprDict['w'] = ( [wname], None )
+      exprDict['uw']  = ( [un, wname], prod )
+      exprDict['vw']  = ( [vn, wname], prod )
+      exprDict['wpt'] = ( [wname, ptname], prod )
+    else:
+      print(' No {} in {}: L and Rf are not computed.'.format(wname, fileList[fn]))
+    P = streamedProfiles( ds, exprDict, cl )
+  ds.close()
 
-  for dstr in veldict.keys():
-    if( 'z' in dstr ): z = veldict[dstr]
-  
-  veldict = None
-  
-  dudz  = (umag[1:]-umag[:-1])/(z[1:]-z[:-1])
-  dptdz = (pt[1:]-pt[:-1])/(z[1:]-z[:-1])
-  zm    = 0.5*(z[1:]+z[:-1])
-  
-  Ri   = (9.81/np.mean(pt))*(dptdz)/(dudz**2+1e-9)  * ( dudz > 1e-3 ).astype(float)
+  R = stabilityProfiles( P, z )
+  zm = R['zm']; Ri = R['Ri']; dudz = R['dudz']; dptdz = R['dptdz']
   
   plotStr = ["Local Ri vs z ", "Ri" ,"z"]
   fig = addToPlot(fig, Ri[2:-4], zm[2:-4],'{}'.format(fileList[fn]), plotStr, False )
@@ -84,5 +92,12 @@ for fn in fileNos:
   plotStr = ["du/dz vs z ", "du/dz" ,"z"]
   fig3 = addToPlot(fig3, dudz[2:-4], zm[2:-4],'{}'.format(fileList[fn]), plotStr, False )
 
+  if( 'L' in R ):
+    plotStr = ["Local Obukhov length vs z ", "L" ,"z"]
+    fig4 = addToPlot(fig4, R['L'][2:-4], zm[2:-4],'{}'.format(fileList[fn]), plotStr, False )
+
+    plotStr = ["Flux Ri vs z ", "Rf" ,"z"]
+    fig5 = addToPlot(fig5, R['Rf'][2:-4], zm[2:-4],'{}'.format(fileList[fn]), plotStr, False )
+
 plt.legend(loc=0)
 plt.show()
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 from utilities import sortTimes, extractMatchingTerms
-from paraTools import extractParaviewLineData
+from paraTools import sampleLines
 from wave import waveInformation
 import os, sys
 import numpy as np
@@ -23,6 +23,10 @@ parser.add_argument("-s","--screen", help="Output values ONLY to screen.", actio
     default=False)
 parser.add_argument("-t","--times", type=float, action='append', nargs='+', \
     help="Specific times: t1 t2 t3 ...", default=None)
+parser.add_argument("-nw","--nWorkers", type=int, default=1,\
+    help="Number of processes sampling the times. (default=1)")
+parser.add_argument("-e","--engine", type=str, default='auto', choices=['auto','paraview','foam'],\
+    help="Sampling engine: paraview or the ascii field reader foam. (default=auto)")
 
 args = parser.parse_args()
 
@@ -64,9 +68,11 @@ line = [p1, p2]
 
 
 Uw_min = 1.e-3   # This threshold value may need finetuning.
-for t in times: 
+D = sampleLines( baseDir, varList, [line], calcSettings, csvVars, times,\
+    nWorkers=args.nWorkers, engine=args.engine )
+for it, t in enumerate(times): 
     print 'time = {}'.format(t)
-    [Ul, x] = extractParaviewLineData( baseDir, varList, line, calcSettings, csvVars, t )
+    [Ul, x] = D[it,0]
     #print ' size( Ul )= {}'.format(np.size(Ul))
 
     waveInformation(t, Ul, x, Uw_min, fo )
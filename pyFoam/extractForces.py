@@ -3,23 +3,7 @@
 import sys
 import numpy as np
 import pylab as pl
-from txtTools import openIOFile
-
-# =*=*=*=* FUNCTION DEFINITIONS *=*=*=*=*=*=*=*=*=*=*=*
-
-def isolateValues( line , stripChars ):
-  v = []
-  sl = line.split()
-  for i in xrange(len(sl)):
-    for sc in stripChars:
-      sl[i] = sl[i].strip(sc)
-
-  for s in sl:
-    v.append(float(s))
-    
-  return v
-
-# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+from foamTools import readVectorLog
 
 try:
   factor = sys.argv[1]
@@ -28,22 +12,11 @@ except:
 
 factor = float(factor)
 
-f = openIOFile('forces.dat', 'r')
-oc = openIOFile('forces.cmp', 'w')
-ot = openIOFile('forces.tot', 'w')
-
-lines = f.readlines()
-spr = ['(',')']
-Fx  = np.zeros(4,float)
-
-for l in lines[1:]:
-  x = np.array(isolateValues(l,spr)) 
-  if( len(x) == 13 ):
-    x.tofile(oc,sep=" \t"); oc.write("\n")
-
-    Fx[0] = x[0]
-    for i in xrange(1,len(Fx)):
-      Fx[i]=factor*(x[i]+x[i+3]) # Pressure + Viscous
-    Fx.tofile(ot, sep=" \t"); ot.write("\n")
-    
-f.close(); oc.close(); ot.close()
\ No newline at end of file
+x = readVectorLog( 'forces.dat' )
+if( x.shape[1] == 13 ):
+  # [time, Fx, Fy, Fz] with Pressure + Viscous
+  Fx = np.column_stack( (x[:,0], factor*(x[:,1:4]+x[:,4:7])) )
+  np.savetxt( 'forces.cmp', x, fmt='%.12g', delimiter=' \t' )
+  np.savetxt( 'forces.tot', Fx, fmt='%.12g', delimiter=' \t' )
+else:
+  print(' Expected 13 columns in forces.dat, found {}. Nothing written.'.format(x.shape[1]))
@@ -6,28 +6,10 @@ import pylab as pl
 import argparse
 from utilities import filesFromList
 from plotTools import addToPlot, userLabels
+from foamTools import readVectorLogs, forceMomentTotals
 
 
 
-# =========== === FUNCTIONS === ======================== #
-def isolateNumericalValues( s , stripChars ):
-    for i in xrange(len(s)):
-        for sc in stripChars:
-            s[i] = s[i].strip(sc)
-    
-    return np.array(map( float, s )) # Turns it into column array
-
-# ===================================================== #
-
-def extractColumns( data , icols  ):
-    ncols = len(icols); nrows = np.shape(data)[0]
-    v = np.zeros( (ncols, nrows) , float) # cols and rows reversed here!
-    
-    for j in xrange(ncols):
-        v[j] = isolateNumericalValues( data[:,icols[j]] , ['(',')'])
-    
-    return v
-
 # ============ === ARGS === =========================== #
 
 parser = argparse.ArgumentParser()
@@ -41,27 +23,9 @@ args = parser.parse_args()
 
 fileNos, fileList = filesFromList('./postProcessing/forces/*/forces*'  )
 
-Ftot = [[],[],[]]; Ttot =[[],[],[]]
-time = []
-
-for fn in fileNos:
-    raw = np.loadtxt( fileList[fn], dtype=str )
-    ncols = len(raw[0,:])-1  # How many columns of Force data
-
-    t  = np.array( extractColumns( raw , [0,] )[0] )
-    Fp = np.array( extractColumns( raw , [1,2,3] ) )
-    Fv = np.array( extractColumns( raw , [4,5,6] ) )
-    Fo = np.array( extractColumns( raw , [7,8,9] ) )
-    Tp = np.array( extractColumns( raw , [10,11,12] ) )
-    Tv = np.array( extractColumns( raw , [13,14,15] ) )
-    To = np.array( extractColumns( raw , [16,17,18] ) )
-
-    time.extend(t)
-    for n in xrange(3):
-        Ftot[n].extend( Fp[n]+Fv[n]+Fo[n] )
-        Ttot[n].extend( Tp[n]+Tv[n]+To[n] )
-
-    #print np.shape(t), np.shape(time), np.shape(Fp[0]),np.shape(Ftot[0])     
+# Restarts are concatenated in time order; overlapping times are dropped.
+D = readVectorLogs( [ fileList[fn] for fn in fileNos ] )
+time, Ftot, Ttot = forceMomentTotals( D ); D = None
 
 fig = pl.figure(1, figsize=(8.5,8.5))
 if( not args.torgue ):
@@ -1,26 +1,75 @@
 #!/usr/bin/env python
 import sys
-import glob
+import os
+import shutil
 import numpy as np
 import argparse
-import subprocess as sb
-import argparse
+from utilities import sortTimes
+'''
+Description:
+Gather sampled surfaces (e.g. postProcessing/surfaces/<time>/U_zPlane.vtk)
+from the time directories into the current directory, renaming them by time.
+The time directories and surface files are indexed once and the files are
+moved (or hard-linked) in-process. Optionally a Paraview .pvd collection
+of the gathered files is written for loading them as one time series.
+
+
+Author: Mikko Auvinen
+        mikko.auvinen@helsinki.fi
+        University of Helsinki &
+        Finnish Meteorological Institute
+'''
+
+#==========================================================#
+
+def surfaceIndex( timeDirs, timeValues, origNames, str2num, factor ):
+  # [(time, source path, target name)] for the existing surface files.
+  idx = []
+  for td, tv in zip( timeDirs, timeValues ):
+    files = set( os.listdir( td ) )
+    timeStr = '{:g}'.format(int(tv*factor))
+    for origName in origNames:
+      if( origName in files ):
+        idx.append( (tv, os.path.join( td, origName ), origName.replace(str2num, timeStr)) )
+  return idx
+
+#==========================================================#
 
+def writePvdCollection( filename, idx ):
+  fx = open( filename, 'w' )
+  fx.write('<?xml version="1.0"?>\n')
+  fx.write('<VTKFile type="Collection" version="0.1" byte_order="LittleEndian">\n')
+  fx.write('  <Collection>\n')
+  for tv, src, dst in idx:
+    fx.write('    <DataSet timestep="{:g}" group="" part="0" file="{}"/>\n'.format(tv, dst))
+  fx.write('  </Collection>\n')
+  fx.write('</VTKFile>\n')
+  fx.close()
+  print(' {} written successfully.'.format(filename))
+
+#==========================================================#
 parser = argparse.ArgumentParser()
-parser.add_argument("-f", "--filename", help="Name of the target .vtk files",\
-  default='U_zPlane.vtk')
+parser.add_argument("-f", "--filename", help="Name(s) of the target .vtk files",\
+  nargs='+', default=['U_zPlane.vtk'])
 parser.add_argument("-s", "--str2num", help="String to be replaced by a number.",\
   default='zPlane')
 parser.add_argument("-ts", "--timescale", help="Factor for scaling time in file name",\
   type=float, default=0.)
+parser.add_argument("-l", "--link", help="Hard-link the files instead of moving them.",\
+  action="store_true", default=False)
+parser.add_argument("-pvd", "--pvdFile", type=str, default=None,\
+  help="Write a .pvd collection of the gathered files (one per target name).")
+parser.add_argument("-p", "--printOnly", help="Only print the moves on screen.",\
+  action="store_true", default=False)
 
 args = parser.parse_args()
 
 factor = args.timescale
-origName = args.filename
+origNames = args.filename
 str2num  = args.str2num
-timeDirs = glob.glob('[0-9]*')  # Extracts all time directories as str list.
+timeDirs = [ td for td in sortTimes('./') if os.path.isdir( td ) ]
 timeValues = map( float, timeDirs )
+if( len(timeDirs) == 0 ): sys.exit(' No time directories found. Exiting ...')
 tmax = np.max(timeValues)
 
 # Determine timescale factor automatically if none is provided. 
@@ -34,12 +83,28 @@ if( factor == 0 ):
     else:
         factor = 1
 
-for i in xrange(len(timeDirs)):
-    timeStr = '{:g}'.format(int(timeValues[i]*factor))
-    newName = origName.replace(str2num, timeStr )
-    cmd = 'mv {}/{} ./{}'.format(timeDirs[i], origName, newName )
-    print cmd
-    retcode = sb.call( cmd , shell=True)
+idx = surfaceIndex( timeDirs, timeValues, origNames, str2num, factor )
+print(' Found {} surface files in {} time directories.'.format(len(idx), len(timeDirs)))
 
-print ' Completed !'
+targets = [ dst for tv, src, dst in idx ]
+if( len(set(targets)) < len(targets) ):
+  sys.exit(' Error: the time scale factor {} gives duplicate file names. Use -ts.'.format(factor))
+
+for tv, src, dst in idx:
+  if( args.printOnly ):
+    print(' {} -> ./{}'.format(src, dst)); continue
+  if( args.link ):
+    if( os.path.exists( dst ) ): os.remove( dst )
+    try:    os.link( src, dst )
+    except OSError: shutil.copy2( src, dst )   # E.g. across file systems.
+  else:
+    shutil.move( src, dst )
 
+if( args.pvdFile and not args.printOnly ):
+  for origName in origNames:
+    sub = [ e for e in idx if os.path.basename(e[1]) == origName ]
+    pvdName = args.pvdFile
+    if( len(origNames) > 1 ): pvdName = origName.split('.vtk')[0]+'_'+args.pvdFile
+    writePvdCollection( pvdName, sub )
+
+print ' Completed !'
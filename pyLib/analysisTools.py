@@ -157,19 +157,123 @@ def quadrantAnalysis( v1, v2, qDict ):
 
 #==========================================================#
 
+def blockMoments( X, w=None ):
+  '''
+  Central moment sums [n, mean, M2, M3, M4] of X along axis 0, with
+  optional weights w (e.g. resampling multiplicities) for the rows of X.
+  '''
+  if( w is None ): w = np.ones( X.shape[0] )
+  n = float( np.sum(w) )
+  if( n == 0. ): return None
+  m = np.tensordot( w, X, axes=1 )/n
+  D = X - m
+  D2 = D*D
+  M2 = np.tensordot( w, D2, axes=1 )
+  M3 = np.tensordot( w, D2*D, axes=1 )
+  M4 = np.tensordot( w, D2*D2, axes=1 )
+  
+  return [n, m, M2, M3, M4]
+
+#==========================================================#
+
+def combineMoments( A, B ):
+  '''
+  Combine the moment sums of two disjoint sets (Chan et al. / Pebay).
+  '''
+  if( A is None ): return B
+  if( B is None ): return A
+  na, ma, M2a, M3a, M4a = A
+  nb, mb, M2b, M3b, M4b = B
+  n  = na + nb
+  d  = mb - ma; d2 = d*d
+  M4 = M4a + M4b + d2*d2*na*nb*(na*na - na*nb + nb*nb)/n**3 \
+    + 6.*d2*(na*na*M2b + nb*nb*M2a)/n**2 + 4.*d*(na*M3b - nb*M3a)/n
+  M3 = M3a + M3b + d2*d*na*nb*(na - nb)/n**2 + 3.*d*(na*M2b - nb*M2a)/n
+  M2 = M2a + M2b + d2*na*nb/n
+  m  = ma + d*nb/n
+  
+  return [n, m, M2, M3, M4]
+
+#==========================================================#
+
+def streamedMoments( blocks, wList=[None] ):
+  '''
+  Moment sums over time of the blocks (t1, t2, X[t1:t2]) in a single pass.
+  wList holds one weight array over all times (or None) per realization,
+  e.g. np.bincount of resampled time indices. Returns a list of moment
+  sums, one per entry of wList.
+  '''
+  S = [ None ]*len(wList)
+  for t1, t2, X in blocks:
+    for i, w in enumerate( wList ):
+      if( w is None ): wb = None
+      else:            wb = w[t1:t2]
+      S[i] = combineMoments( S[i], blockMoments( X, wb ) )
+  
+  return S
+
+#==========================================================#
+
+def momentStatistics( S ):
+  '''
+  mean, var, std, skew and (excess) kurtosis from the moment sums. The
+  biased estimators match np.var, scipy.stats.skew and kurtosis defaults.
+  '''
+  n, m, M2, M3, M4 = S
+  var = M2/n
+  sDict = dict()
+  sDict['mean'] = m
+  sDict['var']  = var
+  sDict['std']  = np.sqrt( var )
+  sDict['skew'] = (M3/n)/np.maximum( var, 1.e-30 )**1.5
+  sDict['kurt'] = (M4/n)/np.maximum( var, 1.e-30 )**2 - 3.
+  sDict['n']    = n
+  
+  return sDict
+
+#==========================================================#
+
+def stabilityProfiles( P, z, g=9.81, kappa=0.41 ):
+  '''
+  Stability parameters from mean profiles P (see netcdfTools.streamedProfiles):
+  'umag' and 'pt' are required; 'u', 'v', 'w', 'uw', 'vw' and 'wpt' (mean
+  products) enable the flux based ones. The gradients and the results are
+  given at the midpoints zm of z.
+  Ri: gradient Richardson number, L: local Obukhov length,
+  Rf: flux Richardson number.
+  '''
+  dz = z[1:]-z[:-1]
+  mid = lambda p: 0.5*(p[1:]+p[:-1])
+  R = dict()
+  R['zm']    = mid( z )
+  R['dudz']  = (P['umag'][1:]-P['umag'][:-1])/dz
+  R['dptdz'] = (P['pt'][1:]-P['pt'][:-1])/dz
+  pt0 = np.nanmean( P['pt'] )
+  R['Ri'] = (g/pt0)*R['dptdz']/(R['dudz']**2+1e-9) * ( R['dudz'] > 1e-3 ).astype(float)
+
+  if( all( k in P for k in ['u','v','w','uw','vw','wpt'] ) ):
+    # Covariances over (time, y, x): <a'b'> = <ab> - <a><b>.
+    uw  = mid( P['uw']  - P['u']*P['w'] )
+    vw  = mid( P['vw']  - P['v']*P['w'] )
+    wpt = mid( P['wpt'] - P['w']*P['pt'] )
+    us  = ( uw**2 + vw**2 )**0.25
+    R['us']  = us
+    R['wpt'] = wpt
+    R['L']   = -us**3*pt0/( kappa*g*np.where( wpt == 0., 1e-12, wpt ) )
+    # Rf = -B/P: buoyancy over shear production, positive when stable.
+    prod = -( uw*(P['u'][1:]-P['u'][:-1]) + vw*(P['v'][1:]-P['v'][:-1]) )/dz
+    R['Rf']  = -(g/pt0)*wpt/np.where( np.abs(prod) < 1e-9, 1e-9, prod )
+
+  return R
+
+#==========================================================#
+
 def calc_ts_entropy_profile( V, z, alpha=1., nbins=16 ):
+  # Entropy of the (demeaned) time series V[:,k,1,1] (or [:,k,0,0]) at each level.
+  try:    Vk = V[:,:len(z),1,1]
+  except: Vk = V[:,:len(z),0,0]
   
-  vo = np.zeros( len(z) )
-  for k in xrange( len(z) ):
-    try:    Vk = V[:,k,1,1]
-    except: Vk = V[:,k,0,0]
-    Vk = Vk - np.mean(Vk)
-    pk, bins = np.histogram( Vk, bins=nbins, density=True ) # Do not store the bins
-    bins = None
-    
-    vo[k] = calc_entropy( pk, alpha )
-    
-  return vo
+  return entropyFields( Vk, [alpha], nbins )['S'][alpha]
 
 #==========================================================#
 
@@ -177,10 +281,11 @@ def calc_entropy( pk , alpha=1. ):
   '''
   pk: probability density distribution (i.e. histogram from time series or wavelet scalo- or spectrogram.
   '''
+  pk = np.asarray( pk, float )
   if( alpha == 1. ):
     s = st.entropy( pk )
   else:
-    s =(np.log( sum(np.power(np.array(pk),alpha)) ))/(1.-alpha)
+    s =(np.log( np.sum(np.power(pk,alpha)) ))/(1.-alpha)
     
   return s
 
@@ -188,18 +293,165 @@ def calc_entropy( pk , alpha=1. ):
 
 def calc_divergence( pk, rk, alpha=1. ):
   
-  pk += 1e-9; rk += 1e-9  # Add something small in case zero 
+  pk = np.asarray( pk, float ) + 1e-9  # Add something small in case zero 
+  rk = np.asarray( rk, float ) + 1e-9
   
   if(alpha==1.):
-    div=sum(np.array(pk)*np.log(np.array(pk)/(np.array(rk)) ))
+    div=np.sum(pk*np.log(pk/rk))
   else:
-    powratio=np.power(np.array(pk),alpha)/np.power(np.array(rk),alpha-1.)
-    div=np.log((sum(powratio)))/(alpha-1.)
+    powratio=np.power(pk,alpha)/np.power(rk,alpha-1.)
+    div=np.log(np.sum(powratio))/(alpha-1.)
   
   return div
 
 #==========================================================#
 
+def histogramColumns( X, bins=16, lo=None, hi=None ):
+  '''
+  Histograms (ncol, nbins) of all columns of X (nt, ncol) at once.
+  bins is either the number of equal bins over [lo, hi] of each column
+  (default: the finite min and max of each column) or an array of bin
+  edges shared by all columns. As in np.histogram, the last bin includes
+  its right edge and values outside the edges are not counted. The bin indices are offset by nbins per column and counted with
+  a single np.bincount. NaN values are not counted.
+  '''
+  nt, ncol = X.shape
+  idf = np.isfinite( X )
+  if( np.ndim( bins ) == 0 ):
+    nbins = int( bins )
+    if( lo is None ): lo = np.min( np.where( idf, X, np.inf ), axis=0 )
+    if( hi is None ): hi = np.max( np.where( idf, X, -np.inf ), axis=0 )
+    lo = np.where( np.isfinite( lo ), lo, 0. ); hi = np.where( np.isfinite( hi ), hi, 0. )
+    w = np.where( hi > lo, hi - lo, 1. )
+    b = np.floor( ( np.where( idf, X, lo ) - lo )*( nbins/w ) ).astype( np.int64 )
+    np.clip( b, 0, nbins-1, out=b )
+  else:
+    edges = np.asarray( bins, float ); nbins = len(edges)-1
+    Xf = np.where( idf, X, edges[0] )
+    b = np.searchsorted( edges, Xf, side='right' ).astype( np.int64 ) - 1
+    b[ Xf == edges[-1] ] = nbins-1
+    idf &= ( Xf >= edges[0] ) & ( Xf <= edges[-1] )
+    np.clip( b, 0, nbins-1, out=b )
+  b += nbins*np.arange( ncol, dtype=np.int64 )
+  C = np.bincount( b[idf], minlength=ncol*nbins )
+  
+  return C.reshape( ncol, nbins )
+
+#==========================================================#
+
+def normalizeCounts( C ):
+  # Probabilities from counts or densities (..., nbins); empty histograms stay 0.
+  n = np.sum( C, axis=-1 ).astype(float)
+  return C/np.where( n > 0., n, 1. )[...,None]
+
+#==========================================================#
+
+def entropyFromCounts( C, alphas=[1.] ):
+  '''
+  Shannon (alpha=1) and Renyi entropies of the histograms C (..., nbins),
+  counts or densities.
+  Returns {alpha: entropy(...)}.
+  '''
+  P = normalizeCounts( C )
+  S = dict()
+  for a in alphas:
+    if( a == 1. ):
+      S[a] = -np.sum( P*np.log( np.where( P > 0., P, 1. ) ), axis=-1 )
+    else:
+      S[a] = np.log( np.sum( np.where( P > 0., P, 0. )**a, axis=-1 ) )/(1.-a)
+  
+  return S
+
+#==========================================================#
+
+def divergenceFromCounts( C, Cr, alphas=[1.] ):
+  '''
+  Kullback-Leibler (alpha=1) and Renyi divergences D(P||R) of the
+  histograms C against the reference histograms Cr (same bins), with the
+  same 1e-9 regularization as calc_divergence. Returns {alpha: D(...)}.
+  '''
+  P = normalizeCounts( C ) + 1e-9
+  R = normalizeCounts( Cr ) + 1e-9
+  D = dict()
+  for a in alphas:
+    if( a == 1. ):
+      D[a] = np.sum( P*np.log( P/R ), axis=-1 )
+    else:
+      D[a] = np.log( np.sum( P**a/R**(a-1.), axis=-1 ) )/(a-1.)
+  
+  return D
+
+#==========================================================#
+
+def entropyFields( X, alphas=[1.], nbins=16, edges='column', Xr=None, demean=True, nColMax=2**16 ):
+  '''
+  Entropies of all time series X[:, ...] (time first), computed in batches
+  of nColMax columns. nbins is the number of bins or an array of bin
+  edges; with edges the histograms are densities (counts/bin width), as
+  np.histogram( density=True ). For a number of bins, edges='column' uses
+  the range of each time series (as np.histogram per series), 'shared'
+  one range over all of them.
+  With a reference Xr (same shape, e.g. another run) the divergences
+  D(X||Xr) are also computed; each series and its reference share bins.
+  Returns {'S': {alpha: field}, 'D': {alpha: field}} with the fields
+  shaped X.shape[1:].
+  '''
+  shape = X.shape[1:]; nt = X.shape[0]
+  X = X.reshape( nt, -1 )
+  if( Xr is not None ): Xr = Xr.reshape( Xr.shape[0], -1 )
+  ncol = X.shape[1]
+  
+  def batch( A, c1, c2 ):
+    A = np.ma.filled( np.ma.asarray( A[:,c1:c2], dtype=float ), np.nan )
+    if( demean ): A = A - np.nanmean( A, axis=0 )
+    return A
+  
+  def limits( A ):
+    return np.nanmin( A, axis=0 ), np.nanmax( A, axis=0 )
+  
+  explicit = ( np.ndim( nbins ) > 0 )
+  if( explicit ):
+    width = np.diff( np.asarray( nbins, float ) )
+  elif( edges == 'shared' ):
+    lo = np.inf; hi = -np.inf
+    for c1 in xrange( 0, ncol, nColMax ):
+      for A in [ X, Xr ]:
+        if( A is None ): continue
+        l, h = limits( batch( A, c1, c1+nColMax ) )
+        lo = min( lo, np.nanmin( l ) ); hi = max( hi, np.nanmax( h ) )
+  
+  R = {'S': dict( (a, np.zeros( ncol )) for a in alphas ), 'D': dict()}
+  if( Xr is not None ): R['D'] = dict( (a, np.zeros( ncol )) for a in alphas )
+  for c1 in xrange( 0, ncol, nColMax ):
+    c2 = min( c1+nColMax, ncol )
+    Xc = batch( X, c1, c2 )
+    Xrc = batch( Xr, c1, c2 ) if( Xr is not None ) else None
+    if( explicit ):
+      l = None; h = None
+    elif( edges == 'shared' ):
+      l = np.ones( c2-c1 )*lo; h = np.ones( c2-c1 )*hi
+    else:
+      l, h = limits( Xc )
+      if( Xrc is not None ):
+        lr, hr = limits( Xrc ); l = np.fmin( l, lr ); h = np.fmax( h, hr )
+    if( not explicit ):
+      l = np.where( np.isfinite( l ), l, 0. ); h = np.where( np.isfinite( h ), h, 0. )
+    
+    C = histogramColumns( Xc, nbins, l, h )
+    if( explicit ): C = C/width
+    for a, S in entropyFromCounts( C, alphas ).items(): R['S'][a][c1:c2] = S
+    if( Xrc is not None ):
+      Cr = histogramColumns( Xrc, nbins, l, h )
+      if( explicit ): Cr = Cr/width
+      for a, D in divergenceFromCounts( C, Cr, alphas ).items(): R['D'][a][c1:c2] = D
+  
+  for k in R.keys():
+    for a in R[k].keys(): R[k][a] = R[k][a].reshape( shape )
+  
+  return R
+
+#==========================================================#
+
 def discreteWaveletAnalysis( vx , wDict ):
   from utilities import dataFromDict
   import pywt
@@ -208,23 +460,73 @@ def discreteWaveletAnalysis( vx , wDict ):
   order = 'freq'  # "normal"
   wavelet = dataFromDict('wavelet', wDict, allowNone=False )
   nlevel  = dataFromDict('nlevel',  wDict, allowNone=False )
-  if( wavelet in pywt.wavelist() ):
-    try:
-      wp = pywt.WaveletPacket( vx , wavelet, 'sym', maxlevel=nlevel)
-    except:
-      print(" Wrong wavelet type given. Reverting to default 'db2'. ")
-      wavelet = 'db2'
-      wp = pywt.WaveletPacket( vx , wavelet, 'sym', maxlevel=nlevel)
-  
-  nodes = wp.get_level(nlevel, order=order)
-  labels = [n.path for n in nodes]
-  values = np.array([n.data for n in nodes], 'd')
-  values = abs(values)
+  if( wavelet not in pywt.wavelist() ):
+    print(" Wrong wavelet type given. Reverting to default 'db2'. ")
+    wavelet = 'db2'
+  
+  C, labels = waveletPacketBands( np.asarray(vx)[:,None], wavelet, nlevel, order=order )
+  values = abs( C[:,:,0] )
   
   return values, labels
 
 #==========================================================#
 
+def waveletPacketBands( X, wavelet='db2', nlevel=4, mode='symmetric', order='freq' ):
+  '''
+  Wavelet packet decomposition of all time series X (nt, ncol) at once,
+  along the time axis. Returns the coefficients (nbands, nc, ncol) of the
+  nodes at level nlevel and their paths (labels). With order='freq' the
+  bands are in increasing frequency, each spanning fs/2**(nlevel+1).
+  Older pywt versions without the axis argument decompose column by column.
+  '''
+  import pywt
+  try:
+    wp = pywt.WaveletPacket( X, wavelet, mode, maxlevel=nlevel, axis=0 )
+    nodes = wp.get_level( nlevel, order=order )
+    labels = [ n.path for n in nodes ]
+    C = np.array( [ n.data for n in nodes ], 'd' )
+  except TypeError:
+    C = None
+    for j in xrange( X.shape[1] ):
+      wp = pywt.WaveletPacket( X[:,j], wavelet, mode, maxlevel=nlevel )
+      nodes = wp.get_level( nlevel, order=order )
+      Cj = np.array( [ n.data for n in nodes ], 'd' )
+      if( C is None ):
+        labels = [ n.path for n in nodes ]
+        C = np.zeros( Cj.shape + (X.shape[1],) )
+      C[:,:,j] = Cj
+  
+  return C, labels
+
+#==========================================================#
+
+def waveletPacketProfile( X, wavelet='db2', nlevel=4, ij=None ):
+  '''
+  Band energies of the demeaned time series X (nt, nz, ny, nx) averaged
+  over (y, x) at each level: E (nz, nbands). Columns with masked or NaN
+  values (e.g. inside buildings) are excluded from the averages; levels
+  without valid columns get NaN. With ij=(i,j) the packet coefficients
+  (nz, nbands, nc) of that column are also returned (else None).
+  '''
+  nt, nz, ny, nx = X.shape
+  X = np.ma.masked_invalid( np.ma.asarray( X, dtype=float ) )
+  iv = ~np.any( np.ma.getmaskarray( X ), axis=0 )
+  X = np.ma.filled( X, 0. )
+  X = X - np.mean( X, axis=0 )
+  C, labels = waveletPacketBands( X.reshape( nt, -1 ), wavelet, nlevel )
+  X = None
+  C = C.reshape( C.shape[:2] + (nz, ny, nx) )
+  n = iv.sum( axis=(1,2) )
+  E = ( np.sum( C**2, axis=1 )*iv ).sum( axis=(2,3) ).T/np.maximum( n, 1 )[:,None]
+  E[ n == 0 ] = np.nan
+  Cij = None
+  if( ij is not None ):
+    Cij = np.transpose( C[:,:,:,ij[1],ij[0]], (2,0,1) )
+  
+  return E, Cij, labels
+
+#==========================================================#
+
 def continuousWaveletAnalysis( vx, wDict ):
   from utilities import dataFromDict
   import pywt
@@ -0,0 +1,181 @@
+import numpy as np
+import sys
+import os
+import subprocess as sb
+'''
+Description:
+Headless frame rendering and animation encoding.
+Each process creates one Agg figure, which is reused for all of its frames:
+only the artist data is updated per frame. The rendered RGB frames are
+piped straight to ffmpeg, so no intermediate image files are needed.
+Without ffmpeg the frames are written as png files and joined with convert.
+
+
+Author: Mikko Auvinen
+        mikko.auvinen@helsinki.fi
+        University of Helsinki &
+        Finnish Meteorological Institute
+'''
+
+# Per-process figure and user state for the frame workers.
+gFig   = None
+gState = None
+gUpdate = None
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def aggFigure( figsize=(9.,9.), dpi=100 ):
+  # A figure with its own Agg canvas; independent of the pyplot backend.
+  from matplotlib.figure import Figure
+  from matplotlib.backends.backend_agg import FigureCanvasAgg
+  fig = Figure( figsize=figsize, dpi=dpi )
+  FigureCanvasAgg( fig )
+  return fig
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def figureToRGB( fig ):
+  fig.canvas.draw()
+  w, h = fig.canvas.get_width_height()
+  try:
+    F = np.frombuffer( fig.canvas.tostring_rgb(), np.uint8 ).reshape( h, w, 3 )
+  except AttributeError:
+    F = np.asarray( fig.canvas.buffer_rgba() )[:,:,:3]
+  return F.copy()
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def imageToRGB( img ):
+  '''
+  Convert an image array (e.g. from matplotlib.image.imread) to uint8 RGB.
+  '''
+  img = np.asarray( img )
+  if( img.dtype != np.uint8 ):
+    img = np.round( 255.*np.clip( img, 0., 1. ) ).astype( np.uint8 )
+  if( img.ndim == 2 ): img = np.dstack( (img, img, img) )
+  return img[:,:,:3]
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def padFrame( F, h, w, fill=255 ):
+  # Pad the frame to (h,w) from the bottom and right.
+  if( F.shape[0] == h and F.shape[1] == w ): return F
+  P = np.empty( (h, w, 3), np.uint8 ); P[:] = fill
+  P[:F.shape[0],:F.shape[1],:] = F
+  return P
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def stackFrames( Flist, axis=0 ):
+  '''
+  Concatenate RGB frames vertically (axis=0) or horizontally (axis=1).
+  Smaller frames are padded with white.
+  '''
+  if( axis == 0 ):
+    w = max( F.shape[1] for F in Flist )
+    Flist = [ padFrame( F, F.shape[0], w ) for F in Flist ]
+  else:
+    h = max( F.shape[0] for F in Flist )
+    Flist = [ padFrame( F, h, F.shape[1] ) for F in Flist ]
+  return np.concatenate( Flist, axis=axis )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def frameWorkerInit( initFunc, updateFunc, figsize, dpi ):
+  global gFig, gState, gUpdate
+  gUpdate = updateFunc
+  if( initFunc is None ):
+    gFig = None; gState = None
+  else:
+    gFig = aggFigure( figsize, dpi )
+    gState = initFunc( gFig )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def frameWorker( arg ):
+  if( gFig is None ):
+    return imageToRGB( gUpdate( arg ) )   # The update returns the image.
+  gUpdate( gFig, gState, arg )
+  return figureToRGB( gFig )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def renderFrames( initFunc, updateFunc, frameArgs, nWorkers=1, figsize=(9.,9.), dpi=100 ):
+  '''
+  Generator of RGB frames, in the order of frameArgs.
+  initFunc(fig) creates the artists once per process and returns a state
+  object; updateFunc(fig, state, arg) sets the artist data for one frame.
+  If initFunc is None, updateFunc(arg) returns the frame image directly.
+  With nWorkers > 1 the frames are rendered in a multiprocessing.Pool, so
+  both functions must be defined at module level.
+  '''
+  if( nWorkers > 1 ):
+    from multiprocessing import Pool
+    pool = Pool( nWorkers, frameWorkerInit, (initFunc, updateFunc, figsize, dpi) )
+    try:
+      for F in pool.imap( frameWorker, frameArgs, chunksize=4 ):
+        yield F
+    finally:
+      pool.terminate(); pool.join()
+  else:
+    frameWorkerInit( initFunc, updateFunc, figsize, dpi )
+    for arg in frameArgs:
+      yield frameWorker( arg )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def ffmpegCommand( fileAnim, w, h, fps ):
+  cmd = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',\
+    '-s', '{}x{}'.format(w, h), '-r', '{}'.format(fps), '-i', '-']
+  if( fileAnim.lower().endswith('.gif') ):
+    cmd += ['-filter_complex', '[0:v]split[a][b];[a]palettegen[p];[b][p]paletteuse']
+  else:
+    cmd += ['-pix_fmt', 'yuv420p']
+  return cmd + [fileAnim]
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def encodeFrames( frames, fileAnim, fps=10, framePrefix=None, keepFrames=False ):
+  '''
+  Encode the RGB frames (any iterable) into fileAnim. The frames are piped
+  to ffmpeg when it is available. Otherwise, or with keepFrames=True, they
+  are written as framePrefix_NNNN.png; in the fallback these are then
+  joined by ImageMagick convert. fileAnim=None only writes the png files.
+  '''
+  import matplotlib.image as mimg
+  if( framePrefix is None ): framePrefix = 'frame'
+  proc = None; pngOn = keepFrames or ( fileAnim is None )
+  h = w = None; n = 0
+
+  for F in frames:
+    if( h is None ):
+      # Even dimensions for the yuv420p encoders.
+      h = F.shape[0] + F.shape[0]%2; w = F.shape[1] + F.shape[1]%2
+      if( fileAnim is not None ):
+        try:
+          proc = sb.Popen( ffmpegCommand( fileAnim, w, h, fps ), stdin=sb.PIPE )
+        except OSError:
+          print(' ffmpeg not found. Writing png frames for convert.')
+          pngOn = True
+    if( proc is not None ):
+      proc.stdin.write( padFrame( F, h, w ).tostring() )
+    if( pngOn ):
+      mimg.imsave( '{}_{:04d}.png'.format(framePrefix, n), F )
+    n += 1
+
+  if( proc is not None ):
+    proc.stdin.close()
+    if( proc.wait() != 0 ):
+      sys.exit(' Error in encodeFrames: ffmpeg failed to write {}.'.format(fileAnim))
+  elif( fileAnim is not None and n > 0 ):
+    cmd = ['convert', '-delay', '{}'.format(int(round(100./fps)))]
+    cmd += [ '{}_{:04d}.png'.format(framePrefix, i) for i in xrange(n) ] + [fileAnim]
+    sb.call( cmd )
+
+  print(' {} frames processed.'.format(n))
+  if( fileAnim is not None and os.path.isfile( fileAnim ) ):
+    print(' {} written successfully.'.format(fileAnim))
+
+  return n
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
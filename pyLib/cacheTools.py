@@ -0,0 +1,155 @@
+import numpy as np
+import sys
+import os
+import hashlib
+from netcdfTools import netcdfDataset, timeBlocksFromDataset
+'''
+Description:
+Disk cache for quantities derived from NETCDF data, e.g. time means, the
+mean wind direction and the streamwise/spanwise velocity components.
+An entry is keyed on (file path, mtime, size, variable, coarsening level),
+so a modified file invalidates its entries. The least recently used
+entries are evicted when the cache exceeds its size limit.
+
+Environment variables:
+  P4UL_CACHE     cache directory (default ~/.p4ulCache)
+  P4UL_CACHE_MB  size limit in MB (default 4096). 0 disables the cache.
+
+
+Author: Mikko Auvinen
+        mikko.auvinen@helsinki.fi
+        University of Helsinki &
+        Finnish Meteorological Institute
+'''
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def cacheDirectory():
+  cdir = os.environ.get('P4UL_CACHE', os.path.join( os.path.expanduser('~'), '.p4ulCache' ))
+  if( not os.path.isdir( cdir ) ): os.makedirs( cdir )
+  return cdir
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def cacheLimit():
+  return int( float( os.environ.get('P4UL_CACHE_MB', 4096) )*2**20 )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def cacheKey( fname, kind, varStr, cl ):
+  st = os.stat( fname )
+  s = '{}|{}|{}|{}|{}|{}'.format( os.path.abspath(fname), st.st_mtime, st.st_size, kind, varStr, cl )
+  return hashlib.sha1( s.encode('utf-8') ).hexdigest()
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def evictCache( cdir, keep=None ):
+  '''
+  Remove the least recently used entries (oldest access stamp, see
+  cachedArray) until the cache fits into cacheLimit().
+  '''
+  entries = []
+  for f in os.listdir( cdir ):
+    if( not f.endswith('.npy') ): continue
+    fp = os.path.join( cdir, f )
+    st = os.stat( fp )
+    entries.append( (st.st_mtime, st.st_size, fp) )
+  total = sum( e[1] for e in entries )
+  for t, size, fp in sorted( entries ):
+    if( total <= cacheLimit() ): break
+    if( fp == keep ): continue
+    try:
+      os.remove( fp ); total -= size
+      print(' Cache entry {} evicted.'.format(os.path.basename(fp)))
+    except OSError:
+      pass
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def cachedArray( fname, kind, varStr, cl, computeFunc, mmap=False ):
+  '''
+  Return the cached array for (fname, kind, varStr, cl) or compute it with
+  computeFunc(). computeFunc may also write the entry itself: it is then
+  given the target path and must create it (used for large 4D fields).
+  mmap=True returns a copy-on-write memory map of the entry.
+  '''
+  if( cacheLimit() <= 0 ):
+    return computeFunc( None )
+
+  cdir = cacheDirectory()
+  cfile = os.path.join( cdir, cacheKey( fname, kind, varStr, cl )+'.npy' )
+  if( os.path.isfile( cfile ) ):
+    os.utime( cfile, None )  # The modification time is the LRU stamp.
+    print(' Using cached {}({}) of {}.'.format(kind, varStr, fname))
+  else:
+    tmp = cfile+'.tmp.npy'
+    A = computeFunc( tmp )
+    if( A is not None ): np.save( tmp, A )
+    os.rename( tmp, cfile )
+    evictCache( cdir, keep=cfile )
+
+  if( mmap ): return np.load( cfile, mmap_mode='c' )
+  return np.load( cfile )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def timeMeanField( fname, varStr, cl=1 ):
+  '''
+  Time mean of a 4D variable, computed over time blocks. Masked (NaN)
+  values are excluded, as in np.mean of a masked array.
+  '''
+  def compute( target ):
+    ds, varList, paramList = netcdfDataset( fname, False )
+    s = None; n = None
+    for t1, t2, X in timeBlocksFromDataset( varStr, ds, cl ):
+      idf = np.isfinite( X )
+      sb = np.where( idf, X, 0. ).sum( axis=0 ); nb = idf.sum( axis=0 )
+      if( s is None ): s = sb; n = nb
+      else:            s += sb; n += nb
+    ds.close()
+    return s/np.maximum( n, 1 )
+
+  return cachedArray( fname, 'mean', varStr, cl, compute )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def rotationAngleField( fname, cl=1, uStr='u', vStr='v' ):
+  # Mean wind direction a = arctan( vm/um ) of the horizontal components.
+  def compute( target ):
+    um = timeMeanField( fname, uStr, cl )
+    vm = timeMeanField( fname, vStr, cl )
+    return np.arctan( vm/(um+1.e-5) )
+
+  return cachedArray( fname, 'angle', uStr+vStr, cl, compute )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def rotatedVelocity( fname, comp='u1', cl=1, uStr='u', vStr='v' ):
+  '''
+  Streamwise (u1) or spanwise (u2) velocity component w.r.t. the mean wind
+  direction. The 4D field is written to the cache block by block and
+  returned as a copy-on-write memory map.
+  '''
+  a = rotationAngleField( fname, cl, uStr, vStr )
+  ca = np.cos(a); sa = np.sin(a); a = None
+
+  def compute( target ):
+    ds, varList, paramList = netcdfDataset( fname, False )
+    gv = timeBlocksFromDataset( vStr, ds, cl )
+    R = None
+    for t1, t2, u in timeBlocksFromDataset( uStr, ds, cl ):
+      t1, t2, v = next( gv )
+      if( R is None ):
+        shape = ( ds.variables[uStr].shape[0], ) + u.shape[1:]
+        if( target is None ): R = np.zeros( shape, np.float32 )
+        else:  R = np.lib.format.open_memmap( target, mode='w+', dtype=np.float32, shape=shape )
+      if( comp == 'u1' ): R[t1:t2] = u * ca + v * sa
+      else:               R[t1:t2] =-u * sa + v * ca
+    ds.close()
+    if( target is None ): return R
+    R.flush(); R = None
+    return None
+
+  return cachedArray( fname, comp, uStr+vStr, cl, compute, mmap=True )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
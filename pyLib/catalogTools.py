@@ -0,0 +1,197 @@
+import numpy as np
+import sys
+import os
+import glob
+import sqlite3
+'''
+Description:
+SQLite catalog of NETCDF files. Each file is scanned once and its
+variables (dimensions, shape, type, chunking, units), dimensions and 1D
+coordinate values are recorded. The catalog is refreshed incrementally:
+only new files or files whose mtime/size changed are rescanned. Queries
+select files by variable and coordinate ranges and return the matching
+index ranges without opening the NETCDF files.
+
+
+Author: Mikko Auvinen
+        mikko.auvinen@helsinki.fi
+        University of Helsinki &
+        Finnish Meteorological Institute
+'''
+
+catalogSchema = '''
+CREATE TABLE IF NOT EXISTS files (
+  id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime REAL, size INTEGER );
+CREATE TABLE IF NOT EXISTS variables (
+  file_id INTEGER, name TEXT, dims TEXT, shape TEXT, dtype TEXT,
+  chunks TEXT, units TEXT, nbytes INTEGER );
+CREATE TABLE IF NOT EXISTS coords (
+  file_id INTEGER, name TEXT, n INTEGER, vmin REAL, vmax REAL, vals BLOB );
+CREATE INDEX IF NOT EXISTS ivar ON variables( name );
+CREATE INDEX IF NOT EXISTS icoord ON coords( file_id, name );
+'''
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def openCatalog( dbfile ):
+  con = sqlite3.connect( dbfile )
+  con.executescript( catalogSchema )
+  return con
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def scanNetcdfFile( fname ):
+  '''
+  Contents of one NETCDF file: (fname, variable rows, coordinate rows).
+  Coordinates are the 1D variables named after a dimension; their values
+  are stored as float64 bytes. Runs in the worker processes.
+  '''
+  import netCDF4 as nc
+  try:
+    ds = nc.Dataset( fname )
+  except (IOError, RuntimeError):
+    print(' Cannot open {}. Skipping.'.format(fname))
+    return fname, None, None
+
+  vrows = []; crows = []
+  for name, v in ds.variables.items():
+    try:    ck = v.chunking()
+    except: ck = 'contiguous'
+    if( ck is None or ck == 'contiguous' ): ck = ''
+    else:                                   ck = ','.join( str(c) for c in ck )
+    units = getattr( v, 'units', '' )
+    vrows.append( ( str(name), ','.join( str(d) for d in v.dimensions ),\
+      ','.join( str(n) for n in v.shape ), str(v.dtype), ck, str(units),\
+      int( np.prod( v.shape ) )*v.dtype.itemsize ) )
+
+    if( v.ndim == 1 and v.dimensions[0] == name ):
+      c = np.ma.filled( v[:].astype(np.float64), np.nan )
+      if( c.size > 0 ):
+        crows.append( ( str(name), c.size, float(np.nanmin(c)), float(np.nanmax(c)), c.tostring() ) )
+      else:
+        crows.append( ( str(name), 0, None, None, c.tostring() ) )
+  ds.close()
+
+  return fname, vrows, crows
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def updateCatalog( dbfile, fileList, nWorkers=1, prune=False ):
+  '''
+  Add new and changed files of fileList to the catalog. The scans run in
+  a multiprocessing.Pool with nWorkers > 1; the database is written by
+  this process only. prune=True removes entries of files that no longer
+  exist. Returns the number of (re)scanned files.
+  '''
+  con = openCatalog( dbfile )
+  known = dict( (p, (m, s)) for p, m, s in con.execute('SELECT path, mtime, size FROM files') )
+
+  stale = []
+  for f in fileList:
+    p = os.path.abspath( f ); st = os.stat( p )
+    if( known.get( p ) != ( st.st_mtime, st.st_size ) ): stale.append( p )
+  print(' {} of {} files need scanning.'.format(len(stale), len(fileList)))
+
+  if( nWorkers > 1 and len(stale) > 1 ):
+    from multiprocessing import Pool
+    pool = Pool( nWorkers )
+    scans = pool.imap_unordered( scanNetcdfFile, stale )
+  else:
+    pool = None
+    scans = ( scanNetcdfFile( p ) for p in stale )
+
+  n = 0
+  for p, vrows, crows in scans:
+    removeFromCatalog( con, p )
+    if( vrows is None ): continue
+    st = os.stat( p )
+    fid = con.execute('INSERT INTO files (path, mtime, size) VALUES (?,?,?)',\
+      (p, st.st_mtime, st.st_size) ).lastrowid
+    con.executemany('INSERT INTO variables VALUES (?,?,?,?,?,?,?,?)', [ (fid,)+r for r in vrows ])
+    con.executemany('INSERT INTO coords VALUES (?,?,?,?,?,?)',\
+      [ (fid,)+r[:4]+(sqlite3.Binary(r[4]),) for r in crows ])
+    n += 1
+  if( pool is not None ):
+    pool.close(); pool.join()
+
+  if( prune ):
+    for p in list( known.keys() ):
+      if( not os.path.isfile( p ) ): removeFromCatalog( con, p )
+
+  con.commit(); con.close()
+  return n
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def removeFromCatalog( con, path ):
+  for (fid,) in con.execute('SELECT id FROM files WHERE path=?', (path,)).fetchall():
+    con.execute('DELETE FROM variables WHERE file_id=?', (fid,))
+    con.execute('DELETE FROM coords WHERE file_id=?', (fid,))
+    con.execute('DELETE FROM files WHERE id=?', (fid,))
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def coordIndexRange( c, cmin=None, cmax=None ):
+  # Index slice of the values of c within [cmin, cmax]. None = open end.
+  if( c.size > 1 and c[-1] < c[0] ):
+    s = coordIndexRange( c[::-1], cmin, cmax )
+    return slice( c.size-s.stop, c.size-s.start )
+  i1 = 0 if( cmin is None ) else np.searchsorted( c, cmin, side='left' )
+  i2 = c.size if( cmax is None ) else np.searchsorted( c, cmax, side='right' )
+  return slice( int(i1), int(max(i1, i2)) )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def queryCatalog( dbfile, varName=None, ranges=None, pathKey=None ):
+  '''
+  Files that contain varName and overlap all coordinate ranges, e.g.
+  ranges = {'zu_3d':(0., 100.), 'time':(3600., None)}. A range on a
+  coordinate that varName does not use is ignored for that file.
+  pathKey is a glob pattern on the file path.
+  Returns a list of (path, {dim: slice}) in path order.
+  '''
+  import fnmatch
+  if( ranges is None ): ranges = dict()
+  con = openCatalog( dbfile )
+  if( varName is None ):
+    rows = con.execute('SELECT id, path, NULL FROM files ORDER BY path').fetchall()
+  else:
+    rows = con.execute('SELECT f.id, f.path, v.dims FROM files f JOIN variables v '\
+      'ON v.file_id=f.id WHERE v.name=? ORDER BY f.path', (varName,)).fetchall()
+
+  res = []
+  for fid, path, dims in rows:
+    if( pathKey is not None and not fnmatch.fnmatch( path, os.path.abspath( pathKey ) ) ): continue
+    dims = dims.split(',') if( dims ) else None
+    ok = True; sl = dict()
+    for name, (cmin, cmax) in ranges.items():
+      if( dims is not None and name not in dims ): continue
+      r = con.execute('SELECT n, vmin, vmax, vals FROM coords WHERE file_id=? AND name=?',\
+        (fid, name)).fetchone()
+      if( r is None ): ok = False; break
+      n, vmin, vmax, vals = r
+      if( n == 0 or ( cmin is not None and vmax < cmin ) or ( cmax is not None and vmin > cmax ) ):
+        ok = False; break
+      sl[name] = coordIndexRange( np.frombuffer( vals, np.float64 ), cmin, cmax )
+      if( sl[name].stop == sl[name].start ): ok = False; break
+    if( ok ): res.append( (path, sl) )
+  con.close()
+
+  return res
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def filesFromCatalog( dbfile, searchStr, varName=None, ranges=None ):
+  '''
+  Catalog counterpart of utilities.filesFromList: the files matching
+  searchStr that contain varName within ranges, refreshed first.
+  Returns (fileNos, fileList); all matching files are selected.
+  '''
+  updateCatalog( dbfile, sorted( glob.glob( searchStr ) ) )
+  fileList = [ p for p, sl in queryCatalog( dbfile, varName, ranges, searchStr ) ]
+  for n, f in enumerate( fileList ):
+    print(" # ["+str(n)+"]: "+ str(f))
+
+  return range( len(fileList) ), fileList
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
@@ -0,0 +1,121 @@
+import numpy as np
+import sys
+import os
+import re
+from itertools import islice
+'''
+Description:
+Readers for OpenFOAM function object logs, e.g. postProcessing/forces.
+The parenthesized vector format '(a b c)' is parsed a chunk of lines at a
+time: parentheses are blanked in one regex pass and the chunk is tokenized
+with np.fromstring.
+
+
+Author: Mikko Auvinen
+        mikko.auvinen@helsinki.fi
+        University of Helsinki &
+        Finnish Meteorological Institute
+'''
+
+reParen = re.compile( r'[()]' )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def parseVectorLines( lines, ncols=None ):
+  '''
+  Parse data lines with parenthesized vectors into an (nrows, ncols) array.
+  Comment lines (#) are skipped. If ncols is None it is taken from the
+  first data line. Lines with a different number of values are dropped
+  (e.g. a truncated last line of a running case).
+  '''
+  txt = ''.join( lines )
+  if( '#' in txt ):
+    lines = [ l for l in lines if not l.lstrip().startswith('#') ]
+    txt = ''.join( lines )
+  txt = reParen.sub( ' ', txt )
+  lines = [ l for l in txt.splitlines() if l.strip() ]
+  if( len(lines) == 0 ): return np.zeros( (0, ncols or 0) )
+
+  if( ncols is None ): ncols = len( lines[0].split() )
+  v = np.fromstring( txt, sep=' ' )
+  if( v.size == ncols*len(lines) ):
+    return v.reshape( len(lines), ncols )
+
+  # Ragged chunk: keep the lines with ncols values.
+  rows = [ l for l in lines if len( l.split() ) == ncols ]
+  v = np.fromstring( ' '.join( rows ), sep=' ' )
+  return v.reshape( len(rows), ncols )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def readVectorLog( filename, chunkLines=2**17 ):
+  '''
+  Read a forces/moments type log file in chunks of chunkLines lines.
+  Returns an (nrows, ncols) array whose first column is time.
+  '''
+  blocks = []; ncols = None
+  fl = open( filename, 'r' )
+  while( True ):
+    lines = list( islice( fl, chunkLines ) )
+    if( len(lines) == 0 ): break
+    B = parseVectorLines( lines, ncols )
+    if( B.shape[0] > 0 ):
+      ncols = B.shape[1]; blocks.append( B )
+  fl.close()
+
+  if( len(blocks) == 0 ):
+    print(' No data found in {}.'.format(filename))
+    return np.zeros( (0, 0) )
+  print(' {} rows read from {}.'.format(sum( B.shape[0] for B in blocks ), filename))
+
+  return np.concatenate( blocks, axis=0 )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def readVectorLogs( fileList, chunkLines=2**17 ):
+  '''
+  Read and concatenate the logs of a restarted run, e.g.
+  postProcessing/forces/<startTime>/forces.dat. The files are ordered by
+  their first time. Where runs overlap, the later run supersedes the rows
+  from its start time onwards. Duplicate times are removed.
+  '''
+  runs = [ readVectorLog( f, chunkLines ) for f in fileList ]
+  runs = [ D for D in runs if D.shape[0] > 0 ]
+  if( len(runs) == 0 ): sys.exit(' Error in readVectorLogs: no data in {}.'.format(fileList))
+
+  ncols = runs[0].shape[1]
+  if( any( D.shape[1] != ncols for D in runs ) ):
+    sys.exit(' Error in readVectorLogs: the files have different numbers of columns.')
+
+  runs.sort( key=lambda D: D[0,0] )
+  for i in xrange( len(runs)-1 ):
+    runs[i] = runs[i][ runs[i][:,0] < runs[i+1][0,0] ]
+  D = np.concatenate( runs, axis=0 )
+
+  # Remaining duplicates (e.g. a repeated write at the same time): keep the last.
+  t = D[::-1,0]
+  tu, iu = np.unique( t, return_index=True )
+  if( len(tu) < len(t) ):
+    D = D[::-1][iu]
+
+  return D
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def forceMomentTotals( D ):
+  '''
+  Split a forces log array into time, total force and total moment.
+  The columns after time are forces then moments, each a set of 3-vectors
+  (pressure, viscous and, if present, porous) that are summed.
+  Returns t, F (3, n), M (3, n).
+  '''
+  nv = ( D.shape[1]-1 )//3   # Number of 3-vectors.
+  if( D.shape[1] != 3*nv+1 or nv%2 != 0 ):
+    sys.exit(' Error in forceMomentTotals: unexpected number of columns {}.'.format(D.shape[1]))
+  V = D[:,1:].reshape( D.shape[0], nv, 3 )
+  F = V[:,:nv//2,:].sum( axis=1 ).T
+  M = V[:,nv//2:,:].sum( axis=1 ).T
+
+  return D[:,0], F, M
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
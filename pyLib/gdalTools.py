@@ -150,6 +150,17 @@ def UtmReference( LocCode ):
 
 def extractSubTile( rBand, tileCode, XOrg, dPx):
   
+  Xtmp, nPxOffset, nPx = subTileWindow( tileCode, XOrg, dPx )
+  
+  Rb = readAsNumpyArray( rBand, nPxOffset, nPx)
+  Rdict = {'R' : Rb, 'GlobOrig' : Xtmp}
+  
+  return Rdict
+  
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def subTileWindow( tileCode, XOrg, dPx ):
+  
   Xtmp = XOrg.copy()    # Make a proper copy of the XOrg.
   nPx  = None # np.array([ rBand.YSize , rBand.XSize ], int)/dPx 
   nPxOffset = None
@@ -171,11 +182,79 @@ def extractSubTile( rBand, tileCode, XOrg, dPx):
     nPxOffset = np.abs( (Xtmp-XOrg)/dPx )
     print ' Number of Offset Pixels = {}'.format(nPxOffset)
   
-  Rb = readAsNumpyArray( rBand, nPxOffset, nPx)
-  Rdict = {'R' : Rb, 'GlobOrig' : Xtmp}
-  
-  return Rdict
-  
+  return Xtmp, nPxOffset, nPx
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def expandUtmTileCodes( tileCodes ):
+  '''
+  Expand the '*' wildcards into the sub-tile codes of the corresponding level.
+  For example: L4131* -> L4131A, ..., L4131H  and  L413* -> L4131, ..., L4134.
+  '''
+  codes = []
+  for tileCode in tileCodes:
+    tileCode = tileCode.upper()
+    if( '*' not in tileCode ):
+      codes.append( tileCode ); continue
+
+    i = tileCode.index('*')
+    level = i-1
+    if( level == 4 ): subCodes = ['A','B','C','D','E','F','G','H']
+    else:             subCodes = ['1','2','3','4']
+    codes.extend( expandUtmTileCodes( [ tileCode[:i]+c+tileCode[i+1:] for c in subCodes ] ) )
+
+  return codes
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def readSubTilesSweep( rBand, tileCodes, XOrg, dPx, nBlockRows=1 ):
+  '''
+  Extract several UTM sub-tiles in one sweep over the raster band.
+  The band is read in full-width strips of nBlockRows native blocks and
+  the strips are copied into the sub-tiles they overlap. Each sub-tile
+  is yielded as (tileCode, Rdict) as soon as its last row has been read.
+  '''
+  wins = []
+  for tileCode in tileCodes:
+    Xtmp, nPxOffset, nPx = subTileWindow( tileCode, XOrg, dPx )
+    i1 = int(nPxOffset[0]); j1 = int(nPxOffset[1])
+    i2 = i1 + int(nPx[0]);  j2 = j1 + int(nPx[1])
+    if( i2 > rBand.YSize or j2 > rBand.XSize ):
+      print ' Sub-tile {} extends beyond the raster. Exiting.'.format(tileCode)
+      sys.exit(1)
+    wins.append( [tileCode, Xtmp, i1, i2, j1, j2, None] )
+
+  if( len(wins) == 0 ): return
+
+  I1 = min([ w[2] for w in wins ]); I2 = max([ w[3] for w in wins ])
+  J1 = min([ w[4] for w in wins ]); J2 = max([ w[5] for w in wins ])
+
+  bx, by = rBand.GetBlockSize()   # Native block layout [x,y].
+  by = max( by, 1 )
+  dI = by*max( int(nBlockRows), 1 )
+  print ' Native block size = {}x{}, strip height = {} rows.'.format(by, bx, dI)
+
+  i = (I1//by)*by    # Start from a native block boundary.
+  while( i < I2 ):
+    ib = max( i, I1 ); ie = min( i+dI, I2 )
+    S = rBand.ReadAsArray( J1, ib, J2-J1, ie-ib )
+
+    done = []
+    for w in wins:
+      i1, i2, j1, j2 = w[2:6]
+      r1 = max(i1, ib); r2 = min(i2, ie)
+      if( r1 < r2 ):
+        if( w[6] is None ): w[6] = np.empty( (i2-i1, j2-j1), S.dtype )
+        w[6][r1-i1:r2-i1,:] = S[r1-ib:r2-ib, j1-J1:j2-J1]
+      if( i2 <= ie ): done.append(w)
+
+    S = None
+    for w in done:
+      wins.remove(w)
+      yield w[0], {'R' : w[6], 'GlobOrig' : w[1]}
+
+    i = ie
+
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
 
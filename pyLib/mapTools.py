@@ -116,21 +116,116 @@ def compileTileGrid( dictList, ijList, Mrows, Mcols, fileTypes ):
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
+def tileGridExtent( dictList, fileTypes ):
+  '''
+  Compute the extent of the tile mosaic from the tile headers only.
+  Returns the top left origin [N,E], the mosaic dimensions [rows,cols]
+  and the pixel offsets [row,col] of each tile's top left corner.
+  '''
+  ascii = fileTypes[0]; npz = fileTypes[1]
+
+  nr = np.array([ d['nrows'] for d in dictList ], int )
+  nc = np.array([ d['ncols'] for d in dictList ], int )
+  dPx = float( dictList[0]['cellsize'] )
+  if( ascii ):
+    xtl = np.array([ d['xllcorner'] for d in dictList ], float )
+    ytl = np.array([ d['yllcorner'] for d in dictList ], float ) + nr*dPx
+  else: # .npz
+    xtl = np.array([ d['xtlcorner'] for d in dictList ], float )
+    ytl = np.array([ d['ytlcorner'] for d in dictList ], float )
+
+  XO_TL = np.array([ np.max(ytl), np.min(xtl) ])
+
+  # Pixel offsets of the tiles. Rounding guards against float noise in the headers.
+  ioff = np.round( (XO_TL[0]-ytl)/dPx ).astype(int)
+  joff = np.round( (xtl-XO_TL[1])/dPx ).astype(int)
+  Mdims = np.array([ np.max(ioff+nr), np.max(joff+nc) ])
+
+  return XO_TL, Mdims, np.vstack((ioff, joff)).T
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def readTileData( d, fileTypes ):
+  ascii = fileTypes[0]
+  if( ascii ):
+    fname = d.get('filename', d['name']+'.asc')
+    r = readAsciiGrid( fname )
+  else:
+    fname = d.get('filename', d['name']+'.npz')
+    Rdict = readNumpyZTile( fname )
+    r = Rdict['R']; Rdict = None   # Throw the rest away.
+
+  return r
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def readTileWorker( args ):
+  k, d, fileTypes = args
+  return k, readTileData( d, fileTypes )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def assembleTileMosaic( dictList, fileTypes, nWorkers=1, memmapFile=None, fillValue=0 ):
+  '''
+  Assemble the tiles into a preallocated mosaic. The extent is computed
+  from the headers, and each tile is copied into place as soon as it has
+  been read. With nWorkers > 1 the tiles are decoded in parallel processes.
+  If memmapFile is given, the mosaic is a memory-mapped .npy file on disk.
+  '''
+  XO_TL, Mdims, IJ = tileGridExtent( dictList, fileTypes )
+  print(' Mosaic dimensions = {} [rows,cols] from {} tiles.'.format(Mdims, len(dictList)))
+
+  dtype = np.result_type( *[ d.get('dtype', float) for d in dictList ] )
+  if( memmapFile is not None ):
+    T = np.lib.format.open_memmap( memmapFile, mode='w+', dtype=dtype, shape=tuple(Mdims) )
+    print(' Mosaic memory-mapped to {}'.format(memmapFile))
+  else:
+    T = np.empty( tuple(Mdims), dtype )
+  T[:,:] = fillValue  # Gaps between tiles, if any.
+
+  tasks = [ (k, dictList[k], fileTypes) for k in xrange(len(dictList)) ]
+  if( nWorkers > 1 ):
+    from multiprocessing import Pool
+    pool = Pool( nWorkers )
+    tiles = pool.imap_unordered( readTileWorker, tasks )
+  else:
+    pool = None
+    tiles = ( readTileWorker(t) for t in tasks )
+
+  for k, r in tiles:
+    i1, j1 = IJ[k]
+    i2 = i1 + r.shape[0]; j2 = j1 + r.shape[1]
+    T[i1:i2, j1:j2] = r; r = None
+
+  if( pool is not None ):
+    pool.close(); pool.join()
+
+  if( memmapFile is not None ):
+    T.flush()
+
+  Rdict = {'R' : T}
+  return Rdict, XO_TL
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
 def readAsciiGridHeader( filename, idx=0 ):
-  fl = open( filename , 'r')
+  fl = open( filename , 'rb')
   name = filename.strip('.asc') # Extract the tile name.
   hdict = {'id':idx,'name': name, 'ncols':None,'nrows':None,\
             'xllcorner':None,'yllcorner':None,'cellsize':None,\
             'NODATA_value':None}
 
-  for i in xrange(len(hdict.keys())):
-    try:
-      s = fl.readline().split()
-      hdict[s[0]] = float( s[1] )
-    except:
-      print('Unexpected ascii grid header format. Exiting.')
-      sys.exit(1)
+  try:
+    hdict.update( readAsciiGridHeaderDict( fl ) )
+  except:
+    print('Unexpected ascii grid header format. Exiting.')
+    sys.exit(1)
+
+  if( None in [ hdict[k] for k in ['ncols','nrows','cellsize'] ] ):
+    print('Unexpected ascii grid header format. Exiting.')
+    sys.exit(1)
 
+  hdict['filename'] = filename
   idx += 1
   fl.close()
   return hdict, idx
@@ -158,20 +253,52 @@ def asciiTileToNumpyZ(filename):
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
 def readNumpyZGridData( filename, idx=0 ):
-  Rdict = readNumpyZTile(filename, dataOnly=True)
-  Rxdims=np.array(np.shape(Rdict['R']))
-  Rdict['R'] = []
+  Rdict, Rxdims, Rtype = readNumpyZTileHeader( filename )
   RxOrig=Rdict['GlobOrig']
   dPx=Rdict['dPx']
   name = filename.strip('.npz') # Extract the tile name.
   hdict = {'id':idx,'name': name, 'ncols':Rxdims[1],'nrows':Rxdims[0],\
            'xtlcorner':RxOrig[1],'ytlcorner':RxOrig[0],\
-           'cellsize':int(dPx[0]),'NODATA_value':None}
+           'cellsize':int(dPx[0]),'NODATA_value':None,\
+           'dtype':Rtype, 'filename':filename}
   idx += 1
   return hdict, idx
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
+def readNumpyZTileHeader( filename ):
+  '''
+  Read everything but the raster R from the .npz file. The shape and dtype
+  of R are obtained from the .npy header so the data is never decompressed.
+  '''
+  import zipfile
+  zf = zipfile.ZipFile( filename )
+  Rdict = dict()
+  Rdims = None; Rtype = None
+  for member in zf.namelist():
+    key = member.split('.npy')[0]
+    fx = zf.open( member )
+    if( key == 'R' ):
+      version = np.lib.format.read_magic( fx )
+      if( version == (1,0) ):
+        Rdims, fortran, Rtype = np.lib.format.read_array_header_1_0( fx )
+      else:
+        Rdims, fortran, Rtype = np.lib.format.read_array_header_2_0( fx )
+    else:
+      Rdict[key] = np.lib.format.read_array( fx )
+    fx.close()
+  zf.close()
+
+  # Backwards compatibility, see readNumpyZTile.
+  if ('XOrig' in Rdict and not('GlobOrig' in Rdict)):
+    Rdict['GlobOrig']=Rdict['XOrig'];
+  if ('dpx' in Rdict and not('dPx' in Rdict)):
+    Rdict['dPx']=Rdict['dpx']
+
+  return Rdict, np.array(Rdims), Rtype
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
 def resolutionFromDicts( dictList ):
   d1 = dictList[0]
   dPxRef = d1['cellsize']
@@ -186,9 +313,56 @@ def resolutionFromDicts( dictList ):
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
-def readAsciiGrid( filename ):
+def readAsciiGridHeaderDict( fl ):
+  '''
+  Read the 'keyword value' header lines of an ESRI ascii grid from the open
+  (binary mode) file fl and leave the file positioned at the first data line.
+  '''
+  canonical = {'ncols':'ncols','nrows':'nrows','xllcorner':'xllcorner',\
+    'yllcorner':'yllcorner','xllcenter':'xllcenter','yllcenter':'yllcenter',\
+    'cellsize':'cellsize','nodata_value':'NODATA_value'}
+  hdict = dict()
+  while( True ):
+    pos = fl.tell()
+    s = fl.readline().split()
+    if( len(s) == 2 and s[0][:1].isalpha() ):
+      key = str( s[0].decode('ascii') )
+      hdict[ canonical.get( key.lower(), key ) ] = float( s[1] )
+    else:
+      fl.seek( pos )
+      break
+
+  return hdict
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def readAsciiGrid( filename, chunkSize=2**26 ):
+  '''
+  Read the data of an ESRI ascii grid. The data is parsed in chunks of
+  chunkSize bytes straight into a preallocated array of the header's size.
+  '''
   try:
-    rx = np.loadtxt( filename, skiprows=6 ) # Note! skiprows=6.
+    fl = open( filename, 'rb' )
+    hdict = readAsciiGridHeaderDict( fl )
+    if( ('nrows' in hdict) and ('ncols' in hdict) ):
+      Nr = int(hdict['nrows']); Nc = int(hdict['ncols'])
+      rx = np.empty( Nr*Nc )
+      n = 0; rest = b''
+      while( True ):
+        chunk = fl.read( chunkSize )
+        data = rest + chunk
+        if( chunk ):
+          # Do not split a number between chunks.
+          k = max( data.rfind(b'\n'), data.rfind(b' ') ) + 1
+          data, rest = data[:k], data[k:]
+        v = np.fromstring( data, sep=' ' )
+        rx[n:n+len(v)] = v; n += len(v)
+        if( not chunk ): break
+      if( n != Nr*Nc ): raise ValueError
+      rx = rx.reshape( Nr, Nc )
+    else:
+      rx = np.loadtxt( fl )
+    fl.close()
     print(' File {} read successfully.'.format(filename))
   except:
     print(' Could not read ascii grid file: {}. Exiting.'.format(filename))
@@ -198,6 +372,48 @@ def readAsciiGrid( filename ):
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
+def formatRowBlock( args ):
+  B, fmt = args
+  line = ' '.join( [fmt]*B.shape[1] ) + '\n'
+  return (line*B.shape[0]) % tuple( B.ravel().tolist() )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def saveTileAsAscii( filename, R, round2Int=False, hdict=None, nWorkers=1, nBlockRows=None ):
+  '''
+  Write R as an ascii grid (PALM topography format, or ESRI if the header
+  dict hdict is given). The output equals np.savetxt(fmt='%g'). Rounded or
+  integer data takes the faster '%d' path. Blocks of rows are formatted in
+  nWorkers processes and written in order.
+  '''
+  from utilities import slabMap
+  Nr, Nc = R.shape
+  if( round2Int or np.issubdtype( R.dtype, np.integer ) ): fmt = '%d'
+  else:                                                     fmt = '%g'
+  if( nBlockRows is None ): nBlockRows = blockRowCount( Nc, 2**20 )
+
+  def blocks():
+    for i1 in xrange( 0, Nr, nBlockRows ):
+      B = R[i1:min(i1+nBlockRows, Nr),:]
+      if( round2Int ): B = np.round(B).astype(np.int64)
+      yield ( B, fmt )
+
+  fx = open( filename, 'w' )
+  if( hdict is not None ):
+    for key in ['ncols','nrows']:
+      if( hdict.get(key) is not None ): fx.write('{} {:d}\n'.format(key, int(hdict[key])))
+    # Full precision: e.g. UTM corners need more than 6 digits.
+    for key in ['xllcorner','yllcorner','cellsize','NODATA_value']:
+      if( hdict.get(key) is not None ): fx.write('{} {}\n'.format(key, repr(float(hdict[key]))))
+
+  for s in slabMap( formatRowBlock, blocks(), nWorkers, 2*max(nWorkers,1) ):
+    fx.write( s )
+
+  fx.close()
+  print(' {} written successfully.'.format(filename))
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
 def saveTileAsNumpyZ( filename, Rdict):
   '''
   The saved npz file doesn't contain Rdict, but separate numpy arrays matching key names.
@@ -288,6 +504,233 @@ def rotatePoint(pivot, point, angle):
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
+def rotateBlockAroundPivot( xc, yc, xp, yp, ct, st ):
+  '''
+  Rotate the grid spanned by the 1D coordinates xc (columns) and yc (rows)
+  around the pivot (xp,yp). ct, st = cos(theta), sin(theta).
+  Same as rotateGridAroundPivot but the meshes are formed by broadcasting.
+  '''
+  dX = np.asarray(xc)[np.newaxis,:] - xp
+  dY = np.asarray(yc)[:,np.newaxis] - yp
+  XR = xp + dX*ct - dY*st  # E-X
+  YR = yp + dX*st + dY*ct  # N-Y
+
+  return XR, YR
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def sampleRasterAt( R, ROrig, dPx, XR, YR, method='nearest' ):
+  '''
+  Sample raster R (top left origin ROrig [N,E], pixel size dPx) at the
+  coordinates XR, YR. Points outside the raster take the edge values.
+  Returns the samples and whether any point fell outside the raster.
+  '''
+  Rdims = R.shape
+  fi = (ROrig[0]-YR)/dPx
+  fj = (XR-ROrig[1])/dPx
+  oob = ( np.min(fi) < 0. or np.min(fj) < 0. or \
+    np.max(fi) >= Rdims[0] or np.max(fj) >= Rdims[1] )
+
+  if( method == 'bilinear' ):
+    fi -= 0.5; fj -= 0.5   # Pixel centers.
+    i0 = np.floor(fi).astype(int); wi = fi - i0
+    j0 = np.floor(fj).astype(int); wj = fj - j0
+    i1 = np.clip( i0+1, 0, Rdims[0]-1 ); i0 = np.clip( i0, 0, Rdims[0]-1 )
+    j1 = np.clip( j0+1, 0, Rdims[1]-1 ); j0 = np.clip( j0, 0, Rdims[1]-1 )
+    v = (1.-wi)*( (1.-wj)*R[i0,j0] + wj*R[i0,j1] ) \
+      +     wi *( (1.-wj)*R[i1,j0] + wj*R[i1,j1] )
+  else:
+    I = np.clip( fi.astype(int), 0, Rdims[0]-1 )
+    J = np.clip( fj.astype(int), 0, Rdims[1]-1 )
+    v = R[I,J]
+
+  return v, oob
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def resampleRotatedGrid( R, ROrig, dPx, XT, YT, pXY, theta, dxG=None,\
+  method='nearest', nBlockRows=256, deg=True ):
+  '''
+  Sample the raster R onto the grid of cell centers XT (x) and YT (y) rotated
+  counterclockwise by theta around the pivot pXY = [pX, pY]. The rotated
+  coordinates are computed for nBlockRows grid rows at a time.
+  Methods: 'nearest', 'bilinear' and 'max', which takes the maximum over the
+  source pixels covered by each grid cell (cell size dxG) when coarsening.
+  The result is returned in raster format, i.e. the first row is the top.
+  '''
+  if( method not in ['nearest','bilinear','max'] ):
+    sys.exit(' Error in resampleRotatedGrid: unknown method {}. Exiting ...'.format(method))
+
+  if( deg ):
+    theta = theta * (np.pi/180.)
+  ct = np.cos(theta); st = np.sin(theta)
+
+  # Sub-cell sample offsets for max-pooling. One sample per source pixel (at least).
+  if( method == 'max' ):
+    nsub = np.maximum( np.ceil( np.abs(np.array(dxG, float))/dPx ).astype(int), 1 )
+    ox = ((np.arange(nsub[0])+0.5)/nsub[0] - 0.5)*dxG[0]
+    oy = ((np.arange(nsub[1])+0.5)/nsub[1] - 0.5)*dxG[1]
+    print(' Max-pooling over {}x{} samples per grid cell.'.format(nsub[0],nsub[1]))
+  else:
+    ox = np.zeros(1); oy = np.zeros(1)
+
+  Ny = len(YT); Nx = len(XT)
+  PR = np.zeros( (Ny, Nx), float )
+  outOfBounds = False
+  nBlockRows = max( int(nBlockRows), 1 )
+
+  for i1 in xrange( 0, Ny, nBlockRows ):
+    i2 = min( i1+nBlockRows, Ny )
+    Pb = None
+    for dy in oy:
+      for dx in ox:
+        XR, YR = rotateBlockAroundPivot( XT+dx, YT[i1:i2]+dy, pXY[0], pXY[1], ct, st )
+        v, oob = sampleRasterAt( R, ROrig, dPx, XR, YR, method )
+        outOfBounds = outOfBounds or oob
+        if( Pb is None ): Pb = v
+        else:             Pb = np.maximum( Pb, v )
+    XR = None; YR = None
+
+    # The row order must be reversed to go back to raster format.
+    PR[Ny-i2:Ny-i1,:] = Pb[::-1,:]
+
+  if( outOfBounds ):
+    # Warn the user about streching edges.
+    print("WARNING: Domain out of raster data bounds! Streching edge cells to fill the domain.")
+
+  return PR
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def extractRotatedDomain( Rdict, iPv, NxG, dxG, rLx, theta, method='nearest',\
+  nBlockRows=256, verbose=False ):
+  '''
+  Extract a (rotated) PALM domain of NxG=[Nx,Ny] points with resolution
+  dxG=[dx,dy] from the raster Rdict (see readNumpyZTileForMesh). The pixel
+  iPv=[N,E] of the raster is the pivot, located at the ratio rLx=[rLx,rLy]
+  of the domain (top left origo). Several domains can be extracted from
+  the same Rdict without re-reading the raster.
+  Returns the raster dict of the domain and the grid coordinates.
+  '''
+  R  = Rdict['R']
+  rY = Rdict['rowCoords']; cX = Rdict['colCoords']
+  ROrig = Rdict['GlobOrig']
+  dPx = entry2Int( Rdict['dPx'] )
+  try:    gridRot = Rdict['gridRot']
+  except: gridRot = 0.
+
+  # Pivot coordinates in the local coord. system
+  pY = rY[iPv[0]]; pX = cX[iPv[1]]
+
+  # Cell centers of the Palm grid and the location of its pivot.
+  XgridCoords = np.linspace( 0., (NxG[0]-1)*dxG[0], NxG[0] )
+  YgridCoords = np.linspace( 0., (NxG[1]-1)*dxG[1], NxG[1] )
+  iPGx = np.maximum(int(    rLx[0] *(NxG[0]-1) ), 0)
+  iPGy = np.maximum(int((1.-rLx[1])*(NxG[1]  ) ), 0)
+  iPGy = np.minimum( iPGy , (NxG[1]-1) )
+
+  # From palm coordinates to underlying local topography coordinates.
+  XT = XgridCoords + (pX - XgridCoords[iPGx])
+  YT = YgridCoords + (pY - YgridCoords[iPGy])
+  if( verbose ):
+    print( ' Palm grid pivot indices: iPGx = {}, iPGy = {}'.format( iPGx, iPGy ))
+    print(' Transformed coords: XT = {}...{}, YT = {}...{}'\
+      .format(XT[0], XT[-1], YT[0], YT[-1]))
+
+  PR = resampleRotatedGrid( R, ROrig, dPx, XT, YT, [pX, pY], theta, dxG,\
+    method, nBlockRows )
+
+  # Top left origo in the global coordinate system: first rotate around the pivot,
+  # then around the input raster's top left origin.
+  theta2 = gridRot/(np.pi/180.)
+  PTL = rotatePoint( [pY, pX], [YT[-1], XT[0]], theta*(np.pi/180.) )
+  PROrig = rotatePoint( ROrig, PTL, gridRot )
+  print(' Top left origo coords. (cell centers!): [N,E] = {}'.format(PROrig))
+
+  # Retain unused keys from original raster
+  PRdict = Rdict.copy()
+  PRdict['R'] = PR
+  PRdict['GlobOrig'] = PROrig
+  PRdict['gridRot'] = (theta+theta2)*(np.pi/180.)
+  PRdict['dPx'] = np.array([dxG[0],dxG[1]])
+
+  return PRdict, XT, YT, [pX, pY]
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def blockRowCount( nPxRow, nPxMax=2**22 ):
+  # Number of rows processed at a time such that a block holds about nPxMax pixels.
+  return max( int(nPxMax//max(nPxRow,1)), 1 )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def modeAlongLastAxis( X ):
+  '''
+  Most frequent value along the last axis of X. The smallest value wins ties.
+  The values are sorted and the longest run of equal values is picked.
+  '''
+  S = np.sort( X, axis=-1 )
+  k = S.shape[-1]
+  S = S.reshape(-1, k)
+  idx = np.arange(k)
+  newRun = np.ones( S.shape, bool )
+  newRun[:,1:] = ( S[:,1:] != S[:,:-1] )
+  runStart = np.maximum.accumulate( np.where( newRun, idx, 0 ), axis=-1 )
+  imax = np.argmax( idx - runStart, axis=-1 )  # End of the (first) longest run.
+
+  return S[ np.arange(S.shape[0]), imax ].reshape( X.shape[:-1] )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def coarsenRaster( R, n, method='mean', nBlockRows=None ):
+  '''
+  Coarsen the raster R by the integer factor n using reductions over the
+  n x n pixel blocks. Methods: mean, max, min and mode (for land use classes).
+  Incomplete blocks at the bottom and right edges are discarded.
+  The work is done nBlockRows output rows at a time.
+  '''
+  n = int(n)
+  Nr = R.shape[0]//n; Nc = R.shape[1]//n
+  if( method == 'mean' ): R2 = np.empty( (Nr,Nc), float )
+  else:                   R2 = np.empty( (Nr,Nc), R.dtype )
+  if( nBlockRows is None ): nBlockRows = blockRowCount( n*n*Nc )
+
+  for i1 in xrange( 0, Nr, nBlockRows ):
+    i2 = min( i1+nBlockRows, Nr )
+    B = R[i1*n:i2*n, :Nc*n].reshape( i2-i1, n, Nc, n )
+    if  ( method == 'mean' ): R2[i1:i2,:] = B.mean( axis=(1,3) )
+    elif( method == 'max'  ): R2[i1:i2,:] = B.max( axis=(1,3) )
+    elif( method == 'min'  ): R2[i1:i2,:] = B.min( axis=(1,3) )
+    elif( method == 'mode' ):
+      B = B.transpose(0,2,1,3).reshape( i2-i1, Nc, n*n )
+      R2[i1:i2,:] = modeAlongLastAxis( B )
+    else:
+      sys.exit(' Error in coarsenRaster: unknown method {}. Exiting ...'.format(method))
+    B = None
+
+  return R2
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def refineRaster( R, n, nBlockRows=None ):
+  '''
+  Refine the raster R by the integer factor n: each pixel is copied to n x n pixels.
+  The input rows are broadcast straight into a view of the output array.
+  '''
+  n = int(n)
+  Nr, Nc = R.shape
+  R2 = np.empty( (Nr*n, Nc*n), R.dtype )
+  if( nBlockRows is None ): nBlockRows = blockRowCount( n*n*Nc )
+
+  for i1 in xrange( 0, Nr, nBlockRows ):
+    i2 = min( i1+nBlockRows, Nr )
+    V = R2[i1*n:i2*n,:].reshape( i2-i1, n, Nc, n )
+    V[...] = R[i1:i2, np.newaxis, :, np.newaxis]
+
+  return R2
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
 def entry2Int( ax ):
   try:
     ax = np.mean(np.abs(ax))
@@ -384,25 +827,32 @@ def applyMargins( Rx, Mw, Mr, Mh ):
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
-def applyRamp( Rz, L1, L2, LeftRight, End, Mh=None ):
+def applyRamp( Rz, L1, L2, LeftRight, End, Mh=None, nBlockRows=None ):
+  '''
+  Blend the strip L1:L2 (columns if LeftRight, else rows) of Rz towards
+  the margin value with a sinusoidal ramp. The 2D weights are formed by
+  broadcasting the 1D ramp and the strip is updated in place, nBlockRows
+  rows at a time, so Rz may also be a memory-mapped array.
+  '''
   dL = (L2-L1)
   w = np.arange( L1, L2 ).astype(float)
   w -= np.min(w); w /= np.max(w)
   w *= np.pi    ; w -= (np.pi/2.)
   w = np.sin(w)/2. + 0.5
 
+  # The margin values are copied because the strip is modified in place.
   if  ( LeftRight and not End ):      # Left
-    if( Mh is None ): Rm = Rz[:,L1]
+    if( Mh is None ): Rm = Rz[:,L1].copy()
     else:             Rm = Mh[0]
     #
   elif( LeftRight and End ):          # Right
-    if( Mh is None ): Rm = Rz[:,L2]
+    if( Mh is None ): Rm = Rz[:,L2].copy()
     else:             Rm = Mh[1]
   elif( not LeftRight and End ):      # Bottom
-    if( Mh is None ): Rm = Rz[L2,:]
+    if( Mh is None ): Rm = Rz[L2,:].copy()
     else:             Rm = Mh[2]
   else:                               # Top
-    if( Mh is None ): Rm = Rz[L1,:]
+    if( Mh is None ): Rm = Rz[L1,:].copy()
     else:             Rm = Mh[3]
 
 
@@ -410,18 +860,29 @@ def applyRamp( Rz, L1, L2, LeftRight, End, Mh=None ):
   if( End ):
     w = (1.-w)
   #print ' w = {}, len(w) = {}, len(dL) = {}'.format(w,len(w),dL)
+  Rm = np.asarray( Rm, float )
   if( LeftRight ):
-    for i in xrange(dL):
-      Rz[:,L1+i] = w[i]*Rz[:,L1+i] + (1.-w[i])*Rm
+    r1 = 0; r2 = Rz.shape[0]; c1 = L1; c2 = L2
+    W = w[np.newaxis,:]
   else: # TopBottom
-    for i in xrange(dL):
-      Rz[L1+i,:] = w[i]*Rz[L1+i,:] + (1.-w[i])*Rm
+    r1 = L1; r2 = L2; c1 = 0; c2 = Rz.shape[1]
+    W = w[:,np.newaxis]
+
+  if( nBlockRows is None ): nBlockRows = blockRowCount( c2-c1 )
+  for i1 in xrange( r1, r2, nBlockRows ):
+    i2 = min( i1+nBlockRows, r2 )
+    if  ( Rm.ndim == 0 ): Rmb = Rm
+    elif( LeftRight ):    Rmb = Rm[i1:i2,np.newaxis]
+    else:                 Rmb = Rm[np.newaxis,:]
+    if( not LeftRight ):  Wb = W[i1-r1:i2-r1,:]
+    else:                 Wb = W
+    Rz[i1:i2, c1:c2] = Wb*Rz[i1:i2, c1:c2] + (1.-Wb)*Rmb
 
   return Rz
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
-def filterAndScale(Rxo, Rx, filterInfo, sx=1.0, ix=None, jx=None):
+def filterAndScale(Rxo, Rx, filterInfo, sx=1.0, ix=None, jx=None, nWorkers=1, tileSize=None):
 
   # Check if the indecies are explicitly given.
   inxOn = True
@@ -429,18 +890,10 @@ def filterAndScale(Rxo, Rx, filterInfo, sx=1.0, ix=None, jx=None):
     inxOn = False
 
   if( filterInfo.count(None) == 0):
-    if( 'user' in filterInfo[0] ):
-      nI = int(filterInfo[1])
-      for i in xrange(nI):
-        ftmp = raw_input(' Enter <method>, <num> = ').split(',')
-        if( i == 0 and inxOn ):  Rxf = applyFilter(Rx[ix,jx], ftmp)
-        else:                    Rxf = applyFilter(Rx, ftmp)
-        Rx = Rxf.copy()
-      Rx = None
-    else:
-      if( inxOn ): Rxf = applyFilter(Rx[ix,jx], filterInfo)
-      else:        Rxf = applyFilter(Rx, filterInfo)
-      Rx = None
+    fChain = filterChain( filterInfo )
+    if( inxOn ): Rxf = applyFilterChain(Rx[ix,jx], fChain, nWorkers, tileSize)
+    else:        Rxf = applyFilterChain(Rx, fChain, nWorkers, tileSize)
+    Rx = None
 
     Rxo += sx*Rxf
 
@@ -454,9 +907,41 @@ def filterAndScale(Rxo, Rx, filterInfo, sx=1.0, ix=None, jx=None):
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
-def applyFilter(Rx, filterInfo ):
-  import scipy.ndimage as sn # contains the filters
+def filterChain( filterInfo ):
+  '''
+  List of [<method>, <num>] filters to be applied consecutively.
+  'user, num' asks for <num> filters interactively, whereas
+  'chain, median:5,gauss:2' gives the whole pipeline non-interactively.
+  '''
+  fChain = list()
+  if( 'user' in filterInfo[0] ):
+    nI = int(filterInfo[1])
+    for i in xrange(nI):
+      fChain.append( raw_input(' Enter <method>, <num> = ').split(',') )
+  elif( 'chain' in filterInfo[0] ):
+    for fstr in filterInfo[1].split(','):
+      fChain.append( fstr.split(':') )
+  else:
+    fChain.append( filterInfo )
+
+  return fChain
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def applyFilterChain( Rx, fChain, nWorkers=1, tileSize=None, Rout=None ):
+  if( nWorkers <= 1 and tileSize is None ):
+    for ftmp in fChain:
+      Rx = applyFilter(Rx, ftmp)
+    if( Rout is not None ):
+      Rout[:,:] = Rx; Rx = Rout
+    return Rx
+
+  if( tileSize is None ): tileSize = 1024
+  return applyFilterTiled( Rx, fChain, nWorkers, tileSize, Rout )
 
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def filterSpec( filterInfo ):
   if( 'gauss' in filterInfo[0] ):
     try:
       Nf = float(filterInfo[1])
@@ -470,35 +955,102 @@ def applyFilter(Rx, filterInfo ):
       print(' Failed to obtain <size> for the filters. Exiting.')
       sys.exit(1)
 
-  if( 'median' in filterInfo[0] ):
-    print(' Median {0}x{0} filter applied. '.format(Nf))
+  return filterInfo[0], Nf
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def filterHalo( filterInfo ):
+  # Reach of the filter footprint in pixels.
+  fname, Nf = filterSpec( filterInfo )
+  if( 'gauss' in fname ):
+    return int( 4.*Nf + 0.5 ) + 1  # scipy truncates the kernel at 4 sigma.
+  elif( any( f in fname for f in ['median','perc','rank','local','max'] ) ):
+    return int(Nf)//2 + 1
+  else:
+    return 0
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def applyFilter(Rx, filterInfo, verbose=True ):
+  import scipy.ndimage as sn # contains the filters
+
+  fname, Nf = filterSpec( filterInfo )
+
+  if( 'median' in fname ):
+    if( verbose ): print(' Median {0}x{0} filter applied. '.format(Nf))
     Rf = sn.median_filter(Rx, size=Nf)
-  elif( 'perc' in filterInfo[0] ):
-    print(' Percentile 60 {0}x{0} filter applied. '.format(Nf))
+  elif( 'perc' in fname ):
+    if( verbose ): print(' Percentile 60 {0}x{0} filter applied. '.format(Nf))
     Rf = sn.percentile_filter(Rx, 60, size=Nf)
-  elif( 'rank' in filterInfo[0] ):
-    print(' Rank 5 {0}x{0} filter applied. '.format(Nf))
+  elif( 'rank' in fname ):
+    if( verbose ): print(' Rank 5 {0}x{0} filter applied. '.format(Nf))
     Rf = sn.rank_filter(Rx, 5, size=Nf)
-  elif( 'gauss' in filterInfo[0] ):
-    print(' Gaussian sigma={} filter applied. '.format(Nf))
+  elif( 'gauss' in fname ):
+    if( verbose ): print(' Gaussian sigma={} filter applied. '.format(Nf))
     Rf = sn.gaussian_filter(Rx, sigma=Nf)
-  elif( 'local' in filterInfo[0] ):
-    print(' Local mean {0}x{0} filter applied. '.format(Nf))
+  elif( 'local' in fname ):
+    if( verbose ): print(' Local mean {0}x{0} filter applied. '.format(Nf))
     Rf = sn.uniform_filter(Rx, size=Nf)
-  elif( 'max' in filterInfo[0] ):
-    print('Max {0}x{0} filter applied. '.format(Nf))
+  elif( 'max' in fname ):
+    if( verbose ): print('Max {0}x{0} filter applied. '.format(Nf))
     Rf = sn.maximum_filter(Rx, size=Nf)
   else:
-    print(' No filter applied. ')
+    if( verbose ): print(' No filter applied. ')
     Rf = Rx
 
   return Rf
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
+def filterTileWorker( args ):
+  Rb, fChain, ib, jb = args
+  for ftmp in fChain:
+    Rb = applyFilter( Rb, ftmp, verbose=False )
+  return ib, jb, Rb
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def applyFilterTiled( Rx, fChain, nWorkers=1, tileSize=1024, Rout=None ):
+  '''
+  Apply the filter chain fChain in tiles of tileSize x tileSize pixels.
+  Each tile is read with a halo wide enough for the whole chain, so the
+  stitched result equals filtering the entire raster at once. The tiles
+  are filtered in nWorkers processes. Rx and Rout (the output, allocated
+  if None) may be memory-mapped arrays; only a few tiles are in memory
+  at a time.
+  '''
+  from utilities import slabMap
+  Nr, Nc = Rx.shape
+  h = sum([ filterHalo(ftmp) for ftmp in fChain ])
+  for ftmp in fChain:
+    fname, Nf = filterSpec( ftmp )
+    print(' {} {} filter applied in {}x{} tiles (halo {}).'.format(fname, Nf, tileSize, tileSize, h))
+
+  if( Rout is None ):
+    Rout = np.empty( (Nr, Nc), Rx.dtype )
+
+  def tiles():
+    for i1 in xrange( 0, Nr, tileSize ):
+      for j1 in xrange( 0, Nc, tileSize ):
+        i2 = min(i1+tileSize, Nr); j2 = min(j1+tileSize, Nc)
+        a1 = max(i1-h, 0); a2 = min(i2+h, Nr)
+        b1 = max(j1-h, 0); b2 = min(j2+h, Nc)
+        # Tile location in the output and the interior of the padded block.
+        ib = (i1, i2, i1-a1, i2-a1); jb = (j1, j2, j1-b1, j2-b1)
+        yield ( np.array( Rx[a1:a2, b1:b2] ), fChain, ib, jb )
+
+  # Feed the pool in batches so that only a few tiles are in memory.
+  for ib, jb, Rb in slabMap( filterTileWorker, tiles(), nWorkers, 2*max(nWorkers,1), ordered=False ):
+    Rout[ib[0]:ib[1], jb[0]:jb[1]] = Rb[ib[2]:ib[3], jb[2]:jb[3]]
+
+  return Rout
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
 def labelRaster(R, maskId=None):
   import scipy.ndimage.measurements as snms
-  Rm = np.zeros( R.shape, type(R[0,0]) )
+  from objectTools import maskIndex
+  idx = np.zeros( R.shape , bool )
   if( maskId is not None ):
     mIds = list()
     if(   isinstance( maskId, list) ):
@@ -508,15 +1060,12 @@ def labelRaster(R, maskId=None):
     else:
       sys.exit(' Error in labelRaster: maskId is not a list or int. It is {}'.format(type(maskId)))
     
-    idx = np.zeros( R.shape , bool )
-    for im in mIds:
-      idx = np.maximum( idx , (R == im ) )
-      
-    Rm[idx] = R[idx]   # Set desired mask values 
+    # Desired nonzero mask values in one pass over the raster.
+    idx = ( maskIndex( R, mIds ) >= 0 ) & ( R != 0 )
 
 
-  Rl, shapeCount = snms.label(Rm) # this might be slow for unfiltered data
-  Rm = None
+  Rl, shapeCount = snms.label(idx)
+  idx = None
   print(' Found {} shapes from the data.'.format(shapeCount))
 
   return Rl, shapeCount
@@ -593,49 +1142,104 @@ def totalArea( Rdims, dx ):
 
 def frontalAreas( Ri, hclip=1. ):
   # Calculate frontal areas of the domain
-  Ae = 0.
-  for i in xrange( Ri.shape[0] ):
-    ce = (Ri[i,1:] > Ri[i,:-1]).astype(float)
-    he = (Ri[i,1:]-Ri[i,:-1]); he[(he<hclip)] = 0. # Height, clip out non-buildings
-    Ae += np.sum( ce * he )
-
-  An = 0.
-  for j in xrange( Ri.shape[1] ):
-    cn = (Ri[1:,j] > Ri[:-1,j]).astype(float)
-    hn = (Ri[1:,j]-Ri[:-1,j]); hn[(hn<hclip)] = 0.
-    An += np.sum( cn* hn )
+  S = frontalAreaSums( Ri, hclip )
+  Ae = S[0]; An = S[2]
 
   return Ae, An
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
+def frontalAreaSums( Ri, hclip=1. ):
+  '''
+  Sums of the wall heights facing the four grid directions [+x, -x, +y, -y]
+  (y = row index), from the height steps between neighbouring pixels.
+  The +x walls are hit by a wind blowing towards +x etc. Steps below hclip
+  (non-buildings) are clipped out.
+  '''
+  S = np.zeros(4)
+  for k, axis in [ (0, 1), (2, 0) ]:
+    d = np.diff( Ri, axis=axis )
+    S[k]   =  np.sum( d[ d >=  hclip ] )
+    S[k+1] = -np.sum( d[ d <= -hclip ] )
+    d = None
+
+  return S
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def sectorFrontalAreas( S, windDirs ):
+  '''
+  Frontal areas for the wind directions windDirs (deg, offset from the x-axis)
+  from the directional wall sums S = [+x, -x, +y, -y] (see frontalAreaSums).
+  S may carry trailing (grid) dimensions. Returns an array of shape (nDirs,...).
+  '''
+  S  = np.asarray( S, float )
+  th = np.deg2rad( np.atleast_1d( np.asarray( windDirs, float ) ) )
+  th = th.reshape( (-1,) + (1,)*(S.ndim-1) )
+  c = np.cos(th); s = np.sin(th)
+  A = np.where( c >= 0., c*S[0], -c*S[1] ) + np.where( s >= 0., s*S[2], -s*S[3] )
+
+  return A
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def morphometricGridStats( Ri, W, hthr=2., hclip=1. ):
+  '''
+  Morphometric statistics of the raster Ri over grid cells of WxW pixels,
+  processed one row of cells at a time. Heights above hthr count as
+  roughness elements. Returns a dict of (nr, nc) arrays: 'Npx' (element
+  pixel count), 'h_sum', 'h2_sum', 'h_max' and 'S' (4, nr, nc) directional
+  wall sums. Incomplete cells at the bottom and right edges are discarded.
+  '''
+  W = int(W)
+  nr = Ri.shape[0]//W; nc = Ri.shape[1]//W
+  gdict = dict()
+  for key in ['Npx','h_sum','h2_sum','h_max']:
+    gdict[key] = np.zeros( (nr, nc) )
+  gdict['S'] = np.zeros( (4, nr, nc) )
+
+  for i in xrange( nr ):
+    i1 = i*W; i2 = i1+W
+    B = Ri[i1:i2, :nc*W].astype(float)
+    Bm = np.where( B > hthr, B, 0. )
+    gdict['Npx'][i,:]    = (B > hthr).reshape(W, nc, W).sum( axis=(0,2) )
+    gdict['h_sum'][i,:]  = Bm.reshape(W, nc, W).sum( axis=(0,2) )
+    gdict['h2_sum'][i,:] = (Bm**2).reshape(W, nc, W).sum( axis=(0,2) )
+    gdict['h_max'][i,:]  = B.reshape(W, nc, W).max( axis=(0,2) )
+
+    # Walls are assigned to the pixel on the +x (+y) side of the step.
+    # The step from the row above the band belongs to the band.
+    dx = np.zeros( B.shape ); dx[:,1:] = np.diff( B, axis=1 )
+    dy = np.zeros( B.shape ); dy[1:,:] = np.diff( B, axis=0 )
+    if( i1 > 0 ): dy[0,:] = B[0,:] - Ri[i1-1, :nc*W]
+    for k, d in [ (0, dx), (2, dy) ]:
+      gdict['S'][k,i,:]   = np.where( d >=  hclip,  d, 0. ).reshape(W, nc, W).sum( axis=(0,2) )
+      gdict['S'][k+1,i,:] = np.where( d <= -hclip, -d, 0. ).reshape(W, nc, W).sum( axis=(0,2) )
+    B = Bm = dx = dy = None
+
+  return gdict
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
 def maskMeanValues(Rm, Ri, mlist):
-  dims = np.shape(mlist)
-
-  m_mean = np.zeros(dims)
-  m_var  = np.zeros(dims)
-  m_std  = np.zeros(dims)
-  j = 0
-  for im in mlist:
-    idm = (Rm == im)
-    m_mean[j] = np.mean( Ri[idm] )
-    m_var[j]  = np.var( Ri[idm] )
-    m_std[j]  = np.std( Ri[idm] )
+  from objectTools import maskIndex, objectMoments
+  # Mask positions in mlist act as object labels: 0 = not in mlist.
+  km = maskIndex( Rm, mlist ) + 1
+  m_mean, m_var, m_std = objectMoments( km, len(mlist), Ri )
+  km = None
+  for j, im in enumerate(mlist):
     print(' Mask {} mean, var, std = {:.2f}, {:.2f}, {:.2f} '.format(im, m_mean[j], m_var[j], m_std[j]))
-    j += 1
 
   return m_mean, m_var, m_std
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
 def planAreaFractions( Ri, mlist ):
+  from objectTools import maskIndex, objectPixelCounts
   Npx = np.prod( np.array(Ri.shape) )
-  r = np.zeros( np.shape(mlist) )
-  j = 0
-  for im in mlist:
-    r[j] = np.count_nonzero( Ri == im )/float( Npx )
+  r = objectPixelCounts( maskIndex( Ri, mlist ) + 1, len(mlist) )/float( Npx )
+  for j, im in enumerate(mlist):
     print(' Mask {} plan area fraction = {:.2f} '.format(im, r[j]))
-    j += 1
 
   return r
 
@@ -166,7 +166,18 @@ def read3dDataFromNetCDF( fname, varStr, cl=1 ):
   print(' {}_dims = {}\n Done!'.format(varStr, var.shape ))
   
   # Rename the keys in dDict to simplify the future postprocessing
-  for dn in dDict.keys():
+  dDict = renameCoordinates( dDict )
+
+  # Append the variable into the dict. 
+  dDict['v'] = var 
+
+  return dDict
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def renameCoordinates( dDict ):
+  # E.g. zu_3d -> z, time_xy -> time. NaNs in the coordinates are zeroed.
+  for dn in list( dDict.keys() ):
     idNan = np.isnan(dDict[dn]); dDict[dn][idNan] = 0.
     if( 'time' in dn and 'time' != dn ):
       dDict['time'] = dDict.pop( dn )
@@ -178,13 +189,98 @@ def read3dDataFromNetCDF( fname, varStr, cl=1 ):
       dDict['z'] = dDict.pop( dn )
     else: pass
 
-  # Append the variable into the dict. 
-  dDict['v'] = var 
-
   return dDict
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
+def coordinateDict( varStr, ds, cl=1 ):
+  '''
+  The (renamed) coordinate arrays of variable varStr without reading the
+  variable itself. Same keys as read3dDataFromNetCDF, without 'v'.
+  '''
+  if( varStr not in ds.variables.keys() ):
+    sys.exit(' Variable {} not in list {}.'.format(varStr, ds.variables.keys()))
+  dDict = dict()
+  for dname in asciiEncode(ds.variables[varStr].dimensions, ' Variable dimensions '):
+    dData = ds.variables[dname][:]
+    if( 'time' in dname ): dDict[dname] = dData
+    else:                  dDict[dname] = dData[::cl]
+
+  return renameCoordinates( dDict )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def timeBlocksFromDataset( varStr, ds, cl=1, nPxMax=2**24, mask=None ):
+  '''
+  Generator over the time blocks (t1, t2, var[t1:t2,::cl,::cl,::cl]) of a
+  4D variable (time first). A block holds at most nPxMax values (or one
+  time step). Masked values are returned as NaN, as are the points where
+  mask (z,y,x), e.g. from readMaskFromDataset, is 0.
+  '''
+  if( varStr not in ds.variables.keys() ):
+    sys.exit(' Variable {} not in list {}.'.format(varStr, ds.variables.keys()))
+  v = ds.variables[varStr]
+  nt = v.shape[0]
+  nPx = np.prod([ len(xrange(0, n, cl)) for n in v.shape[1:] ])
+  ntb = max( 1, int( nPxMax // max( nPx, 1 ) ) )
+  for t1 in xrange( 0, nt, ntb ):
+    t2 = min( t1+ntb, nt )
+    X = v[t1:t2, ::cl, ::cl, ::cl]
+    X = np.ma.filled( np.ma.asarray( X, dtype=float ), np.nan )
+    if( mask is not None ): X[:, mask == 0] = np.nan
+    yield t1, t2, X
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def zSlabSize( nt, nxy, nPxMax=2**23 ):
+  # Number of z-levels in a slab of all nt times with at most nPxMax values.
+  return max( 1, int( nPxMax // max( nt*nxy, 1 ) ) )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def streamedProfiles( ds, exprDict, cl=1, nPxMax=2**24, mask=None ):
+  '''
+  Horizontally and temporally averaged z-profiles of expressions of 4D
+  variables, accumulated over time blocks. exprDict = {name: (varNames,
+  func)}, where func(*blocks) returns the expression for the blocks of
+  varNames, e.g. {'umag': (['u','v'], lambda u,v: np.sqrt(u**2+v**2)),
+  'pt': (['pt'], None)}. The variables must share the same grid.
+  NaN (masked) points are excluded from the averages.
+  Returns {name: profile(z)}.
+  '''
+  vNames = []
+  for name in exprDict.keys():
+    for vn in exprDict[name][0]:
+      if( vn not in vNames ): vNames.append( vn )
+
+  shape = ds.variables[vNames[0]].shape
+  for vn in vNames:
+    if( ds.variables[vn].shape != shape ):
+      sys.exit(' Error in streamedProfiles: {} and {} have different shapes.'.format(vNames[0], vn))
+
+  gens = [ timeBlocksFromDataset( vn, ds, cl, nPxMax//len(vNames), mask ) for vn in vNames ]
+  S = dict(); N = dict()
+  for t1, t2, X in gens[0]:
+    B = { vNames[0]: X }
+    for vn, g in zip( vNames[1:], gens[1:] ): B[vn] = next( g )[2]
+    for name, (vList, func) in exprDict.items():
+      if( func is None ): F = B[vList[0]]
+      else:               F = func( *[ B[vn] for vn in vList ] )
+      idf = np.isfinite( F )
+      s = np.where( idf, F, 0. ).sum( axis=(0,2,3) ); n = idf.sum( axis=(0,2,3) )
+      if( name in S ): S[name] += s; N[name] += n
+      else:            S[name]  = s; N[name]  = n
+    B = None; F = None
+
+  P = dict()
+  for name in S.keys():
+    P[name] = S[name]/np.maximum( N[name], 1 )
+    P[name][ N[name] == 0 ] = np.nan
+
+  return P
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
 
 def interpolatePalmVectors(v0, v0_dims, cmpStr, meanOn=False):
 
@@ -290,6 +386,16 @@ def createNetcdfVariable(dso, v, vName, vLen, vUnits, vType, vTuple, parameter,
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
 
+def createEmptyNetcdfVariable(dso, vName, vUnits, vType, vTuple, zlib=False, chunksizes=None):
+  # An output variable which is filled afterwards, e.g. block by block.
+  var = dso.createVariable(vName, vType, vTuple, zlib=zlib, chunksizes=chunksizes)
+  var.units = vUnits
+  print(' NetCDF variable {} created for block-wise writing. '.format(vName))
+
+  return var
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
 def createCoordinateAxis(dso, Rdims, Rdpx, axis, varname, formatstr, unit, parameter, zlib=False):
   arr = np.empty(Rdims[axis])
   for i in xrange(Rdims[axis]):
@@ -319,3 +425,168 @@ def fillTopographyArray(Rtopo, Rdims, Rdpx, datatype):
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
+
+def copyNetcdfAttributes(vin, vout, skip=['_FillValue']):
+  # All attributes in one call. _FillValue must be given at creation.
+  vout.setncatts( dict( (a, vin.getncattr(a)) for a in vin.ncattrs() if a not in skip ) )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def chunkBlockSlices(shape, chunks, nPxMax=2**24):
+  '''
+  Slices which cover an array of the given shape with blocks of whole
+  chunks along the first axis. A block holds at most nPxMax values.
+  '''
+  if( len(shape) == 0 ):
+    yield (); return
+  if( chunks is None ): chunks = shape
+  nRow = int( np.prod( shape[1:] ) )
+  nb = max( 1, int( nPxMax // max( nRow*chunks[0], 1 ) ) )*max( chunks[0], 1 )
+  for i1 in xrange( 0, shape[0], nb ):
+    yield ( slice( i1, min( i1+nb, shape[0] ) ), ) + tuple( slice(None) for n in shape[1:] )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def createVariableLike(dso, vin, vName=None, zlib=None, complevel=4, chunks='keep'):
+  '''
+  Create a variable in dso with the dtype, dimensions, fill value and
+  attributes of vin. zlib=None keeps the filters of vin. chunks='keep'
+  keeps the chunk shape of vin, 'auto' lets the netCDF library choose.
+  '''
+  if( vName is None ): vName = vin.name
+  flt = vin.filters() or dict()
+  if( zlib is None ):
+    zlib = flt.get('zlib', False); complevel = flt.get('complevel', complevel)
+  shuffle = zlib or flt.get('shuffle', False)
+  chunksizes = None
+  if( chunks == 'keep' ):
+    ck = vin.chunking()
+    if( ck != 'contiguous' and ck is not None ): chunksizes = ck
+  fill = None
+  if( '_FillValue' in vin.ncattrs() ): fill = vin.getncattr('_FillValue')
+  vout = dso.createVariable( vName, vin.datatype, vin.dimensions, zlib=zlib,\
+    complevel=complevel, shuffle=shuffle, fletcher32=flt.get('fletcher32', False),\
+    chunksizes=chunksizes, fill_value=fill )
+  copyNetcdfAttributes( vin, vout )
+
+  return vout
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def copyNetcdfVariable(vin, vout, nPxMax=2**24):
+  # Copy the data block by block; the blocks follow the output chunks.
+  ck = vout.chunking()
+  if( ck == 'contiguous' ): ck = None
+  vin.set_auto_maskandscale( False ); vout.set_auto_maskandscale( False )
+  for sl in chunkBlockSlices( vin.shape, ck, nPxMax ):
+    vout[sl] = vin[sl]
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+gSrcDatasets = dict()   # Open input datasets of a compression worker process.
+
+def compressChunkWorker(task):
+  '''
+  Read one chunk of a variable and compress it with the HDF5 shuffle and
+  deflate filters. Returns (chunk offset, compressed bytes) for
+  h5py's write_direct_chunk.
+  '''
+  import zlib as zl
+  srcFile, vName, offset, chunks, complevel, shuffle = task
+  if( srcFile not in gSrcDatasets ): gSrcDatasets[srcFile] = nc.Dataset( srcFile )
+  vin = gSrcDatasets[srcFile].variables[vName]
+  vin.set_auto_maskandscale( False )
+  sl = tuple( slice( o, min( o+c, n ) ) for o, c, n in zip( offset, chunks, vin.shape ) )
+  A = np.asarray( vin[sl] )
+  if( A.shape != tuple(chunks) ):
+    # Edge chunks are stored at full size.
+    P = np.zeros( chunks, A.dtype )
+    if( '_FillValue' in vin.ncattrs() ): P[:] = vin.getncattr('_FillValue')
+    P[ tuple( slice(0, n) for n in A.shape ) ] = A
+    A = P
+  b = np.ascontiguousarray( A ).tostring()
+  if( shuffle and A.dtype.itemsize > 1 ):
+    b = np.frombuffer( b, np.uint8 ).reshape( -1, A.dtype.itemsize ).T.tostring()
+
+  return offset, zl.compress( b, complevel )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def writeCompressedChunks(fileout, jobs, nWorkers):
+  '''
+  Fill the chunked, deflated variables of fileout (created and closed with
+  netCDF4) with chunks compressed in nWorkers processes. The compressed
+  chunks are written directly with h5py, so the compression is not redone.
+  jobs = [(srcFile, vName), ...]; the source data must match the shape.
+  '''
+  import h5py
+  from itertools import product
+  from multiprocessing import Pool
+  fh = h5py.File( fileout, 'r+' )
+  pool = Pool( nWorkers )
+  for srcFile, vName in jobs:
+    dset = fh[vName]
+    chunks = dset.chunks
+    complevel = dset.compression_opts or 4
+    shuffle = bool( dset.shuffle )
+    offsets = product( *[ xrange(0, n, c) for n, c in zip( dset.shape, chunks ) ] )
+    tasks = ( (srcFile, vName, o, chunks, complevel, shuffle) for o in offsets )
+    for offset, b in pool.imap_unordered( compressChunkWorker, tasks, chunksize=16 ):
+      dset.id.write_direct_chunk( offset, b )
+    print(' {} written with parallel compression.'.format(vName))
+  pool.close(); pool.join()
+  fh.close()
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def writeMaskVariable(dso, m2, nz, mode='2d'):
+  '''
+  Write the 2D mask m2(y,x) of [0,1] values as variable 'mask'.
+  mode='3d': dense m(z,y,x). mode='2d': m(y,x) with attribute
+  broadcast='z'. mode='packed': np.packbits of m(y,x) along the 'mask_bytes'
+  dimension with the original shape in attribute packed_shape.
+  Use readMaskFromDataset to read any of these as (z,y,x).
+  '''
+  if( mode == '3d' ):
+    mv = dso.createVariable('mask', 'i4', ('z','y','x',))
+    for k in xrange(nz): mv[k,:,:] = m2
+  elif( mode == '2d' ):
+    mv = dso.createVariable('mask', 'u1', ('y','x',), zlib=True)
+    mv[:] = m2
+    mv.broadcast = 'z'
+  elif( mode == 'packed' ):
+    b = np.packbits( m2.ravel() > 0 )
+    dso.createDimension('mask_bytes', len(b))
+    mv = dso.createVariable('mask', 'u1', ('mask_bytes',))
+    mv[:] = b
+    mv.broadcast = 'z'
+    mv.packed_shape = np.array( m2.shape, 'i4' )
+  else:
+    sys.exit(' Error in writeMaskVariable: unknown mode {}.'.format(mode))
+  mv.units = ' '
+  print(' NetCDF variable mask ({}) successfully created. '.format(mode))
+
+  return mv
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def readMaskFromDataset(ds, nz=None, maskName='mask'):
+  '''
+  Read the mask written by writeMaskVariable as a (z,y,x) array. 2D and
+  packed masks are broadcast along z as a read-only view (no copy).
+  nz is required for them if the dataset has no 'z' dimension.
+  '''
+  mv = ds.variables[maskName]
+  if( 'broadcast' not in mv.ncattrs() ):
+    return np.asarray( mv[:] )
+
+  if( 'packed_shape' in mv.ncattrs() ):
+    shp = tuple( np.asarray( mv.packed_shape ).astype(int) )
+    m2 = np.unpackbits( np.asarray( mv[:], np.uint8 ) )[:int(np.prod(shp))].reshape( shp )
+  else:
+    m2 = np.asarray( mv[:] )
+  if( nz is None ): nz = len( ds.dimensions['z'] )
+
+  return np.broadcast_to( m2, (nz,)+m2.shape )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
@@ -0,0 +1,179 @@
+import numpy as np
+import sys
+import scipy.ndimage as sn
+'''
+Description:
+Statistics of labelled objects (e.g. buildings) in raster data.
+The raster is labelled once and all per-object quantities are computed
+for all objects at once with bincount and ndimage reductions.
+
+
+Author: Mikko Auvinen
+        mikko.auvinen@helsinki.fi
+        University of Helsinki &
+        Finnish Meteorological Institute
+'''
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def maskIndex( Rm, mlist ):
+  '''
+  Map the mask values of Rm onto their positions in mlist.
+  Pixels whose value is not in mlist get -1.
+  '''
+  ids = np.asarray( mlist )
+  if( ids.size == 0 ): return -np.ones( Rm.shape, int )
+  isort = np.argsort( ids )
+  pos = np.searchsorted( ids[isort], Rm.ravel() )
+  pos = np.minimum( pos, len(ids)-1 )
+  match = ( ids[isort][pos] == Rm.ravel() )
+  k = np.where( match, isort[pos], -1 )
+
+  return k.reshape( Rm.shape )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def labelObjects( R, maskId=None, connectivity=1 ):
+  '''
+  Label the connected objects of R whose values are in maskId (int or list).
+  If maskId is None, all nonzero pixels are labelled.
+  connectivity=2 includes the diagonal neighbours.
+  '''
+  if( maskId is None ):
+    idx = ( R != 0 )
+  else:
+    if( isinstance( maskId, int ) ): maskId = [maskId]
+    idx = ( maskIndex( R, maskId ) >= 0 ) & ( R != 0 )
+
+  structure = sn.generate_binary_structure( 2, connectivity )
+  Rl, nObj = sn.label( idx, structure=structure )
+  print(' Found {} objects from the data.'.format(nObj))
+
+  return Rl, nObj
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def objectPixelCounts( Rl, nObj ):
+  # Number of pixels in objects 1...nObj. Label 0 is the background.
+  return np.bincount( Rl.ravel(), minlength=nObj+1 )[1:nObj+1]
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def objectAreas( Rl, nObj, dPx ):
+  return objectPixelCounts( Rl, nObj ) * np.abs( np.prod(dPx) )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def objectMoments( Rl, nObj, Ri ):
+  '''
+  Mean, variance and standard deviation of Ri within each object.
+  '''
+  lab = Rl.ravel()
+  v   = Ri.ravel().astype(float)
+  n   = np.maximum( objectPixelCounts( Rl, nObj ), 1 ).astype(float)
+  s1  = np.bincount( lab, weights=v   , minlength=nObj+1 )[1:nObj+1]
+  s2  = np.bincount( lab, weights=v**2, minlength=nObj+1 )[1:nObj+1]
+  v_mean = s1/n
+  v_var  = np.maximum( s2/n - v_mean**2, 0. )
+
+  return v_mean, v_var, np.sqrt(v_var)
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def objectMaxValues( Rl, nObj, Ri ):
+  if( nObj == 0 ): return np.zeros(0)
+  return np.asarray( sn.maximum( Ri, Rl, index=np.arange(1,nObj+1) ) )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def objectHistograms( Rl, nObj, Ri, bins ):
+  '''
+  Histograms of Ri for all objects with shared bin edges.
+  Returns an (nObj, len(bins)-1) array of pixel counts.
+  Values outside the bins are ignored.
+  '''
+  bins = np.asarray( bins, float )
+  nb = len(bins)-1
+  ib = np.searchsorted( bins, Ri.ravel(), side='right' ) - 1
+  ib[ Ri.ravel() == bins[-1] ] = nb-1   # Last bin is closed, as in np.histogram.
+  idx = ( Rl.ravel() > 0 ) & ( ib >= 0 ) & ( ib < nb )
+  offs = ( Rl.ravel()[idx]-1 )*nb + ib[idx]
+  H = np.bincount( offs, minlength=nObj*nb )
+
+  return H.reshape( nObj, nb )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def objectPerimeters( Rl, nObj, dPx ):
+  '''
+  Perimeter of each object: the total length of pixel edges shared with a
+  different label or with the raster boundary. dPx = [dN, dE].
+  '''
+  dN = np.abs(dPx[0]); dE = np.abs(dPx[1])
+  P = np.zeros( nObj+1 )
+
+  # Edges between E-W neighbours have length dN, between N-S neighbours dE.
+  for a, b, L in [ (Rl[:,1:], Rl[:,:-1], dN), (Rl[1:,:], Rl[:-1,:], dE) ]:
+    idx = ( a != b )
+    P += L*np.bincount( a[idx], minlength=nObj+1 )
+    P += L*np.bincount( b[idx], minlength=nObj+1 )
+
+  # Raster boundary.
+  P += dN*np.bincount( Rl[:,0] , minlength=nObj+1 )
+  P += dN*np.bincount( Rl[:,-1], minlength=nObj+1 )
+  P += dE*np.bincount( Rl[0,:] , minlength=nObj+1 )
+  P += dE*np.bincount( Rl[-1,:], minlength=nObj+1 )
+
+  return P[1:]
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def objectStatistics( Rl, nObj, dPx, Ri=None, bins=None ):
+  '''
+  Per-object statistics gathered into a dict of arrays of length nObj.
+  Height quantities require the data raster Ri, the histogram also bins.
+  '''
+  odict = dict()
+  odict['label'] = np.arange( 1, nObj+1 )
+  odict['area']  = objectAreas( Rl, nObj, dPx )
+  odict['perimeter'] = objectPerimeters( Rl, nObj, dPx )
+  if( Ri is not None ):
+    odict['mean'], odict['var'], odict['std'] = objectMoments( Rl, nObj, Ri )
+    odict['max']  = objectMaxValues( Rl, nObj, Ri )
+    if( bins is not None ):
+      odict['hist'] = objectHistograms( Rl, nObj, Ri, bins )
+
+  return odict
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def writeObjectStatistics( filename, odict ):
+  keys = ['label','area','perimeter','mean','std','max']
+  keys = [ k for k in keys if k in odict ]
+  np.savetxt( filename, np.column_stack([ odict[k] for k in keys ]),\
+    fmt='%g', header=' '.join(keys) )
+  print(' Object statistics written to {}.'.format(filename))
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def randomLabelValues( nObj, distribution, vmean, rng=None ):
+  '''
+  Draw one random value per object: distribution = [type, scale] with type
+  gaussian (scale = std) or uniform (scale = max offset from vmean).
+  Returns a lookup table of length nObj+1 where entry 0 (background) is 0,
+  so that values[Rl] maps the values onto the labelled raster.
+  rng is a numpy RandomState for reproducible streams.
+  '''
+  if( rng is None ): rng = np.random
+  scale = float( distribution[1] )
+  values = np.zeros( nObj+1 )
+  if  ( distribution[0] == "gaussian" ):
+    values[1:] = rng.normal( vmean, scale, nObj )
+  elif( distribution[0] == "uniform" ):
+    values[1:] = vmean + rng.uniform( -1.*scale, scale, nObj )
+  else:
+    sys.exit(' Error in randomLabelValues: invalid distribution {}.'.format(distribution[0]))
+
+  return values
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
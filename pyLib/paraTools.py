@@ -1,75 +1,275 @@
-import paraview.simple as ps
-import sys
+import sys, os
+import re
 import numpy as np
-from plotTools import extractFromCSV
+try:
+    import paraview.simple as ps
+except ImportError:
+    ps = None   # Only the OpenFOAM ascii reader (engine='foam') is available.
+from utilities import sortTimes
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
 def extractParaviewLineData( caseDir , varList, coords , calcDict,  csvOutputVar , time ):
+    # One line at one time. Returns the (nVars, nPoints) array as before.
+    return sampleLines( caseDir, varList, [coords], calcDict, csvOutputVar, [time] )[0,0]
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def splitVarName( outVar ):
+    # 'U:0' -> ('U', 0), 'p' -> ('p', None). Paraview's csv naming.
+    if( ':' in outVar ):
+        name, k = outVar.rsplit(':', 1)
+        return name, int(k)
+    return outVar, None
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def sampleLines( caseDir, varList, lines, calcDict, outputVars, times,\
+    resolution=450, nWorkers=1, engine='auto' ):
+    '''
+    Sample the fields varList of an OpenFOAM case along several lines at
+    several times. lines = [[p1, p2], ...], calcDict as for the Paraview
+    Calculator ({"Function": ..., "ResultArrayName": ...}) and outputVars
+    are names in the Paraview csv convention ('U:0', 'Points:0', ...).
+    Returns an array of shape (nTimes, nLines, nOutputVars, resolution+1).
+    engine = 'paraview', 'foam' (ascii field files) or 'auto'. With
+    nWorkers > 1 the times are split into contiguous ranges, each sampled
+    by its own process with its own reader.
+    '''
+    if( engine == 'auto' ):
+        if( ps is not None ): engine = 'paraview'
+        else:                 engine = 'foam'
+    if( engine == 'paraview' and ps is None ):
+        sys.exit(' Error in sampleLines: paraview.simple is not available. Use engine=foam.')
+
+    times = list( times )
+    nWorkers = max( 1, min( nWorkers, len(times) ) )
+    tasks = []
+    for tr in np.array_split( np.arange( len(times) ), nWorkers ):
+        tasks.append( ( engine, caseDir, varList, lines, calcDict, outputVars,\
+            [ times[i] for i in tr ], resolution ) )
+
+    if( nWorkers > 1 ):
+        from multiprocessing import Pool
+        pool = Pool( nWorkers )
+        parts = pool.map( sampleLinesWorker, tasks )
+        pool.close(); pool.join()
+    else:
+        parts = map( sampleLinesWorker, tasks )
+
+    return np.concatenate( list(parts), axis=0 )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def sampleLinesWorker( task ):
+    engine = task[0]
+    if( engine == 'paraview' ): return sampleLinesParaview( *task[1:] )
+    else:                       return sampleLinesFoam( *task[1:] )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def sampleLinesParaview( caseDir, varList, lines, calcDict, outputVars, times, resolution=450 ):
+    '''
+    The Paraview engine of sampleLines. The case is opened once and one
+    PlotOverLine filter is kept per line. Each time step is a pipeline
+    update, and the results are fetched into memory (no csv files).
+    '''
+    from paraview import servermanager as sm
+    try:
+        from vtk.util.numpy_support import vtk_to_numpy
+    except ImportError:
+        from paraview.vtk.util.numpy_support import vtk_to_numpy
+
     try:
         reader = ps.OpenFOAMReader( FileName=caseDir+'/case.foam')
     except:
         ps.Connect()
         reader = ps.OpenFOAMReader( FileName=caseDir+'/case.foam')
-        
+
     try:    reader.CellArrays= varList
-    except: print "Variables {} were not found in results. Exiting ...".format(varList)
-        
+    except: sys.exit(" Variables {} were not found in results. Exiting ...".format(varList))
     reader.MeshRegions = ['internalMesh']
-    
-    if ( time in reader.TimestepValues ):
-        reader.SMProxy.UpdatePipeline(time)
-        reader.UpdatePipelineInformation()
-        #view = ps.CreateRenderView()
-        #view.ViewTime = time
-    else:
-        print "Time-directory {} does not exist. Exiting ...".format(time)
-        sys.exit(1)
-       
-    if( calcDict ): 
-        calc = ps.Calculator(reader)
-        calc.Function= calcDict["Function"]
-        calc.ResultArrayName = calcDict["ResultArrayName"]
-
-    plotLine = ps.PlotOverLine( Source="High Resolution Line Source" )
-    plotLine.Source.Resolution = 450
-    plotLine.Source.Point1 = coords[0]# [0.0, 0.0008, 0.0]
-    plotLine.Source.Point2 = coords[1]# [0.59, 0.0008, 0.0]
-    
-    
-    filePath = caseDir+"/tmp.csv"
-    writer = ps.CreateWriter(filePath, plotLine)
-    writer.WriteAllTimeSteps = False
-    writer.UseScientificNotation = 1
-    #print "Writing file tmp.csv ... "
-    writer.UpdatePipeline()
-    #print "Done!"
-    ps.Delete(reader); ps.Delete(calc)#; ps.Delete(writer)
-    ps.Delete(plotLine)
-    reader   = None; del reader
-    calc     = None; del calc
-    plotLine = None; del plotLine
-    del writer
-    
-    if( np.mod( (100.*time) , 1 ) == 0 ):
-        print "Disconnecting ... "
-        ps.Disconnect()  # Clear memory occasionally.
-
-    data = extractFromCSV("tmp.csv", csvOutputVar )
-    return data
+    reader.UpdatePipelineInformation()
+
+    src = reader
+    if( calcDict ):
+        src = ps.Calculator( Input=reader )
+        src.Function= calcDict["Function"]
+        src.ResultArrayName = calcDict["ResultArrayName"]
+
+    plotLines = []
+    for coords in lines:
+        pl = ps.PlotOverLine( Input=src, Source="High Resolution Line Source" )
+        pl.Source.Resolution = resolution
+        pl.Source.Point1 = list(coords[0])
+        pl.Source.Point2 = list(coords[1])
+        plotLines.append( pl )
+
+    outNames = [ splitVarName( v ) for v in outputVars ]
+    D = np.zeros( (len(times), len(lines), len(outputVars), resolution+1) )
+    for it, time in enumerate( times ):
+        if( time not in reader.TimestepValues ):
+            sys.exit(" Time-directory {} does not exist. Exiting ...".format(time))
+        for il, pl in enumerate( plotLines ):
+            pl.UpdatePipeline( time )
+            pd = sm.Fetch( pl )
+            for iv, (name, k) in enumerate( outNames ):
+                if( name == 'Points' ): a = vtk_to_numpy( pd.GetPoints().GetData() )
+                else:                   a = vtk_to_numpy( pd.GetPointData().GetArray( name ) )
+                if( k is not None ): a = a[:,k]
+                D[it,il,iv,:] = a
+
+    for pl in plotLines: ps.Delete( pl )
+    if( calcDict ): ps.Delete( src )
+    ps.Delete( reader )
+
+    return D
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
+def readFoamField( fileName ):
+    '''
+    Read the internalField of an OpenFOAM ascii field file (optionally .gz).
+    Returns (value, nComponents); value is either a uniform scalar/vector
+    or an (nCells,) / (nCells, nComponents) array.
+    '''
+    if( not os.path.isfile( fileName ) and os.path.isfile( fileName+'.gz' ) ):
+        fileName += '.gz'
+    if( fileName.endswith('.gz') ):
+        import gzip
+        fl = gzip.open( fileName, 'rb' )
+    else:
+        fl = open( fileName, 'rb' )
+    txt = fl.read().decode('latin-1'); fl.close()
+
+    if( 'format      binary' in txt or 'format binary' in txt ):
+        sys.exit(' Error in readFoamField: {} is binary. Only ascii fields are supported.'.format(fileName))
+
+    i0 = txt.index( 'internalField' )
+    s  = txt[i0+len('internalField'):].lstrip()
+    if( s.startswith('uniform') ):
+        v = s[len('uniform'):s.index(';')].replace('(',' ').replace(')',' ')
+        v = np.fromstring( v, sep=' ' )
+        return v, len(v)
+
+    # nonuniform List<type> N ( ... )
+    ncmp = {'scalar':1, 'vector':3, 'symmTensor':6, 'tensor':9}
+    ltype = s[s.index('<')+1:s.index('>')]
+    nc = ncmp.get( ltype, 1 )
+    s = s[s.index('>')+1:]
+    ip = s.index('(')
+    N = int( s[:ip].split()[-1] )
+    ie = s.index( '\n)', ip )
+    v = np.fromstring( s[ip+1:ie].replace('(',' ').replace(')',' '), sep=' ' )
+    if( v.size != N*nc ):
+        sys.exit(' Error in readFoamField: expected {} values in {}, found {}.'.format(N*nc, fileName, v.size))
+    if( nc > 1 ): v = v.reshape( N, nc )
+
+    return v, nc
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
+def foamTimeDirs( caseDir ):
+    # {float time: directory name}
+    return dict( (float(t), t) for t in sortTimes( caseDir ) )
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
+def foamCellCentres( caseDir, timeDir ):
+    '''
+    Cell centres written by 'postProcess -func writeCellCentres'. They are
+    searched from timeDir, then 0 and constant.
+    '''
+    for d in [ timeDir, '0', 'constant' ]:
+        fn = os.path.join( caseDir, d, 'C' )
+        if( os.path.isfile( fn ) or os.path.isfile( fn+'.gz' ) ):
+            C, nc = readFoamField( fn )
+            return C
+    sys.exit(' Error: no cell centres (C) found in {}. Run: postProcess -func writeCellCentres'.format(caseDir))
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
+def evalCalculator( function, F, nPts ):
+    '''
+    Evaluate a Paraview Calculator expression such as 'U_X*alpha.liquid'
+    for the sampled fields F = {name: array}. Supports field names with
+    _X/_Y/_Z components, arithmetic and the numpy functions below.
+    '''
+    ns = { 'sqrt':np.sqrt, 'abs':np.abs, 'exp':np.exp, 'ln':np.log, 'log10':np.log10,\
+        'sin':np.sin, 'cos':np.cos, 'mag':lambda a: np.sqrt(np.sum(a**2, axis=-1)) }
+    names = dict()
+    for i, name in enumerate( F.keys() ):
+        names[name] = 'f{}'.format(i)
+        ns['f{}'.format(i)] = F[name]
+
+    def lookup( m ):
+        # Whole identifiers only: a field, a field with _X/_Y/_Z or a function.
+        tok = m.group(0)
+        if( tok in names ): return names[tok]
+        cmp = {'_X':0, '_Y':1, '_Z':2}
+        if( tok[-2:] in cmp and tok[:-2] in names ):
+            return '{}[:,{}]'.format(names[tok[:-2]], cmp[tok[-2:]])
+        return tok
+
+    expr = re.sub( r'[A-Za-z_][\w.]*', lookup, function )
+    try:
+        v = eval( expr, {'__builtins__':{}}, ns )
+    except:
+        sys.exit(' Error in evalCalculator: cannot evaluate {}.'.format(function))
+
+    return v*np.ones( nPts )
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
+def sampleLinesFoam( caseDir, varList, lines, calcDict, outputVars, times, resolution=450 ):
+    '''
+    The Paraview-free engine of sampleLines. Reads the ascii field files
+    directly and samples the value of the nearest cell centre at the line
+    points (cell values, no interpolation). The cell lookup is built once
+    per line and reused for all times, unless the cell centres change.
+    '''
+    from scipy.spatial import cKDTree
+    tDirs = foamTimeDirs( caseDir )
+    outNames = [ splitVarName( v ) for v in outputVars ]
+    P = [ np.linspace( 0., 1., resolution+1 )[:,None]*(np.array(c[1])-np.array(c[0]))[None,:]\
+        + np.array(c[0])[None,:] for c in lines ]
 
+    Cprev = None; Icell = None
+    D = np.zeros( (len(times), len(lines), len(outputVars), resolution+1) )
+    for it, time in enumerate( times ):
+        if( time not in tDirs ):
+            sys.exit(" Time-directory {} does not exist. Exiting ...".format(time))
+        tdir = tDirs[time]
+        C = foamCellCentres( caseDir, tdir )
+        if( Cprev is None or C.shape != Cprev.shape or np.any( C != Cprev ) ):
+            tree = cKDTree( C )
+            Icell = [ tree.query( p )[1] for p in P ]
+            Cprev = C
+
+        fields = dict()
+        for name in varList:
+            v, nc = readFoamField( os.path.join( caseDir, tdir, name ) )
+            fields[name] = v
+
+        for il in xrange( len(lines) ):
+            F = dict()
+            for name in varList:
+                v = fields[name]
+                if( np.ndim(v) == 0 or ( np.ndim(v) == 1 and v.size != C.shape[0] ) ):
+                    F[name] = np.ones( (len(Icell[il]), np.size(v)) )*v   # uniform
+                    if( np.size(v) == 1 ): F[name] = F[name][:,0]
+                else:
+                    F[name] = v[Icell[il]]
+            if( calcDict ):
+                F[calcDict["ResultArrayName"]] = evalCalculator( calcDict["Function"], F, resolution+1 )
+            for iv, (name, k) in enumerate( outNames ):
+                if( name == 'Points' ): a = P[il]
+                elif( name in F ):      a = F[name]
+                else:
+                    sys.exit(" Variable {} was not found in results. Exiting ...".format(name))
+                if( k is not None ): a = a[:,k]
+                D[it,il,iv,:] = a
+
+    return D
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
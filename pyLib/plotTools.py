@@ -3,7 +3,7 @@ import sys
 import glob
 import numpy as np
 import matplotlib.pyplot as plt
-from utilities import dataFromDict
+from utilities import dataFromDict, readColumns
 from  matplotlib.ticker import FormatStrFormatter
 
 # 08.04.2016:  Mona added an option for colorbar bounds to addImagePlot
@@ -647,18 +647,24 @@ def fullPlotXY(fig,fileStr,figStr,xlabelStr,ylabelStr,lwidth=1.2,fsize=16,logOn=
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
-def plotCSV( fig, fileStr, revAxes=False, magY=False, globalValues=False ):
-  global gxI
-  global gyLst
-  fl = open( fileStr, 'r' )
+def csvVarNames( csvFile ):
+  fl = open( csvFile, 'r' )
   line = fl.readline() # Read first line which contains all variable names as str.
   fl.close()
   varList = line.split(',')
   for i in xrange(len(varList)):
     varList[i]=varList[i].strip("\"")
+    varList[i]=varList[i].strip("\""+"\n")  # This is in case the line contain '\n'
+
+  return varList
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def plotCSV( fig, fileStr, revAxes=False, magY=False, globalValues=False ):
+  global gxI
+  global gyLst
+  varList = csvVarNames( fileStr )
 
-  x = np.loadtxt(fileStr, delimiter=',', skiprows=1)
-  
   if( not globalValues or (globalValues and gxI == -1) ):
     n = 0
     for v in varList:
@@ -694,6 +700,10 @@ def plotCSV( fig, fileStr, revAxes=False, magY=False, globalValues=False ):
     xI   = gxI     # Extract the global values
     yLst = gyLst 
 
+  # Read only the selected columns: x[j] is the column j of the file.
+  cols = sorted( set( [xI] + list(yLst) ) )
+  dat = readColumns( fileStr, cols, delimiter=',', skiprows=1 )
+  x = dict( zip( cols, dat.T ) ); dat = None
 
   labelStr = fileStr.split(".")[0]
 
@@ -705,21 +715,21 @@ def plotCSV( fig, fileStr, revAxes=False, magY=False, globalValues=False ):
       yLbl = yLbl+varList[yJ]+"; "  # Compile label
       
       if( revAxes ):
-        lines=ax.plot(x[:,yJ],x[:,xI],'-', markersize=6, linewidth=1.5,  label=labelStr+": "+varList[yJ])
+        lines=ax.plot(x[yJ],x[xI],'-', markersize=6, linewidth=1.5,  label=labelStr+": "+varList[yJ])
       else:
-        lines=ax.plot(x[:,xI],x[:,yJ],'o-', markersize=6, linewidth=1.5, label=labelStr+": "+varList[yJ])
-        #writeXY( x[:,xI],x[:,yJ], 'out.dat' )
+        lines=ax.plot(x[xI],x[yJ],'o-', markersize=6, linewidth=1.5, label=labelStr+": "+varList[yJ])
+        #writeXY( x[xI],x[yJ], 'out.dat' )
 
       
   else:
-    yt = np.zeros(len(x[:,0]))
+    yt = np.zeros(len(x[xI]))
     yLbl = " Mag(y[:]) "   # Set fixed label 
     for yJ in yLst:
-      yt += x[:,yJ]**2
+      yt += x[yJ]**2
     if( revAxes ):
-      lines=ax.plot(np.sqrt(yt),x[:,xI],'-', markersize=6, linewidth=1.5,  label=labelStr)
+      lines=ax.plot(np.sqrt(yt),x[xI],'-', markersize=6, linewidth=1.5,  label=labelStr)
     else:
-      lines=ax.plot(x[:,xI],np.sqrt(yt),'o-', markersize=6, linewidth=1.5, label=labelStr)
+      lines=ax.plot(x[xI],np.sqrt(yt),'o-', markersize=6, linewidth=1.5, label=labelStr)
 
 
   if( revAxes ):
@@ -732,14 +742,8 @@ def plotCSV( fig, fileStr, revAxes=False, magY=False, globalValues=False ):
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
-def extractFromCSV( csvFile, varNames ):
-  fl = open( csvFile, 'r' )
-  line = fl.readline() # Read first line which contains all variable names as str.
-  fl.close()
-  varList = line.split(',')
-  for i in xrange(len(varList)):
-    varList[i]=varList[i].strip("\"")
-    varList[i]=varList[i].strip("\""+"\n")  # This is in case the line contain '\n'
+def extractFromCSV( csvFile, varNames, cache=True ):
+  varList = csvVarNames( csvFile )
     
   Ix = []
   for varStr in varNames:
@@ -751,16 +755,13 @@ def extractFromCSV( csvFile, varNames ):
     print("Exiting program. ")
     sys.exit(1)
   
-  x = np.loadtxt(csvFile, delimiter=',', skiprows=1)
-  data = []
-  for jcol in Ix:
-    data.append( np.array(x[:,jcol]) )
+  x = readColumns( csvFile, Ix, delimiter=',', skiprows=1, cache=cache )
 
-  return np.array(data)
+  return np.array( x.T )
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
-def extractFromRAW( rawFile, varNames ):
+def extractFromRAW( rawFile, varNames, cache=True ):
   fl = open( rawFile, 'r' )
   # Read (first or second) line which contains all var names as str.
   while 1:
@@ -782,10 +783,10 @@ def extractFromRAW( rawFile, varNames ):
     print "Exiting program. "
     sys.exit(1)
   
-  x = np.loadtxt(rawFile)
+  x = readColumns( rawFile, Ix, comments='#', cache=cache )
   data = []
-  for jcol in Ix:
-    data.append(x[:,jcol])
+  for j in xrange(len(Ix)):
+    data.append(x[:,j])
 
   return data
 
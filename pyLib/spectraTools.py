@@ -5,6 +5,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import scipy.signal as scs
 from plotTools import addToPlot
+from utilities import readColumns
 
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 
@@ -13,13 +14,13 @@ def readColsFromFile( filename , cols ):
   csvOn = 'csv' in filename 
   
   try:    
-    if( csvOn ): dat = np.loadtxt( filename , usecols=cols, delimiter = ',', skiprows=1 )
-    else       : dat = np.loadtxt( filename , usecols=cols )
+    if( csvOn ): dat = readColumns( filename , cols, delimiter = ',', skiprows=1 )
+    else       : dat = readColumns( filename , cols )
   except: 
     sys.exit(' Error! Cannot read cols={} from {}. Exiting ...'.format(cols, filename))
   
   if( len(cols) == 1 ):
-    t = None; v = dat
+    t = None; v = dat[:,0]
   else:
     t = dat[:,0]; v = dat[:,1]
   
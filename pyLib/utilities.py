@@ -358,4 +358,116 @@ def vtkWriteUnsPointData( V, X, Y, Z, filename ):
   f.close()
   print(' ... done!')
 
-# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
\ No newline at end of file
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+def columnCacheName( filename ):
+  # Binary sidecar of the parsed columns, hidden next to the text file.
+  head, tail = os.path.split( filename )
+  return os.path.join( head, '.'+tail+'.cols.npz' )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def parseColumnChunk( lines, cols, delimiter, comments ):
+  '''
+  Parse the requested columns of a list of text lines. The whole chunk is
+  tokenized at once; ragged or non-numeric chunks fall back to np.loadtxt.
+  '''
+  text = ''.join( lines )
+  if( delimiter is not None ): text = text.replace( delimiter, ' ' )
+  v = np.fromstring( text, sep=' ' )
+  nc = len( lines[0].split(delimiter) )
+  if( v.size == nc*len(lines) and max(cols) < nc ):
+    return v.reshape( len(lines), nc )[:,cols]
+  return np.loadtxt( lines, usecols=cols, delimiter=delimiter, comments=comments, ndmin=2 )
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def readColumns( filename, cols, delimiter=None, skiprows=0, comments='#',\
+  cache=True, chunkLines=2**16 ):
+  '''
+  Read only the columns cols (list of indices) of a text data file and
+  return them as an (nrows, len(cols)) array. The file is parsed in chunks
+  of chunkLines lines. With cache=True the parsed columns are stored in a
+  binary sidecar (see columnCacheName) keyed by the file's mtime and size,
+  so repeated reads skip the text parsing. Columns missing from the
+  sidecar are parsed and added to it.
+  '''
+  from itertools import islice
+  cols = [ int(c) for c in cols ]
+  st = os.stat( filename )
+  key = np.array([ st.st_mtime, st.st_size ])
+  cfile = columnCacheName( filename )
+  cdict = dict()
+
+  if( cache and os.path.isfile( cfile ) ):
+    try:
+      cz = np.load( cfile )
+      if( np.all( cz['key'] == key ) ):
+        cdict = dict( (k, cz[k]) for k in cz.files if k != 'key' )
+      cz.close()
+    except:
+      cdict = dict()
+
+  missing = sorted( set( c for c in cols if 'c{}'.format(c) not in cdict ) )
+  if( len(missing) > 0 ):
+    blocks = []
+    fl = open( filename, 'r' )
+    for i in xrange( skiprows ): fl.readline()
+    while( True ):
+      lines = list( islice( fl, chunkLines ) )
+      if( len(lines) == 0 ): break
+      lines = [ l for l in lines if l.strip() and not l.lstrip().startswith(comments) ]
+      if( len(lines) == 0 ): continue
+      blocks.append( parseColumnChunk( lines, missing, delimiter, comments ) )
+    fl.close()
+    if( len(blocks) == 0 ):
+      sys.exit(' Error in readColumns: no data found in {}.'.format(filename))
+    dat = np.concatenate( blocks, axis=0 ); blocks = None
+    for i, c in enumerate( missing ):
+      cdict['c{}'.format(c)] = dat[:,i]
+    dat = None
+
+    if( cache ):
+      try:
+        ctmp = cfile+'.tmp'
+        fc = open( ctmp, 'wb' )
+        np.savez( fc, key=key, **cdict )
+        fc.close()
+        os.rename( ctmp, cfile )
+      except:
+        pass  # E.g. a read-only directory. The cache is optional.
+
+  return np.column_stack([ cdict['c{}'.format(c)] for c in cols ])
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+
+def slabMap( func, tasks, nWorkers=1, nBatch=None, ordered=True ):
+  '''
+  Generator of func(task) over the tasks (any iterable), computed in
+  nWorkers processes. The tasks are drawn in batches of nBatch (default
+  nWorkers), so only a few tasks and results are in memory at a time.
+  The results come in task order, or as they finish with ordered=False.
+  With nWorkers > 1, func must be a module level function (picklable).
+  '''
+  from itertools import islice
+  nWorkers = max( nWorkers, 1 )
+  if( nBatch is None ): nBatch = nWorkers
+  pool = None
+  if( nWorkers > 1 ):
+    from multiprocessing import Pool
+    pool = Pool( nWorkers )
+
+  tasks = iter( tasks )
+  try:
+    while( True ):
+      batch = list( islice( tasks, nBatch ) )
+      if( len(batch) == 0 ): break
+      if( pool is None ):  res = ( func(t) for t in batch )
+      elif( ordered ):     res = pool.map( func, batch )
+      else:                res = pool.imap_unordered( func, batch )
+      for r in res: yield r
+      batch = res = None
+  finally:
+    if( pool is not None ):
+      pool.close(); pool.join()
+
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
@@ -4,7 +4,8 @@ import numpy as np
 import matplotlib.pyplot as plt
 import argparse
 from plotTools import addToPlot
-from netcdfTools import read3dDataFromNetCDF
+from netcdfTools import read3dDataFromNetCDF, netcdfDataset, coordinateDict
+from cacheTools import rotatedVelocity
 from utilities import filesFromList, writeLog
 try:
   import bootstrapped.bootstrap as bs
@@ -89,19 +90,10 @@ for fn in fileNos:
   
   for i in xrange(len(varnames)):
     if( varnames[i].upper() == 'U1' or varnames[i].upper() == 'U2' ):
-      dataDict = read3dDataFromNetCDF( fileList[fn] , 'u', 1 )
-      u = dataDict['v']
-      dataDict = read3dDataFromNetCDF( fileList[fn] , 'v', 1 )
-      v = dataDict['v']
-      um = np.mean( u, axis=(0) ); vm = np.mean( v, axis=(0) )
-      a  = np.arctan( vm/(um+1.e-5) ); um = None; vm = None
-      # Carry the data within dataDict.
-      if( varnames[i].upper() == 'U1' ):
-        dataDict['v'] = u * np.cos(a) + v * np.sin(a) 
-      else:
-        dataDict['v'] =-u * np.sin(a) + v * np.cos(a)
-      # Free memory  
-      u = None; v = None; a = None                  
+      # The rotated component is cached on disk (cacheTools) for reuse.
+      ds, varList, paramList = netcdfDataset( fileList[fn], False )
+      dataDict = coordinateDict( 'u', ds ); ds.close()
+      dataDict['v'] = rotatedVelocity( fileList[fn], varnames[i].lower(), 1 )
       
     else:
       dataDict = read3dDataFromNetCDF( fileList[fn] , varnames[i], 1 )
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+import sys
+import argparse
+import glob
+from catalogTools import updateCatalog, queryCatalog
+from utilities import writeLog
+'''
+Description:
+Build, refresh and query an SQLite catalog of NETCDF files.
+Only new or modified files are (re)scanned.
+
+Example: files with w within z = 0...100 m and time > 3600 s
+  catalogNetCdf.py -f "MASK_*.nc" -v w -r zw_3d 0 100 -r time 3600 None
+
+Author: Mikko Auvinen
+        mikko.auvinen@helsinki.fi
+        University of Helsinki &
+        Finnish Meteorological Institute
+'''
+
+#==========================================================#
+parser = argparse.ArgumentParser(prog='catalogNetCdf.py')
+parser.add_argument("-db", "--database", type=str, default='netcdfCatalog.db',\
+  help="Name of the SQLite catalog file. Default=netcdfCatalog.db")
+parser.add_argument("-f", "--fileKey", type=str, nargs='+', default=None,\
+  help="Search string(s) for the files to add or refresh.")
+parser.add_argument("-nw", "--nworkers", type=int, default=1,\
+  help="Number of parallel scanning processes. Default=1")
+parser.add_argument("-pr", "--prune", action="store_true", default=False,\
+  help="Remove entries of files that no longer exist.")
+parser.add_argument("-v", "--varname", type=str, default=None,\
+  help="Query: name of the variable the files must contain.")
+parser.add_argument("-r", "--range", type=str, nargs=3, action='append', default=None,\
+  metavar=('COORD','MIN','MAX'), help="Query: coordinate range. None = open end. Repeatable.")
+parser.add_argument("-k", "--pathKey", type=str, default=None,\
+  help="Query: search string on the file path.")
+args = parser.parse_args()
+writeLog( parser, args )
+#==========================================================#
+
+dbfile = args.database
+
+if( args.fileKey ):
+  fileList = []
+  for fk in args.fileKey: fileList.extend( glob.glob( fk ) )
+  n = updateCatalog( dbfile, sorted( set( fileList ) ), args.nworkers, args.prune )
+  print(' {} files scanned into {}.'.format(n, dbfile))
+elif( args.prune ):
+  updateCatalog( dbfile, [], 1, True )
+
+if( args.varname or args.range or args.pathKey ):
+  ranges = dict()
+  for name, cmin, cmax in ( args.range or [] ):
+    ranges[name] = tuple( None if( c.lower() == 'none' ) else float(c) for c in (cmin, cmax) )
+
+  res = queryCatalog( dbfile, args.varname, ranges, args.pathKey )
+  for path, sl in res:
+    istr = ', '.join( '{}[{}:{}]'.format(k, s.start, s.stop) for k, s in sorted( sl.items() ) )
+    print(' {} {}'.format(path, istr))
+  print(' {} files match.'.format(len(res)))
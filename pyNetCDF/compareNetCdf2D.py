@@ -2,39 +2,122 @@
 
 import netCDF4 as nc
 import sys
+import os
 import numpy as np
 import matplotlib.pyplot as plt
 import argparse
 import scipy.ndimage as sn # contains the filters
 from plotTools import addImagePlot
-from netcdfTools import read3dDataFromNetCDF
+from netcdfTools import netcdfDataset, netcdfOutputDataset, netcdfWriteAndClose,\
+  coordinateDict, createNetcdfVariable
 from utilities import selectFromList
+'''
+Description: Compare a 2D NETCDF variable of one or more files against a
+reference file. The difference metrics are computed for all shared z-levels
+at once, one time step at a time, and can be written to NETCDF/CSV files.
+'''
 
 #==========================================================#
-def readVar( fn, vstr, cl=1 ):
-  xDict = read3dDataFromNetCDF( fn , vstr , cl )
-  v = xDict['v']; x = xDict['x']; y = xDict['y']; z = xDict['z']
-  xDict = None
-  return v, x, y, z
+def coords( ds, vstr, cl=1 ):
+  xDict = coordinateDict( vstr, ds, cl )
+  return xDict['x'], xDict['y'], xDict['z']
 #==========================================================#
-def U_hd( fn, cl=1, direction=False ):
-  ut, xu, yu, zu = readVar( fn, 'u_xy', cl )
-  vt, xv, yv, zv = readVar( fn, 'v_xy', cl )
-  x = xv[:-1]; y = yu[:-1]; z = 0.5*(zu+zv)
-  uc = 0.5*( ut[:,:,:-1,1:] + ut[:,:,:-1,:-1] )
-  vc = 0.5*( vt[:,:,1:,:-1] + ut[:,:,:-1,:-1] )
+def readStep( ds, vstr, t, cl=1 ):
+  # One time step (z,y,x) of vstr. Masked values are returned as NaN.
+  var = ds.variables[vstr]
+  if( len(var.shape) == 4 ): v = var[t, ::cl, ::cl, ::cl]
+  else:                      v = var[::cl, ::cl, ::cl]
+  return np.ma.filled( np.ma.asarray( v, dtype=float ), np.nan )
+#==========================================================#
+def U_hd_coords( ds, cl=1 ):
+  xu, yu, zu = coords( ds, 'u_xy', cl )
+  xv, yv, zv = coords( ds, 'v_xy', cl )
+  return xv[:-1], yu[:-1], 0.5*(zu+zv)
+#==========================================================#
+def U_hd( ds, t, cl=1, direction=False ):
+  ut = readStep( ds, 'u_xy', t, cl )
+  vt = readStep( ds, 'v_xy', t, cl )
+  uc = 0.5*( ut[:,:-1,1:] + ut[:,:-1,:-1] )
+  vc = 0.5*( vt[:,1:,:-1] + vt[:,:-1,:-1] )
   if( direction ):
     v = np.arctan( vc/(uc+1.E-5) ) * (180./np.pi)
   else:
     a = np.arctan( vc/(uc+1.E-5) )
     v = uc * np.cos(a) + vc * np.sin(a)
-    
-  return v, x, y, z
+
+  return v
+
+#==========================================================#
+def matchLevels( z1, z2, idk ):
+  # Indices (k1, k2) of the levels z1[idk] which are also found in z2.
+  z1k = np.asarray( z1 )[idk]
+  isort = np.argsort( z2 ); z2s = np.asarray( z2 )[isort]
+  pos = np.minimum( np.searchsorted( z2s, z1k ), len(z2s)-1 )
+  found = np.isclose( z2s[pos], z1k, rtol=1.e-6, atol=1.e-6 )
+  for k in np.asarray(idk)[~found]:
+    print(' Coordinate {} not in the second file. Skipping.'.format(z1[k]))
+  return np.asarray(idk)[found], isort[pos[found]]
+
+#==========================================================#
+def levelMetrics( A, B, mode ):
+  '''
+  Difference metrics of B vs. the reference A for all levels at once.
+  A, B: (nLevels, ny, nx). Points that are NaN or identical in both
+  (e.g. inside buildings) are excluded. Returns a dict of (nLevels,)
+  arrays and the difference field dv.
+  '''
+  W = np.isfinite(A) & np.isfinite(B) & ( A != B )
+  N = np.maximum( W.sum( axis=(1,2) ), 1 ).astype(float)
+  A = np.where( W, A, 0. ); B = np.where( W, B, 0. )
+  vm1 = A.sum( axis=(1,2) )/N
+
+  if( mode == 'r' ):
+    dv = (B - A)/np.abs( A + 1E-5 )
+  elif( mode == 's' ):
+    dv = (B - A)/( vm1[:,None,None] + 1E-5 )
+  else:
+    dv = (B - A)
+  dv[~W] = 0.
+
+  mDict = dict()
+  s2 = np.sum( dv**2, axis=(1,2) )
+  if( mode == 'n' ):
+    denom = B*A
+    d2 = np.sign( denom )*(np.abs(denom) + 1E-4); denom = None
+    s2i = np.sum( np.where( W, 1./d2, 0. ), axis=(1,2) )
+    mDict['rms']  = np.sqrt( np.abs( s2/N * s2i/N ) )
+    mDict['skew'] = np.zeros( len(N) )
+  else:
+    mDict['rms']  = np.sqrt( s2/N )
+    mDict['skew'] = (1./N)*np.sum( dv**3, axis=(1,2) ) * ( s2/np.maximum(N-1., 1.) )**(-1.5)
+  mDict['bias'] = np.sum( dv, axis=(1,2) )/N
+  mDict['npts'] = N
+  dv[~W] = np.nan
+
+  return mDict, dv
+
+#==========================================================#
+def writeMetricsNetCdf( fileout, time, zk, M ):
+  dso = netcdfOutputDataset( fileout )
+  createNetcdfVariable( dso, time, 'time', len(time), 's', 'f4', ('time',), True )
+  createNetcdfVariable( dso, zk, 'z', len(zk), 'm', 'f4', ('z',), True )
+  for key in ['rms','skew','bias','npts']:
+    createNetcdfVariable( dso, M[key], key, len(time), '[-]', 'f4', ('time','z',), False )
+  netcdfWriteAndClose( dso )
+
+#==========================================================#
+def writeMetricsCsv( fileout, time, zk, M ):
+  keys = ['rms','skew','bias','npts']
+  T = np.repeat( time, len(zk) ); Z = np.tile( zk, len(time) )
+  np.savetxt( fileout, np.column_stack( [T, Z] + [ M[k].ravel() for k in keys ] ),\
+    fmt='%.6g', delimiter=',', header='time,z,'+','.join(keys), comments='' )
+  print(' {} written successfully.'.format(fileout))
 
 #==========================================================#
 parser = argparse.ArgumentParser(prog='compareNetCdf2D.py')
 parser.add_argument("-f1", "--filename1",type=str, help="Name of the first (ref) input NETCDF file.")
-parser.add_argument("-f2", "--filename2",type=str, help="Name of the second input NETCDF file.")
+parser.add_argument("-f2", "--filename2",type=str, nargs='+',\
+  help="Name(s) of the input NETCDF file(s) compared against the reference.")
 parser.add_argument("-v", "--varname",  type=str, default='u',\
   help="Name of the variable in NETCDF file. Default='u' ")
 parser.add_argument("-v0", "--vref", type=float, nargs=2, default=[0.,0.],\
@@ -45,6 +128,20 @@ parser.add_argument("-m", "--mode", type=str, default='d', choices=['d', 'r', 's
   help="Diff mode: 'd': delta, 'r': relative, 's': scaled, 'n': root normalized mean square diff.")
 parser.add_argument("-w", "--writeRMS", help="Write the root-mean-square of the differences to a file.",\
   action="store_true", default=False)
+parser.add_argument("-a", "--allLevels", help="Use all z-levels (no prompt).",\
+  action="store_true", default=False)
+parser.add_argument("-z", "--zlevels", type=float, nargs='+', default=None,\
+  help="z-coordinates of the levels to compare (no prompt).")
+parser.add_argument("-t", "--timeIds", type=int, nargs='+', default=[0],\
+  help="Time indices to compare. Default = [0].")
+parser.add_argument("-ta", "--allTimes", help="Compare all time steps.",\
+  action="store_true", default=False)
+parser.add_argument("-wn", "--writeNetCdf", help="Write the per-level metrics into a NETCDF file.",\
+  action="store_true", default=False)
+parser.add_argument("-wc", "--writeCsv", help="Write the per-level metrics into a CSV file.",\
+  action="store_true", default=False)
+parser.add_argument("-o", "--outstr", type=str, default='CMP_',\
+  help="Prefix of the metrics output files. Default = CMP_")
 parser.add_argument("-nx", "--nexcl", type=int, nargs=2, default=[0,1],\
   help="Exclude the [first,last] number of nodes from analysis in x-direction.")
 parser.add_argument("-p", "--printOn", help="Print the numpy array data.",\
@@ -53,12 +150,11 @@ parser.add_argument("-s", "--save", action="store_true", default=False,\
   help="Save figures. Default=False")
 parser.add_argument("--lims", help="User specified limits.", action="store_true", default=False)
 parser.add_argument("--grid", help="Turn on grid.", action="store_true", default=False)
-args = parser.parse_args()    
+args = parser.parse_args()
 
 #==========================================================#
 # Rename ... that's all.
 f1       = args.filename1      # './DATA_2D_XY_AV_NETCDF_N02-1.nc'
-f2       = args.filename2      # './DATA_2D_XY_AV_NETCDF_N02-2.nc'
 varname  = args.varname
 v0       = np.array(args.vref )
 vs       = np.array(args.vstar)
@@ -77,116 +173,86 @@ vn = varname.split('_')[0]
 dirOn   = 'UD' in varname.upper()
 horizOn = 'UH' in varname.upper()
 
+def getStep( ds, t, iv ):
+  if( (not horizOn) and (not dirOn) ): v = readStep( ds, varname, t, 1 )
+  else:                                v = U_hd( ds, t, 1, dirOn )
+  if( not dirOn ):
+    v -= v0[iv]; v /= vs[iv]
+  return v[:,:,nx[0]:-nx[1]]
+
+ds1, varList, paramList = netcdfDataset( f1, False )
+if( (not horizOn) and (not dirOn) ): x1, y1, z1 = coords( ds1, varname, 1 )
+else:                                x1, y1, z1 = U_hd_coords( ds1, 1 )
+vstr = varname
+if( horizOn or dirOn ): vstr = 'u_xy'
+time1 = coordinateDict( vstr, ds1 )['time'] if( len(ds1.variables[vstr].shape) == 4 ) else np.zeros(1)
 
-if( (not horizOn) and (not dirOn) ):
-  #print('{}'.format(varname))
-  v1, x1, y1, z1 = readVar( f1, varname, 1 )
-  v2, x2, y2, z2 = readVar( f2, varname, 1 )
-  
+if( args.allLevels ):
+  idk = range(len(z1))
+elif( args.zlevels is not None ):
+  idk = [ int( np.argmin( np.abs( z1 - zl ) ) ) for zl in args.zlevels ]
 else:
-  v1, x1, y1, z1 = U_hd( f1, 1, dirOn )  
-  v2, x2, y2, z2 = U_hd( f2, 1, dirOn )
+  idk = selectFromList( z1 )
 
-dims1  = np.array( v1.shape )
-dims2  = np.array( v2.shape )
+if( args.allTimes ): tIds = range(len(time1))
+else:                tIds = args.timeIds
 
-if( not dirOn ):
-  v1 -= v0[0]; v1 /= vs[0]
-  v2 -= v0[1]; v2 /= vs[1]
+for f2 in args.filename2:
+  ds2, varList, paramList = netcdfDataset( f2, False )
+  if( (not horizOn) and (not dirOn) ): x2, y2, z2 = coords( ds2, varname, 1 )
+  else:                                x2, y2, z2 = U_hd_coords( ds2, 1 )
+  k1s, k2s = matchLevels( z1, z2, idk )
+  zk = np.asarray( z1 )[k1s]
+  stem = os.path.basename( f2 ).split('.nc')[0]
 
+  M = dict( (key, np.zeros( (len(tIds), len(k1s)) )) for key in ['rms','skew','bias','npts'] )
+  for it, t in enumerate( tIds ):
+    A = getStep( ds1, t, 0 )[k1s]
+    B = getStep( ds2, t, 1 )[k2s]
+    if( A.shape != B.shape ):
+      sys.exit(' Dataset dimensions do not match. dims_1 = {} vs. dims_2 = {}'.format(A.shape, B.shape))
+    mDict, dv = levelMetrics( A, B, mode )
+    for key in M.keys(): M[key][it,:] = mDict[key]
+    for k in xrange(len(zk)):
+      print(' t[{}], z = {}: RMS (d{}) = {}, Sk(d{}) = {} '.format( t, zk[k], vn,\
+        mDict['rms'][k], vn, mDict['skew'][k] ))
 
-if( all( dims1 == dims2 ) ):
-  print(' Dimensions of the two datasets match!: dims = {}'.format(dims1))  
-else:
-  print(' Caution! Dataset dimensions do not match. dims_1 = {} vs. dims_1 = {}'.format(dims1, dims2))
-
-idk = selectFromList( z1 )
-
-if( writeRMS ):
-  fout = file('RMS_d{}.dat'.format(vn), 'wb')
-  fout.write('# file1 = {}, file2 = {}\n'.format(f1, f2))
-  fout.write('# z_coord \t RMS(d{})\n'.format(vn))
-  
-  #fout.write('{:.2f}\t{:.2e}'.format( z1[k1], dv ))
-
-for k1 in idk:
-  
-  k2 = np.where(z2==z1[k1])[0] # This outputs a list 
-  if( len(k2) == 0 ):
-    print(' Coordinate {} not in file {}. Skipping.'.format(z1[k1],filename2))
-    continue
-  else:
-    k2 = k2[0]    # Take always the first term
-  
-  
-  if( len( dims1 ) == 4 ): v1x  = v1[0,k1,:,nx[0]:-nx[1]]
-  else:                    v1x  = v1[  k1,:,nx[0]:-nx[1]]
-    
-  if( len( dims2 ) == 4 ): v2x =  v2[0,k2,:,nx[0]:-nx[1]]
-  else:                    v2x =  v2[  k2,:,nx[0]:-nx[1]]
-  
-  if( not np.ma.isMaskedArray(v1x) and not np.ma.isMaskedArray(v2x) ):
-    idm = (v1x == v2x)
-    v1x = np.ma.masked_array( v1x, mask=idm ) 
-    v2x = np.ma.masked_array( v2x, mask=idm )  
-    idm = None 
-    
-  #idx  = ( np.abs(v1x) > 1E-5 )
-  #vm1  = np.mean( v1x[idx] )
-  vm1 = np.mean( v1x )
+    if( printOn and it == 0 ):
+      for k in xrange(len(zk)):
+        dimsf  = np.array( np.shape( dv[k] ) )
+        xydims = dimsf
+        figDims = 13.*(xydims[::-1].astype(float)/np.max(xydims))
+        fig = plt.figure(num=1, figsize=figDims)
+        labelStr = '({0}_2 - {0}_1)(z={1} m)'.format(vn, zk[k])
+        fig = addImagePlot( fig, dv[k,::-1,:], labelStr, gridOn, limsOn )
+
+        fig2 = plt.figure(num=2, figsize=figDims)
+        lbl = '(Ref {0})(z={1} m)'.format(vn, zk[k])
+        fig2 = addImagePlot( fig2, A[k,::-1,:], lbl, gridOn, limsOn )
+
+        if( saveOn ):
+          figname = 'RMSDiff_{}_z{}.jpg'.format(vn, int(zk[k]))
+          print(' Saving = {}'.format(figname))
+          fig.savefig( figname, format='jpg', dpi=150)
+          fig2.savefig( figname.replace("RMSDiff","Ref"), format='jpg', dpi=150)
+        plt.show()
+    A = B = dv = None
+  ds2.close()
 
-  if( mode == 'r' ):
-    dv = (v2x - v1x)/np.abs( v1x + 1E-5 )
-  elif( mode == 's' ):
-    dv = (v2x - v1x)/( vm1 + 1E-5 )
-    #print('max={}, std={}'.format(np.max(dv), np.std(dv)))
-    
-  elif( mode == 'd'):
-    dv = (v2x - v1x)
-    
-  else:
-    denom = v2x*v1x 
-    sgn = np.sign( denom )
-    d2  = ( sgn*(np.abs(denom) + 1E-4) ); denom = None; sgn = None 
-    dv  = (v2x - v1x)
-
-  idnn = ~(dv == np.nan )
-  N = len( np.ravel( dv[idnn] ) );# print(' N = {} '.format(N))
-  if( mode == 'n'):
-    RMSDiff  = np.sqrt( np.abs(np.sum(dv**2)/N * np.sum(d2**(-1))/N) )
-    SkewDiff = 0.
-  else:
-    RMSDiff  = np.sqrt(np.sum(dv**2)/N)
-    SkewDiff = (1./N)*np.sum(dv**3) * ( 1./(N-1.)*np.sum(dv**2) )**(-1.5) 
-  print(' RMS (d{}) = {}, Sk(d{}) = {} '.format( vn , RMSDiff, vn, SkewDiff ))
-  
   if( writeRMS ):
-    fout.write('{:.2f}\t{:.2e}\n'.format( z1[k1], RMSDiff ))
-
-
-  if( printOn ):
-    dimsf  = np.array( np.shape( dv ) )
-    xydims = dimsf
-    figDims = 13.*(xydims[::-1].astype(float)/np.max(xydims))
-    fig = plt.figure(num=1, figsize=figDims)
-    labelStr = '({0}_2 - {0}_1)(z={1} m)'.format(vn, z1[k1])
-    fig = addImagePlot( fig, dv[::-1,:], labelStr, gridOn, limsOn )
-    
-    fig2 = plt.figure(num=2, figsize=figDims)
-    lbl = '(Ref {0})(z={1} m)'.format(vn, z1[k1])
-    fig2 = addImagePlot( fig2, v1x[::-1,:], lbl, gridOn, limsOn )
-    
-    
-    #fig3 = plt.figure(num=3)
-    #plt.hist( np.ravel(dv[idnn]), bins=25, \
-    #  normed=True, log=True, histtype=u'bar', label=labelStr )
-    
-    if( saveOn ):
-      figname = 'RMSDiff_{}_z{}.jpg'.format(vn, int(z1[k1]))
-      print(' Saving = {}'.format(figname))
-      fig.savefig( figname, format='jpg', dpi=150)
-      fig2.savefig( figname.replace("RMSDiff","Ref"), format='jpg', dpi=150)
-      #fig3.savefig( figname.replace("RMSDiff","Hist"), format='jpg', dpi=150)
-    plt.show()
-
-if( writeRMS ): fout.close()
\ No newline at end of file
+    rmsName = 'RMS_d{}.dat'.format(vn)
+    if( len(args.filename2) > 1 ): rmsName = 'RMS_d{}_{}.dat'.format(vn, stem)
+    fout = open(rmsName, 'w')
+    fout.write('# file1 = {}, file2 = {}\n'.format(f1, f2))
+    fout.write('# z_coord \t RMS(d{})\n'.format(vn))
+    for k in xrange(len(zk)):
+      fout.write('{:.2f}\t{:.2e}\n'.format( zk[k], M['rms'][0,k] ))
+    fout.close()
+
+  tk = np.asarray( time1 )[tIds]
+  if( args.writeNetCdf ):
+    writeMetricsNetCdf( '{}{}_{}.nc'.format(args.outstr, vn, stem), tk, zk, M )
+  if( args.writeCsv ):
+    writeMetricsCsv( '{}{}_{}.csv'.format(args.outstr, vn, stem), tk, zk, M )
+
+ds1.close()
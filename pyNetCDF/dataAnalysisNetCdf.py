@@ -5,9 +5,13 @@ import argparse
 import matplotlib.pyplot as plt
 from plotTools import addToPlot
 from spectraTools import spectraAnalysis
-from netcdfTools import read3dDataFromNetCDF
+from netcdfTools import read3dDataFromNetCDF, netcdfDataset, coordinateDict, timeBlocksFromDataset
+from netcdfTools import readMaskFromDataset
 from analysisTools import sensibleIds, groundOffset, calc_ts_entropy_profile
+from analysisTools import streamedMoments, momentStatistics
+from cacheTools import rotationAngleField
 from utilities import filesFromList
+from catalogTools import filesFromCatalog
 ''' 
 Description: A script to perform quadrant analysis on velocity data stored in a NETCDF file.
 The analysis is performed for all points along a z-direction.
@@ -22,33 +26,87 @@ Author: Mikko Auvinen
 #==========================================================#
 
 def resample(X, n=None):
-  nt, nk, nj, ni = X.shape
-  Nn  = nt
+  # One set of random time indices for all points, gathered at once.
+  Nn = X.shape[0]
   if(n is None): n = Nn
   else:          n = min( n, Nn )
+  ix = np.random.randint( 0, Nn, n )
   
-  Xr = np.zeros( (n,nk,nj,ni) )
-  #print(' Resampled array size = {} '.format( Xr.shape ))
-  
-  for i in xrange(ni):
-    for j in xrange(nj):
-      for k in xrange(nk):
-        if(n is None): 
-          n = Nn
-        ix = np.floor(np.random.rand(n)*Nn).astype(int)
-        Xr[:,k,j,i] = X[ix,k,j,i]
+  return X[ix]
+
+#==========================================================#
+
+def resampleWeights( Nn, n=None ):
+  # Multiplicity of each time index in one resampling realization.
+  if(n is None): n = Nn
+  else:          n = min( n, Nn )
+  ix = np.random.randint( 0, Nn, n )
   
-  return Xr
+  return np.bincount( ix, minlength=Nn ).astype(float)
 
 #==========================================================#
 
+def varBlocks( vn, ds, cl ):
+  # Time blocks of vn with the (optional) mask of the file applied.
+  return timeBlocksFromDataset( vn, ds, cl, mask=maskM )
 
-def calc_skew( V, axs=(0) ):
-  import scipy.stats as st # contains st.entropy
-  V -= np.mean( V, axis=(0) )
-  vo = st.skew( V, axis=axs )
+#==========================================================#
+
+def derivedBlocks( derived, gu, gv ):
+  # Time blocks of derived(u, v) from the block generators of u and v.
+  for t1, t2, u in gu:
+    t1, t2, v = next( gv )
+    yield t1, t2, derived( u, v )
+
+#==========================================================#
+
+def derivedFunction( ds, VNU, cl ):
+  # The function f(u, v) of the derived horizontal wind variables.
+  if('MAG' in VNU ): # vr := Umag
+    return lambda u, v: np.sqrt( u**2 + v**2 )
   
-  return vo
+  # The mean wind direction: a first pass over u and v, unless cached.
+  # The angle is pointwise, so the mask (NaN points) does not affect it.
+  a  = rotationAngleField( ds.filepath(), cl )
+  ca = np.cos(a); sa = np.sin(a); a = None
+  if( 'U1' in VNU ):
+    return lambda u, v:  u * ca + v * sa
+  elif('U2' in VNU): # U2
+    return lambda u, v: -u * sa + v * ca
+  else:# direction
+    return lambda u, v: np.arctan( v/(u+1.e-5) ) * (180./np.pi)
+
+#==========================================================#
+
+def variableMoments( ds, VNU, varname, cl, wList ):
+  '''
+  Streamed statistics of the (derived) variable over time blocks.
+  Returns a list of statistics dicts, one per entry of wList.
+  '''
+  if('MAG' in VNU or 'U1' in VNU or 'U2' in VNU or 'DIR' in VNU):
+    derived = derivedFunction( ds, VNU, cl )
+    blocks = derivedBlocks( derived, varBlocks('u', ds, cl),\
+      varBlocks('v', ds, cl) )
+    return [ momentStatistics( S ) for S in streamedMoments( blocks, wList ) ]
+
+  elif('TKE' in VNU):
+    # e_res = 0.5*(var(u)+var(v)+var(w)); the time statistics are those of e_sgs.
+    eres = [ 0. ]*len(wList)
+    for vn in ['u','v','w']:
+      for i, S in enumerate( streamedMoments( varBlocks(vn, ds, cl), wList ) ):
+        eres[i] = eres[i] + 0.5*momentStatistics( S )['var']
+    if( 'e' in ds.variables.keys() ):
+      sList = [ momentStatistics( S ) for S in streamedMoments( varBlocks('e', ds, cl), wList ) ]
+    else:
+      print(' No e_sgs -> Result is RESOLVED TKE! ')
+      sList = [ dict( (k, np.zeros_like(e)) for k in ['mean','var','std','skew','kurt'] ) for e in eres ]
+    for sd, e in zip( sList, eres ):
+      sd['mean'] = sd['mean'] + e
+    return sList
+
+  else:
+    blocks = varBlocks( varname, ds, cl )
+    return [ momentStatistics( S ) for S in streamedMoments( blocks, wList ) ]
 
 #==========================================================#
 sepStr = ' # = # = # = # = # = # = # = # = '
@@ -58,8 +116,8 @@ parser.add_argument("fileKey", default=None,\
 parser.add_argument("-v", "--varname",  type=str, default='u',\
   help="Name of the variable in NETCDF file. Default='u' ")
 parser.add_argument("-m", "--mode", type=str, default='mean', \
-  choices=['mean', 'std', 'var','skew','entropy'],\
-  help="Mode: mean, std, var, or entropy.")
+  choices=['mean', 'std', 'var','skew','kurt','entropy'],\
+  help="Mode: mean, std, var, skew, kurt or entropy.")
 parser.add_argument("-rs", "--resample", action="store_true", default=False,\
   help="Include resampling of the time series.")
 parser.add_argument("-Ns", "--Nsample", type=int, default=None,\
@@ -76,6 +134,10 @@ parser.add_argument("-wa", "--writeAscii", action="store_true", default=False,\
   help="Save profile data to an ascii file.")
 parser.add_argument("-c", "--coarse", type=int, default=1,\
   help="Coarsening level. Int > 1.")
+parser.add_argument("-mk", "--mask", action="store_true", default=False,\
+  help="Exclude the points where the mask variable of the file is 0 (see syncMaskWithNetCdf.py).")
+parser.add_argument("-db", "--database", type=str, default=None,\
+  help="Select all files that contain the variable via an SQLite catalog (see catalogNetCdf.py).")
 args = parser.parse_args()    
 #==========================================================# 
 # Rename ...
@@ -94,111 +156,82 @@ writeAscii  = args.writeAscii
 
 
 # Obtain a list of files to include.
-fileNos, fileList = filesFromList( fileKey+'*' )
+if( args.database ):
+  # The derived variables (U1, Umag, TKE, ...) are computed from u.
+  cVar = varname
+  if( any( s in varname.upper() for s in ['MAG','U1','U2','DIR','TKE'] ) ): cVar = 'u'
+  fileNos, fileList = filesFromCatalog( args.database, fileKey+'*', cVar )
+else:
+  fileNos, fileList = filesFromList( fileKey+'*' )
 
 fig = plt.figure(num=1, figsize=(12,10))
+maskM = None
 
 for fn in fileNos:
   VNU = varname.upper()
-  if('MAG' in VNU or 'U1' in VNU or 'U2' in VNU or 'DIR' in VNU):
-    dataDict = read3dDataFromNetCDF( fileList[fn] , 'u', cl )
-    u = dataDict['v']
-    dataDict = read3dDataFromNetCDF( fileList[fn] , 'v', cl )
-    v = dataDict['v']
-    
-    if('MAG' in VNU ): # vr := Umag
-      vr = np.sqrt( u**2 + v**2 ); u = None; v = None
+  
+  # A 2D mask is broadcast along z at read time, without a dense copy.
+  # It is applied by varBlocks and, in the entropy mode, to the data read at once.
+  if( args.mask ):
+    ds, varList, paramList = netcdfDataset( fileList[fn] )
+    maskM = readMaskFromDataset( ds )[::cl,::cl,::cl]
+    ds.close()
+  
+  if( mode == 'entropy' ):
+    # The entropy needs the whole time series.
+    if('MAG' in VNU or 'U1' in VNU or 'U2' in VNU or 'DIR' in VNU):
+      ds, varList, paramList = netcdfDataset( fileList[fn] )
+      dataDict = coordinateDict( 'u', ds, cl )
+      f = derivedFunction( ds, VNU, cl )
+      vr = np.concatenate( [ X for t1, t2, X in derivedBlocks( f,\
+        varBlocks('u', ds, cl), varBlocks('v', ds, cl) ) ], axis=0 )
+      ds.close()
     else:
-      um = np.mean( u, axis=(0) ); vm = np.mean( v, axis=(0) )
-      a  = np.arctan( vm/(um+1.e-5) ); um = None; vm = None 
-      if( 'U1' in VNU ):
-        vr = u * np.cos(a) + v * np.sin(a)
-      elif('U2' in VNU): # U2
-        vr =-u * np.sin(a) + v * np.cos(a)
-      else:# direction
-        vr = np.arctan( v/(u+1.e-5) ) * (180./np.pi)
+      dataDict = read3dDataFromNetCDF( fileList[fn] , varname, cl )
+      vr = dataDict['v']
+      if( maskM is not None ):
+        vr = np.ma.filled( np.ma.asarray( vr, dtype=float ), np.nan )
+        vr[:, maskM == 0] = np.nan
+    x  = dataDict['x']; y = dataDict['y']; z = dataDict['z']
+    time = dataDict['time']
+    dataDict = None
+    if( resampleOn ): vr2 = resample( vr, Ns )
     
-  elif('TKE' in VNU):
-    try:
-      dataDict = read3dDataFromNetCDF( fileList[fn] , 'e', cl )
-      e_sgs = dataDict['v']
-    except:
-      print(' No e_sgs -> Result is RESOLVED TKE! ')
-      e_sgs = None
-    dataDict = read3dDataFromNetCDF( fileList[fn] , 'u', cl )
-    u = dataDict['v']; up=u-np.mean(u, axis=0); u = None
-    dataDict = read3dDataFromNetCDF( fileList[fn] , 'v', cl )
-    v = dataDict['v']; vp=v-np.mean(v, axis=0); v = None
-    dataDict = read3dDataFromNetCDF( fileList[fn] , 'w', cl )
-    w = dataDict['v']; wp=w-np.mean(w, axis=0); w = None 
-    
-    e_res = 0.5*(np.mean(up**2,axis=0)+np.mean(vp**2,axis=0)+np.mean(wp**2,axis=0))
-    up = None; vp = None; wp = None 
-    
-    # vr := TKE
-    vr = e_res
-    if( e_sgs is not None ): vr += e_sgs
+    nbins=24
+    Bs = np.logspace(-0.75, 0.8, nbins, endpoint=True); Bs[-1] = 9.0
     
-  else:
-    dataDict = read3dDataFromNetCDF( fileList[fn] , varname, cl )
-    vr = dataDict['v']
+    vp = calc_ts_entropy_profile(vr, z, alpha=1., nbins=Bs); zp = z
+    if( resampleOn ): vp2 = calc_ts_entropy_profile( vr2, z )
+    plotStr  = ["entropy({}) vs z ".format(varname), varname ,"z"]
+    vr = None; vr2 = None
   
-  x  = dataDict['x']; y = dataDict['y']; z = dataDict['z']
-  time = dataDict['time']
-  dataDict = None
-  axs = (0,2,3)
-  axs = (0)
-
-  if( resampleOn ):
-    vr2 = resample( vr, Ns )
   else:
-    vr2 = None
-
-  
-  # Process data vr --> vp 
-  if( mode == 'mean'):
-    vp  = np.mean( vr, axis=axs ); zp = z
-    if( vr2 is not None ): vp2 = np.mean( vr2, axis=axs )
-    plotStr  = ["mean({}) vs z ".format(varname), varname ,"z"]
-
-  elif( mode == 'std'):
-    vp  = np.std( vr, axis=axs ); zp = z
-    if( vr2 is not None ): vp2 = np.std( vr2, axis=axs ) 
+    # Streamed over time blocks. Resampling draws the time indices once.
+    ds, varList, paramList = netcdfDataset( fileList[fn] )
+    if( 'MAG' in VNU or 'U1' in VNU or 'U2' in VNU or 'DIR' in VNU or 'TKE' in VNU ): vc = 'u'
+    else: vc = varname
+    dataDict = coordinateDict( vc, ds, cl )
+    x  = dataDict['x']; y = dataDict['y']; z = dataDict['z']
+    time = dataDict['time']
+    dataDict = None
+    
+    wList = [None]
+    if( resampleOn ): wList.append( resampleWeights( len(time), Ns ) )
+    sList = variableMoments( ds, VNU, varname, cl, wList )
+    ds.close()
     
-    if(meanErrorOn):
-      N = len( vr[:,0,0,0] )
+    vp = sList[0][mode]; zp = z
+    if( resampleOn ): vp2 = sList[1][mode]
+    plotStr  = ["{}({}) vs z ".format(mode, varname), varname ,"z"]
+    
+    if( mode == 'std' and meanErrorOn ):
+      N = len( time )
       vmerr = vp/np.sqrt(N)
       if( len(vmerr.shape)  == 3 ): vmerr  = vmerr[:,0,0]
       plotStr  = ["std. error of mean({}) vs z ".format(varname), varname ,"z"]
       fig = addToPlot(fig, vmerr, zp,'{}({}), {}'\
         .format('std error of mean',varname,fileList[fn].split('_')[-1]), plotStr, False )
-    
-      '''
-      N2 = len( vr2[:,0,0,0] )
-      vmerr2 = vp2/np.sqrt(N2)
-      if( len(vmerr2.shape) == 3 ): vmerr2 = vmerr2[:,0,0]
-      fig = addToPlot(fig, vmerr2, zp,'{}({}), {}'\
-      .format('std error of mean',varname,fileList[fn]), plotStr, False )
-      '''
-    plotStr  = ["std({}) vs z ".format(varname), varname ,"z"]
-    
-  elif( mode == 'var' ):
-    vp  = np.var( vr, axis=axs ); zp = z
-    if( vr2 is not None ): vp2 = np.var( vr2, axis=axs )
-    plotStr  = ["var({}) vs z ".format(varname), varname ,"z"]
-  
-  elif( mode == 'entropy' ):
-    nbins=24
-    Bs = np.logspace(-0.75, 0.8, nbins, endpoint=True); Bs[-1] = 9.0
-    
-    vp = calc_ts_entropy_profile(vr, z, alpha=1., nbins=Bs); zp = z
-    if( vr2 is not None ): vp2 = calc_ts_entropy_profile( vr2, z )
-    plotStr  = ["entropy({}) vs z ".format(varname), varname ,"z"]
-  
-  elif( mode == 'skew' ):
-    vp = calc_skew( vr, axs ); zp = z
-    if( vr2 is not None ): vp2 = calc_skew( vr2, axs )
-    plotStr  = ["skew({}) vs z ".format(varname), varname ,"z"]
+      plotStr  = ["std({}) vs z ".format(varname), varname ,"z"]
 
 # ================================================================= #
 
@@ -215,13 +248,13 @@ for fn in fileNos:
     np.savetxt(varname+'_'+mode+'_'+fstr+'.dat', np.c_[zp, vp], header=hStr)
 
   
-  if( vr2 is not None ):
+  if( resampleOn ):
     if( len(vp2.shape) == 3 ): vp2 = vp2[:,1,1]
   
   fig = addToPlot(fig, vp,  zp,' {}({}), {}, N = {}'\
     .format(mode,varname,fileList[fn].split('_')[-1], len(time)), plotStr, False )
   
-  if( vr2 is not None ):
+  if( resampleOn ):
     fig = addToPlot(fig, vp2, zp,' {}({}), {}, Resampled with N = {}'\
       .format(mode,varname,fileList[fn].split('_')[-1], Ns), plotStr, False )
     fig = addToPlot(fig, np.abs(vp-vp2), zp,' {}({}), {}, Resampling error = |(v_o-v_rs)/v_o|'\
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+from netcdfTools import *
+import sys
+import argparse
+import numpy as np
+from analysisTools import entropyFields
+from utilities import filesFromList, writeLog, slabMap
+'''
+Description: Shannon/Renyi entropy fields of the time series at every
+grid point of NETCDF data, and optionally their KL/Renyi divergences
+against the same variable in a reference file (e.g. another run on the
+same grid). The data is processed in z-slabs (all times), optionally in
+parallel, and the (z,y,x) fields are written into a NETCDF file.
+
+Author: Mikko Auvinen
+        mikko.auvinen@helsinki.fi
+        University of Helsinki &
+        Finnish Meteorological Institute
+'''
+
+#==========================================================#
+
+def alphaStr( a ):
+  # 1.0 -> '1', 0.5 -> '0p5' for the variable names.
+  return '{:g}'.format(a).replace('.','p')
+
+#==========================================================#
+
+def entropySlab( task ):
+  filename, fileref, vn, cl, k1, k2, alphas, nbins, edges = task
+  ds = nc.Dataset( filename )
+  X = ds.variables[vn][:, k1*cl:k2*cl:cl, ::cl, ::cl]
+  ds.close()
+  Xr = None
+  if( fileref is not None ):
+    dr = nc.Dataset( fileref )
+    Xr = dr.variables[vn][:, k1*cl:k2*cl:cl, ::cl, ::cl]
+    dr.close()
+
+  return k1, k2, entropyFields( X, alphas, nbins, edges, Xr )
+
+#==========================================================#
+parser = argparse.ArgumentParser(prog='entropyNetCdf.py')
+parser.add_argument("fileKey", default=None,\
+  help="Search string for collecting files.")
+parser.add_argument("-o", "--outstr",type=str, default="ENT_",\
+  help="Prefix for the output NETCDF file. Default=ENT_.")
+parser.add_argument("-vn", "--varnames",type=str, nargs='+', default=['u'],\
+  help="Names of the variables. Default = ['u'].")
+parser.add_argument("-a", "--alphas",type=float, nargs='+', default=[1.],\
+  help="Entropy orders: 1 = Shannon/Kullback-Leibler, other = Renyi. Default = [1].")
+parser.add_argument("-nb", "--nbins", type=int, default=16,\
+  help="Number of histogram bins. Default = 16.")
+parser.add_argument("-e", "--edges", type=str, default='column', choices=['column','shared'],\
+  help="Bin range per time series (column) or one for all (shared). Default = column.")
+parser.add_argument("-rf", "--fileref", type=str, default=None,\
+  help="Reference NETCDF file (same grid) for the divergences. Default = None.")
+parser.add_argument("-nw", "--nWorkers", type=int, default=1,\
+  help="Number of processes computing the slabs. Default = 1.")
+parser.add_argument("-nz", "--nzSlab", type=int, default=None,\
+  help="Number of z-levels per slab. Default: chosen from the data size.")
+parser.add_argument("-c", "--coarse", type=int, default=1,\
+  help="Coarsening level. Int > 1. Default = 1.")
+args = parser.parse_args()
+writeLog( parser, args )
+#==========================================================#
+# Initial renaming operations and variable declarations
+
+fileKey    = args.fileKey
+outstr     = args.outstr
+varnames   = args.varnames
+alphas     = args.alphas
+cl         = abs(int(args.coarse))
+
+parameter = True;  variable = False
+
+
+# Obtain a list of files to include.
+fileNos, fileList = filesFromList( fileKey+'*' )
+for fn in fileNos:
+
+  fileout = outstr+fileList[fn].split('_')[-1]
+  parameter = True
+
+  # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+  # Create a NETCDF output dataset (dso) for writing out the data.
+  dso = netcdfOutputDataset( fileout )
+  ds, varList, paramList = netcdfDataset( fileList[fn] )
+
+  for vn in varnames:
+    dataDict = coordinateDict( vn, ds, cl )
+
+    if( parameter ):
+      x = dataDict['x']; y = dataDict['y']; z = dataDict['z']
+      time_dim = len( dataDict['time'] )
+
+      xv = createNetcdfVariable( dso, x   , 'x'   , len(x)   , 'm', 'f4', ('x',)   , parameter )
+      yv = createNetcdfVariable( dso, y   , 'y'   , len(y)   , 'm', 'f4', ('y',)   , parameter )
+      zv = createNetcdfVariable( dso, z   , 'z'   , len(z)   , 'm', 'f4', ('z',)   , parameter )
+      nz = len(z); nxy = len(x)*len(y)
+      x = None; y = None; z = None
+
+      parameter = False
+
+    dataDict = None
+
+    voDict = dict()
+    for a in alphas:
+      voDict['S',a] = createEmptyNetcdfVariable( dso, 'S{}_a{}'.format(vn, alphaStr(a)), '[-]', 'f4', ('z','y','x',) )
+      if( args.fileref is not None ):
+        voDict['D',a] = createEmptyNetcdfVariable( dso, 'D{}_a{}'.format(vn, alphaStr(a)), '[-]', 'f4', ('z','y','x',) )
+
+    nzs = args.nzSlab
+    if( nzs is None ): nzs = zSlabSize( time_dim, nxy )
+    tasks = ( (fileList[fn], args.fileref, vn, cl, k1, min(k1+nzs, nz), alphas, args.nbins, args.edges)\
+      for k1 in xrange(0, nz, nzs) )
+
+    for k1, k2, R in slabMap( entropySlab, tasks, args.nWorkers ):
+      for key in R.keys():
+        for a in R[key].keys():
+          voDict[key,a][k1:k2, :, :] = R[key][a].astype( np.float32 )
+
+    print(' Entropies of {} computed in slabs of {} z-levels.'.format(vn, nzs))
+
+  ds.close()
+  netcdfWriteAndClose( dso )
+
+print(' Done! ')
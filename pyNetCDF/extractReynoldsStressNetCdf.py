@@ -4,6 +4,7 @@ import sys
 import argparse
 import numpy as np
 from utilities import filesFromList, writeLog
+from cacheTools import timeMeanField, rotationAngleField
 ''' 
 Description:
 
@@ -69,8 +70,10 @@ for fn in fileNos:
   
   if( notPrimes ):
     # Perform coord. rotation for horizontal components
-    um = np.mean( up, axis=(0) ); vm = np.mean( vp , axis=(0) )
-    a  = np.arctan( vm/(um+1.e-5) )
+    # The means and the angle are cached on disk (cacheTools) for reuse.
+    um = timeMeanField( fileList[fn], vnames[0], cl )
+    vm = timeMeanField( fileList[fn], vnames[1], cl )
+    a  = rotationAngleField( fileList[fn], cl, vnames[0], vnames[1] )
     u1  = up * np.cos(a) + vp * np.sin(a)  # Streamwise comp.
     v1  =-up * np.sin(a) + vp * np.cos(a)  # Spanwise comp.
     up = u1; vp = v1
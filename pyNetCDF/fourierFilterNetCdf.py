@@ -3,12 +3,12 @@ from netcdfTools import *
 import sys
 import argparse
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.fftpack import rfft, irfft, fftfreq
-from utilities import filesFromList, writeLog
+from utilities import filesFromList, writeLog, slabMap
 ''' 
-Description:
-
+Description: Temporal Fourier filtering of NETCDF data. The variables are
+processed in z-slabs (all times) which are filtered in parallel worker
+processes and written straight into the output file, so the memory use is
+bounded by the slab size.
 
 Author: Mikko Auvinen
         mikko.auvinen@helsinki.fi 
@@ -16,6 +16,48 @@ Author: Mikko Auvinen
         Finnish Meteorological Institute
 '''
 
+#==========================================================#
+
+def spectralWindow( freq, lowfreq, highfreq=None, window='box' ):
+  '''
+  Frequency response on the rfft frequencies: a box or Gaussian band-pass
+  between lowfreq and highfreq. lowfreq=0 gives a low-pass and
+  highfreq=None a high-pass filter.
+  '''
+  f = np.abs( freq )
+  W = np.ones( len(f) )
+  if( window == 'box' ):
+    W[ f < lowfreq ] = 0.
+    if( highfreq is not None ): W[ f > highfreq ] = 0.
+  elif( window == 'gauss' ):
+    if( lowfreq > 0. ): W *= 1. - np.exp( -0.5*(f/lowfreq)**2 )
+    if( highfreq is not None ): W *= np.exp( -0.5*(f/highfreq)**2 )
+  else:
+    sys.exit(' Error: unknown spectral window {}.'.format(window))
+  
+  return W
+
+#==========================================================#
+
+def filterSlab( task ):
+  '''
+  Filter the z-slab k1:k2 of variable vn along time. The mean removed by
+  the window (W[0] < 1) is added back, as in the unblocked version.
+  '''
+  filename, vn, cl, k1, k2, W = task
+  ds = nc.Dataset( filename )
+  X = ds.variables[vn][:, k1*cl:k2*cl:cl, ::cl, ::cl]
+  ds.close()
+  X = np.ma.filled( np.ma.asarray( X, dtype=float ), 0. )
+  nt = X.shape[0]
+  Xm = np.mean( X, axis=0 )
+  F = np.fft.rfft( X, axis=0 ); X = None
+  F *= W[:,None,None,None]
+  Y = np.fft.irfft( F, n=nt, axis=0 ); F = None
+  Y += (1.-W[0])*Xm
+  
+  return k1, k2, Y.astype( np.float32 )
+
 #==========================================================#
 parser = argparse.ArgumentParser(prog='fourierFilterNetCdf.py')
 parser.add_argument("fileKey", default=None,\
@@ -28,6 +70,14 @@ parser.add_argument("-vc", "--varcopy",type=str, nargs='+', default=None,\
   help="Names of the variables which copied to the output file without filtering.")
 parser.add_argument("-lf", "--lowfreq", type=float, default=0.01,\
   help="Low frequency cutoff. FFT coefs will be zeroed for frequecies below this value.")
+parser.add_argument("-hf", "--highfreq", type=float, default=None,\
+  help="High frequency cutoff for a band-pass (or low-pass with -lf 0). Default = None.")
+parser.add_argument("-w", "--window", type=str, default='box', choices=['box','gauss'],\
+  help="Spectral window: sharp box or Gaussian edges. Default = box.")
+parser.add_argument("-nw", "--nWorkers", type=int, default=1,\
+  help="Number of processes filtering the slabs. Default = 1.")
+parser.add_argument("-nz", "--nzSlab", type=int, default=None,\
+  help="Number of z-levels per slab. Default: chosen from the data size.")
 parser.add_argument("-c", "--coarse", type=int, default=1,\
   help="Coarsening level. Int > 1. Default = 1.")
 args = parser.parse_args()
@@ -61,60 +111,50 @@ for fn in fileNos:
   # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
   # Create a NETCDF output dataset (dso) for writing out the data.
   dso = netcdfOutputDataset( fileout )
+  ds, varList, paramList = netcdfDataset( fileList[fn] )
 
   for vn in varnames:
-    # Read in data.
-    dataDict = read3dDataFromNetCDF( fileList[fn] , vn, cl )
-    vp = dataDict['v']
-    
+    dataDict = coordinateDict( vn, ds, cl )
     
     if( parameter ):
       # Coords and time:
       x = dataDict['x']; y = dataDict['y']; z = dataDict['z']
       time = dataDict['time']; time_dim = len(time)
       
-    dataDict = None
-
-
-    if( parameter ):
       # Create the output independent variables right away and empty memory.
       tv = createNetcdfVariable( dso, time,'time', time_dim,'s','f4',('time',), parameter )
 
       xv = createNetcdfVariable( dso, x   , 'x'   , len(x)   , 'm', 'f4', ('x',)   , parameter )
-      x = None
-
       yv = createNetcdfVariable( dso, y   , 'y'   , len(y)   , 'm', 'f4', ('y',)   , parameter )
-      y = None
-
       zv = createNetcdfVariable( dso, z   , 'z'   , len(z)   , 'm', 'f4', ('z',)   , parameter )
-      z = None
+      nz = len(z); nxy = len(x)*len(y)
+      x = None; y = None; z = None
       
       parameter = False
       
-    # If our original signal time was in seconds, this is now in Hz    
-    vfreq = fftfreq(len(vp[:,10,0,0]), d=time[1]-time[0])
-    
-    Fvp = rfft(vp, axis=(0))
-    Fvp[(np.abs(vfreq)<lowfreq),:,:,:] = 0   # Filter step.
-    vpf = irfft(Fvp, axis=(0)) + np.mean( vp, axis=(0) )
-    Fvp = None 
+    dataDict = None
     
-    '''
-    plt.figure(1)
-    vm = np.mean( vp[:,10,0,0] )
-    plt.plot(time,vp[:,10,0,0],'b', time, vm+vpf[:,10,0,0],'r')
+    # If our original signal time was in seconds, this is now in Hz.
+    # The window is computed once and reused for all slabs.
+    vfreq = np.fft.rfftfreq( time_dim, d=time[1]-time[0] )
+    W = spectralWindow( vfreq, lowfreq, args.highfreq, args.window )
     
-    plt.figure(2)
-    plt.semilogy(vfreq, Fvp[:,0,0,0]); plt.show()
-    '''
+    nzs = args.nzSlab
+    if( nzs is None ): nzs = zSlabSize( time_dim, nxy, 2**24 )
+    tasks = ( (fileList[fn], vn, cl, k1, min(k1+nzs, nz), W) for k1 in xrange(0, nz, nzs) )
     
     # Filtered value:
-    voDict[vn] = createNetcdfVariable(\
-      dso, vpf, vn, time_dim, '[-]', 'f4',('time','z','y','x',) , variable )
+    voDict[vn] = createEmptyNetcdfVariable( dso, vn, '[-]', 'f4', ('time','z','y','x',) )
+    for k1, k2, Y in slabMap( filterSlab, tasks, args.nWorkers ):
+      voDict[vn][:, k1:k2, :, :] = Y
+    
+    print(' {} filtered in slabs of {} z-levels.'.format(vn, nzs))
 
 
     # - - - - Done , finalize the output - - - - - - - - - -
   
+  ds.close()
+  if( varcopy is None ): varcopy = []
   for vc in varcopy:
     dataDict = read3dDataFromNetCDF( fileList[fn] , vc, cl )
     vpc = dataDict['v']
@@ -128,4 +168,4 @@ for fn in fileNos:
     
   netcdfWriteAndClose( dso )
   
-print(' Done! ')
\ No newline at end of file
+print(' Done! ')
@@ -8,8 +8,20 @@ from mapTools import readNumpyZTile
 '''
 Description:
 Merges given NetCDF files together.
+The variables are copied chunk by chunk with their chunk shapes, filters and
+attributes. With -nw the deflated variables are compressed chunk-wise in
+parallel processes and the compressed chunks are written directly (h5py).
 '''
 
+#==========================================================#
+
+def parallelCopyOk(vin, vout, dso):
+  # Direct chunk writing needs a deflated, chunked, fixed-size numeric variable.
+  flt = vout.filters() or dict()
+  return ( flt.get('zlib', False) and not flt.get('fletcher32', False) and\
+    vout.chunking() != 'contiguous' and vin.dtype.kind in 'biuf' and\
+    not any( dso.dimensions[d].isunlimited() for d in vout.dimensions ) )
+
 #==========================================================#
 parser = argparse.ArgumentParser(prog='mergeNetCdfFiles.py')
 parser.add_argument("-f", "--files", metavar='FILES', type=str, nargs='+', default=None,
@@ -18,15 +30,25 @@ parser.add_argument("-fo", "--fileout", type=str,
                     help="Name of the output netCDF file. The script append to the file if it already exists.")
 parser.add_argument("-c", "--compress", help="Compress netCDF variables with zlib.",
                     action="store_true", default=False)
+parser.add_argument("-cl", "--complevel", type=int, default=4,
+                    help="Compression level with -c. Default=4.")
+parser.add_argument("-ck", "--chunks", type=str, default='keep', choices=['keep', 'auto'],
+                    help="Keep the source chunk shapes or let netCDF choose them. Default=keep.")
+parser.add_argument("-nw", "--nWorkers", type=int, default=1,
+                    help="Number of processes compressing the variables. Default=1.")
 args = parser.parse_args()
 #==========================================================#
 
-'''
-Establish two boolean variables which indicate whether the created variable is an
-independent or dependent variable in function createNetcdfVariable().
-'''
-parameter = True
-variable = False
+nWorkers = args.nWorkers
+if( nWorkers > 1 ):
+  try:
+    import h5py
+  except ImportError:
+    print(' h5py not available. Compressing serially.'); nWorkers = 1
+
+# zlib=None keeps the source filters.
+zlib = None
+if( args.compress ): zlib = True
 
 # Append or create new
 dso = netcdfOutputDataset(args.fileout, 'w')
@@ -37,15 +59,18 @@ print(' Reading parameters from {}...'.format(args.files[0]))
 paramLengths = {}
 matchGrid = ['x', 'y']
 for p_name in paramList:
-  p_arr = ds.variables[p_name]
-  paramLengths[p_name] = len(p_arr)
-  pv = createNetcdfVariable(dso, p_arr[:], p_name, len(
-      p_arr), p_arr.units, p_arr.dtype, p_arr.dimensions, parameter, zlib=args.compress)
+  paramLengths[p_name] = len(ds.dimensions[p_name])
+  dso.createDimension(p_name, paramLengths[p_name])
+  if( p_name in ds.variables ):
+    p_arr = ds.variables[p_name]
+    pv = createVariableLike(dso, p_arr, zlib=zlib, complevel=args.complevel, chunks=args.chunks)
+    copyNetcdfVariable(p_arr, pv)
   p_arr = None
 ds.close()
 print(' ...done.')
 
 savedVars = []
+parallelJobs = []
 for filename in args.files:
   # Create a data group for individual data sets
   print(' Processing file {}...'.format(filename))
@@ -63,13 +88,19 @@ for filename in args.files:
       if v_name in savedVars:
           sys.exit(' Error: Variable \'{}\' already saved.'.format(v_name))
       savedVars.append(v_name)
-      vartype = variable
       v_arr = ds.variables[v_name]
-      vv = createNetcdfVariable(dso, v_arr[:], v_name, len(
-          v_arr), v_arr.units, v_arr.dtype, v_arr.dimensions, vartype, zlib=args.compress)
+      vv = createVariableLike(dso, v_arr, zlib=zlib, complevel=args.complevel, chunks=args.chunks)
       if (v_name=='buildings_0'):
           vv.lod=2
           print("vv.lod")
+      if( nWorkers > 1 and parallelCopyOk(v_arr, vv, dso) ):
+          parallelJobs.append( (filename, v_name) )
+      else:
+          copyNetcdfVariable(v_arr, vv)
+          print(' {} copied.'.format(v_name))
       v_arr = None
   ds.close()
 netcdfWriteAndClose(dso)
+
+if( len(parallelJobs) > 0 ):
+  writeCompressedChunks(args.fileout, parallelJobs, nWorkers)
@@ -35,6 +35,9 @@ parser.add_argument("-dd", "--decompOnly", help="Output V_m and V^prime componen
   action="store_true", default=False)
 parser.add_argument("-c", "--coarse", help="Coarsening level for the NETCDF data. Int > 1.",\
   type=int, default=1) 
+parser.add_argument("-mm", "--maskMode", type=str, default='3d', choices=['3d','2d','packed'],\
+  help="Store the mask as a dense m(z,y,x), as a 2D m(y,x) broadcast along z by readers,"\
+  " or bit-packed 2D. Default=3d.")
 args = parser.parse_args()
 writeLog( parser, args )
 #==========================================================#
@@ -70,16 +73,16 @@ Read cell center coordinates and time.
 Create the output independent variables right away and empty memory.
 '''
 
-time, time_dims = read1DVariableFromDataset('time', ds, paramList, 0, 0, 1 ) # All values.
+time, time_dims = read1DVariableFromDataset('time', ds, 0, 0, 1 ) # All values.
 tv = createNetcdfVariable( dso, time,'time', len(time),'s','f4',('time',), parameter )
 time = None  
 
-x, x_dims = read1DVariableFromDataset( 'x',ds, paramList, 0, 0, cl ) # All values.
+x, x_dims = read1DVariableFromDataset( 'x',ds, 0, 0, cl ) # All values.
 print(' x_dims = {} '.format(x_dims))
 x[np.isnan(x)] = 0.  # Special treatment.
 xv = createNetcdfVariable( dso, x   , 'x'   , len(x)   , 'm', 'f4', ('x',)   , parameter )
 
-y, y_dims = read1DVariableFromDataset( 'y',ds, paramList, 0, 0, cl )
+y, y_dims = read1DVariableFromDataset( 'y',ds, 0, 0, cl )
 print(' y_dims = {} '.format(y_dims))
 y[np.isnan(y)] = 0.  # Special treatment.
 yv = createNetcdfVariable( dso, y   , 'y'   , len(y)   , 'm', 'f4', ('y',)   , parameter )
@@ -88,13 +91,13 @@ yv = createNetcdfVariable( dso, y   , 'y'   , len(y)   , 'm', 'f4', ('y',)   , p
 xb, yb, dx, dy = domainBoundsAndResolution( x, y )
 x = None; y = None # Clear memory ASAP.
 
-z, z_dims = read1DVariableFromDataset( 'z',ds, paramList, 0, 0, cl )
+z, z_dims = read1DVariableFromDataset( 'z',ds, 0, 0, cl )
 print(' z_dims = {} '.format(z_dims))
 zv = createNetcdfVariable( dso, z   , 'z'   , len(z)   , 'm', 'f4', ('z',)   , parameter )
 z = None
 
-# - - - - First, read u-component - - - - - - - - - -
-u, u_dims = read3DVariableFromDataset( 'u', ds, varList, 0, 0, cl ) # All values.
+# - - - - Dimensions of the (coarsened) u-component - - - - - - - - - -
+u_dims = np.array([ len(xrange(0, n, c)) for n, c in zip( ds.variables['u'].shape, [1,cl,cl,cl] ) ])
 print(' u_dims = {} '.format(u_dims))
 yx_dims = np.array(u_dims[2:])
 z_dim   = u_dims[1]; t_dim = u_dims[0]
@@ -132,38 +135,25 @@ print(' irx = {}, iry = {}'.format(irx, jry))
 # Create sub-region of the raster domain. This should match the NETCDF yx-domain.
 Rsub = R[jry[0]:jry[1]:clr, irx[0]:irx[1]:clr]
 Rsub_dims = np.shape( Rsub )
-if( not (yx_dims==(Rsub_dims)).all ):
+if( not (yx_dims==(Rsub_dims)).all() ):
   print(' xy-dimensions do not match: nc={} vs. r={}. Exiting ...'.format(yx_dims, Rsub_dims))
   sys.exit(1)
 
 
-# Create mask array m(z,y,x)
-m = np.zeros( u_dims[1:], 'uint8') # u_dims[1:] := (z_dim, y_dim, x_dim)
-
-# Copy raster data onto each z-plane. NOTE: y-direction is reversed.
-for i in xrange(z_dim):
-  m[i,:,:] = Rsub[::-1,:]
-
 # The mask data R, by default, may contain values 0 and >0. It has to be converted into
-# a proper mask data [0,1]:
-m[m>0] = 1 
-
-mv = createNetcdfVariable( dso, m, 'mask', 1,      ' ',   'i4',('z','y','x',) , variable )
-m = None
-
-# To finalize, the NETCDF variables need to be copied to the new file.
-
-uv = createNetcdfVariable( dso, u, 'u', t_dim, 'm/s', 'f4',('time','z','y','x',) , variable )
-u  = None
-
-v, v_dims = read3DVariableFromDataset( 'v', ds, varList, 0, 0, cl ) # All values.
-vv = createNetcdfVariable( dso, v, 'v', t_dim, 'm/s', 'f4',('time','z','y','x',) , variable )
-v  = None
-
-w, w_dims = read3DVariableFromDataset( 'w', ds, varList, 0, 0, cl ) # All values.
-wv = createNetcdfVariable( dso, w, 'w', t_dim, 'm/s', 'f4',('time','z','y','x',) , variable )
-w  = None
+# a proper mask data [0,1]. NOTE: y-direction is reversed.
+m2 = ( Rsub[::-1,:] > 0 ).astype('uint8')
+writeMaskVariable( dso, m2, z_dim, args.maskMode )
+m2 = None
+
+# To finalize, the NETCDF variables are copied to the new file time block by time block.
+for vn in ['u','v','w']:
+  vo = createEmptyNetcdfVariable( dso, vn, 'm/s', 'f4', ('time','z','y','x',) )
+  for t1, t2, X in timeBlocksFromDataset( vn, ds, cl ):
+    vo[t1:t2,:,:,:] = X
+  print(' {} copied in time blocks.'.format(vn))
 
 # - - - - Done , finalize the output - - - - - - - - - -
 
+ds.close()
 netcdfWriteAndClose( dso )
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+from netcdfTools import *
+import sys
+import argparse
+import numpy as np
+from analysisTools import waveletPacketProfile
+from utilities import writeLog, slabMap
+'''
+Description: Wavelet packet analysis of the time series at all (y,x)
+points of each z-level of NETCDF data. The band energies averaged over
+each level (and optionally the packet coefficients of one column) are
+written into a NETCDF file with (z, band) dimensions. The levels are
+processed in z-slabs, optionally in parallel. Figures are an optional
+post-step that reads the output file (-p, or --plotOnly for an existing file).
+
+Author: Mikko Auvinen
+        mikko.auvinen@helsinki.fi
+        University of Helsinki &
+        Finnish Meteorological Institute
+'''
+
+#==========================================================#
+
+def packetSlab( task ):
+  filename, vn, cl, k1, k2, wavelet, nlevel, ij = task
+  ds = nc.Dataset( filename )
+  X = ds.variables[vn][:, k1*cl:k2*cl:cl, ::cl, ::cl]
+  ds.close()
+  E, Cij, labels = waveletPacketProfile( X, wavelet, nlevel, ij )
+
+  return k1, k2, E, Cij, labels
+
+#==========================================================#
+
+def plotWaveletPacketFile( filename, saveFig=None ):
+  '''
+  Band energy fraction (z, band) from the output file of this script.
+  '''
+  import matplotlib.pyplot as plt
+  ds = nc.Dataset( filename )
+  z = ds.variables['z'][:]; freq = ds.variables['freq'][:]
+  Ef = ds.variables['Ef'][:]
+  title = '{} wavelet packet energy fractions at level {}'.format(ds.varname, ds.nlevel)
+  ds.close()
+
+  fig = plt.figure(num=1, figsize=(12,10))
+  ax = fig.add_axes( [0.1, 0.1 , 0.8 , 0.8] )
+  df = freq[1]-freq[0] if( len(freq) > 1 ) else 1.
+  fe = np.concatenate( (freq-0.5*df, [freq[-1]+0.5*df]) )
+  ze = np.concatenate( ([z[0]], 0.5*(z[1:]+z[:-1]), [z[-1]]) )
+  cm = ax.pcolormesh( fe, ze, Ef, cmap='viridis' )
+  fig.colorbar( cm, ax=ax )
+  ax.set_xlabel('frequency (Hz)'); ax.set_ylabel('z (m)'); ax.set_title( title )
+  if( saveFig ):
+    fig.savefig( saveFig+'.jpg', format='jpg', dpi=300 )
+  plt.show()
+
+#==========================================================#
+parser = argparse.ArgumentParser(prog='waveletPacketProfile.py')
+parser.add_argument("-f", "--filename", type=str,\
+  help="Name of the input NETCDF file.")
+parser.add_argument("-fo", "--fileout", type=str, default="wpout.nc", \
+  help="Name of the output NETCDF file. Default=wpout.nc")
+parser.add_argument("-v", "--varname",  type=str, default='u',\
+  help="Name of the variable in NETCDF file. Default='u' ")
+parser.add_argument("-wt", "--wavelet", type=str, default='db2',\
+  help="Name of the discrete wavelet. See documentation of PyWavelet package. Default='db2' ")
+parser.add_argument("-nl", "--nlevel", type=int, default=4,\
+  help="Wavelet packet level: 2**nlevel bands. Default=4")
+parser.add_argument("-k", "--kIndices",type=int, nargs=2, default=None,\
+  help="Starting and final index (k_start, k_final) of the considered levels. Default: all.")
+parser.add_argument("-i", "--ij", type=int, nargs=2, default=None,\
+  help="Indices (i,j) of the column whose packet coefficients are written. Default=None")
+parser.add_argument("-c", "--coarse", type=int, default=1,\
+  help="Coarsening level. Int > 1. Default = 1.")
+parser.add_argument("-nw", "--nWorkers", type=int, default=1,\
+  help="Number of processes computing the slabs. Default = 1.")
+parser.add_argument("-nz", "--nzSlab", type=int, default=None,\
+  help="Number of z-levels per slab. Default: chosen from the data size.")
+parser.add_argument("-p", "--plot", action="store_true", default=False,\
+  help="Plot the energy fractions from the output file afterwards.")
+parser.add_argument("--plotOnly", action="store_true", default=False,\
+  help="Only plot an existing output file.")
+parser.add_argument("-s", "--save", type=str, default=None, \
+  help="Identifier (name) for the saved figure. Default=None")
+args = parser.parse_args()
+writeLog( parser, args )
+#==========================================================#
+# Rename ...
+filename  = args.filename
+fileout   = args.fileout
+varname   = args.varname
+wavelet   = args.wavelet
+nlevel    = args.nlevel
+ij        = args.ij
+cl        = abs(int(args.coarse))
+#==========================================================#
+parameter = True;  variable  = False
+
+if( args.plotOnly ):
+  plotWaveletPacketFile( fileout, args.save )
+  sys.exit(0)
+
+ds, varList, paramList = netcdfDataset( filename )
+dataDict = coordinateDict( varname, ds, cl )
+z = dataDict['z']; time = dataDict['time']
+ds.close()
+nxy = len(dataDict['x'])*len(dataDict['y'])
+dataDict = None
+
+if( args.kIndices is None ): kr = [ 0, len(z)-1 ]
+else:                        kr = [ max(0, args.kIndices[0]), min(len(z)-1, args.kIndices[1]) ]
+nk = kr[1]-kr[0]+1
+
+nzs = args.nzSlab
+if( nzs is None ): nzs = zSlabSize( len(time), nxy )
+tasks = ( (filename, varname, cl, k1, min(k1+nzs, kr[1]+1), wavelet, nlevel, ij)\
+  for k1 in xrange(kr[0], kr[1]+1, nzs) )
+
+E = None; C = None
+for k1, k2, Es, Cs, labels in slabMap( packetSlab, tasks, args.nWorkers ):
+  if( E is None ):
+    E = np.zeros( (nk, Es.shape[1]) )
+    if( Cs is not None ): C = np.zeros( (nk,) + Cs.shape[1:] )
+  E[k1-kr[0]:k2-kr[0]] = Es
+  if( Cs is not None ): C[k1-kr[0]:k2-kr[0]] = Cs
+
+# Band centre frequencies (bands in frequency order).
+nb = E.shape[1]
+dt = np.mean( time[1:]-time[:-1] )
+freq = (np.arange( nb )+0.5)*(0.5/dt)/nb
+Ef = E/np.maximum( np.sum( E, axis=1 ), 1e-30 )[:,None]
+
+# = = output file = = = = =
+dso = netcdfOutputDataset( fileout )
+dso.varname = varname; dso.wavelet = wavelet; dso.nlevel = nlevel
+dso.band_paths = ' '.join( labels )
+zv = createNetcdfVariable( dso, z[kr[0]:kr[1]+1], 'z', nk, 'm', 'f4', ('z',), parameter )
+bv = createNetcdfVariable( dso, np.arange(nb), 'band', nb, '-', 'i4', ('band',), parameter )
+fv = createNetcdfVariable( dso, freq, 'freq', nb, 'Hz', 'f4', ('band',), variable )
+Ev = createNetcdfVariable( dso, E, 'E', nk, '-', 'f4', ('z','band',), variable )
+Efv= createNetcdfVariable( dso, Ef, 'Ef', nk, '-', 'f4', ('z','band',), variable )
+if( C is not None ):
+  cv = createNetcdfVariable( dso, np.arange(C.shape[2]), 'tc', C.shape[2], '-', 'i4', ('tc',), parameter )
+  Cv = createNetcdfVariable( dso, C, 'C', nk, '-', 'f4', ('z','band','tc',), variable )
+  Cv.ij = '{} {}'.format(ij[0], ij[1])
+
+# - - - - Done , finalize the output - - - - - - - - - -
+netcdfWriteAndClose( dso )
+
+if( args.plot ):
+  plotWaveletPacketFile( fileout, args.save )
@@ -2,11 +2,14 @@
 import sys
 import argparse
 import numpy as np
-import subprocess as sb
+import matplotlib.image as mimg
 from utilities import filesFromList
+from animTools import renderFrames, encodeFrames, imageToRGB, stackFrames
 ''' 
 Description: 
-        
+Concatenate two series of figures on top of each other and encode them into
+an animation. The frames are assembled in memory (in parallel with -nw) and
+piped to the encoder without intermediate files.
 
 
 Author: Mikko Auvinen
@@ -16,14 +19,27 @@ Author: Mikko Auvinen
 '''
 
 #==========================================================#
-parser = argparse.ArgumentParser(prog='reformatNumbersInFilenames.py')
+
+def concatPair( pair ):
+  return stackFrames([ imageToRGB( mimg.imread( f ) ) for f in pair ], axis=0 )
+
+#==========================================================#
+parser = argparse.ArgumentParser(prog='concatFigsAndAnimate.py')
 parser.add_argument("-f1", "--fig1", type=str, help="Search string for figures (1).")
 parser.add_argument("-f2", "--fig2", type=str, help="Search string for figures (2).")
-parser.add_argument("-p", "--printOn", help="Print the renaming commands on screen.",\
+parser.add_argument("-fa","--fileAnim", help="Name of the animation file. (default=anim.gif)",\
+  type=str,default="anim.gif")
+parser.add_argument("-fps", "--fps", type=float, default=10.,\
+  help="Frames per second in the animation. Default=10")
+parser.add_argument("-nw", "--nWorkers", type=int, default=1,\
+  help="Number of processes assembling the frames. Default=1")
+parser.add_argument("-k", "--keepFrames", help="Write also the frames output_NNNN.png.",\
   action="store_true", default=False) 
-parser.add_argument("-pp", "--printOnly", help="Print only the commands on screen.",\
+parser.add_argument("-p", "--printOn", help="Print the figure pairs on screen.",\
   action="store_true", default=False) 
-parser.add_argument("-na", "--noAnim", help="Do not make an animation.",\
+parser.add_argument("-pp", "--printOnly", help="Print only the figure pairs on screen.",\
+  action="store_true", default=False) 
+parser.add_argument("-na", "--noAnim", help="Do not make an animation. Write the frames only.",\
   action="store_true", default=False) 
 args = parser.parse_args()
 #==========================================================#
@@ -39,20 +55,14 @@ fileNos1, fileList1 = filesFromList( "*"+args.fig1+"*" )
 fileNos2, fileList2 = filesFromList( "*"+args.fig2+"*" )
 
 nfigs = min( len(fileList1), len(fileList2) )
+pairs = [ (fileList1[i], fileList2[i]) for i in xrange(nfigs) ]
 
-for i in xrange(nfigs):
-  cmd = 'montage -mode concatenate -tile 1x2 {0} {1} output_{2:04d}.png'\
-    .format(fileList1[i], fileList2[i], i )
-  if( printOn or printOnly ):
-    print(cmd)
-  if( not printOnly ):
-    sb.call(cmd, shell=True)
-
-
-if( not noAnimation ):
-  cmd = 'convert output_* anim.gif '
-  if( printOn or printOnly ):
-    print(cmd)
-  if( not printOnly ):
-    sb.call(cmd, shell=True)
+if( printOn or printOnly ):
+  for i in xrange(nfigs):
+    print(' {0} + {1} -> frame {2:04d}'.format(pairs[i][0], pairs[i][1], i))
 
+if( not printOnly ):
+  if( noAnimation ): fileAnim = None
+  else:              fileAnim = args.fileAnim
+  frames = renderFrames( None, concatPair, pairs, args.nWorkers )
+  encodeFrames( frames, fileAnim, args.fps, 'output', args.keepFrames )
@@ -1,13 +1,17 @@
 #!/usr/bin/python
 
 import sys
-import subprocess as sb
-import pylab as pl
+import numpy as np
 import argparse
-from utilities import filesFromList
-from plotTools import userLabels, plotCSV
+from utilities import filesFromList, readColumns
+from plotTools import csvVarNames, strEntry
+from animTools import renderFrames, encodeFrames
 ''' 
 Description:
+Animate csv data files (e.g. Paraview line exports): one frame per file.
+The figure is created once per process and only the line data is updated
+between frames. Frames are rendered headless (Agg) in parallel with -nw
+and piped directly to the encoder.
 
 
 Author: Mikko Auvinen
@@ -16,6 +20,44 @@ Author: Mikko Auvinen
         Finnish Meteorological Institute
 '''
 
+#==========================================================#
+
+def initFrame( fig ):
+  ax = fig.add_axes( [0.115, 0.075 , 0.85 , 0.81] ) #[left, up, width, height]
+  if( args.magy ): lbls = [' Mag(y[:]) ']
+  else:            lbls = [ varList[yJ] for yJ in yLst ]
+  if( args.yx ): ms = '-'
+  else:          ms = 'o-'
+  lines = [ ax.plot([], [], ms, markersize=6, linewidth=1.5, label=l)[0] for l in lbls ]
+  if( args.yx ):
+    ax.set_ylabel(varList[xI]); ax.set_xlabel('; '.join(lbls))
+  else:
+    ax.set_xlabel(varList[xI]); ax.set_ylabel('; '.join(lbls))
+  if( userLbls is not None ):
+    fd = dict( fontsize=16, fontstyle='normal', fontweight='book', fontname='serif' )
+    ax.set_xlabel( userLbls['x'], **fd ); ax.set_ylabel( userLbls['y'], **fd )
+  ax.grid(True)
+  ax.legend(loc=2)
+  return ax, lines
+
+#==========================================================#
+
+def updateFrame( fig, state, fileStr ):
+  ax, lines = state
+  cols = sorted( set( [xI] + yLst ) )
+  x = dict( zip( cols, readColumns( fileStr, cols, delimiter=',', skiprows=1 ).T ) )
+  if( args.magy ): ys = [ np.sqrt( sum( x[yJ]**2 for yJ in yLst ) ) ]
+  else:            ys = [ x[yJ] for yJ in yLst ]
+  for l, y in zip( lines, ys ):
+    if( args.yx ): l.set_data( y, x[xI] )
+    else:          l.set_data( x[xI], y )
+  ax.relim(); ax.autoscale_view()
+  ax.set_ylim( tuple(ylims) )
+  if( userLbls is not None and userLbls['title'].strip() ):
+    ax.set_title( userLbls['title'], fontsize=20, fontstyle='normal', fontweight='demibold', fontname='serif' )
+  else:
+    ax.set_title( fileStr.split(".")[0] )
+
 #==========================================================#
 parser = argparse.ArgumentParser()
 parser.add_argument("strKey", help="Search string for collecting files.",nargs='?',\
@@ -24,45 +66,68 @@ parser.add_argument("--magy", help="Magnitude of all variables.", action="store_
     default=False)
 parser.add_argument("--yx", help="Reverse axes: plot(x,y) --> plot(y,x)", action="store_true",\
     default=False)    
-parser.add_argument("--labels", help="User specified labels.", action="store_true",\
-    default=False)
-parser.add_argument("--reuse", help="Reuse once specified variable selections.", action="store_true",\
-    default=False)
+parser.add_argument("--labels", help="User specified title and axis labels (prompted once).",\
+    action="store_true", default=False)
+parser.add_argument("-x","--xIndex", help="Column index of x. Prompted if not given.",\
+  type=int, default=None)
+parser.add_argument("-y","--yIndices", help="Column indices of y. Prompted if not given.",\
+  type=int, nargs='+', default=None)
 parser.add_argument("-yl","--ylims", help="Y-axis limits: [min,max]. Default=[0,10]",\
   type=float,nargs=2,default=[0.,10.])
-parser.add_argument("-fn","--figName", help="Name of the (temporary) figures. (default=tmp)",\
+parser.add_argument("-fn","--figName", help="Name of the frame figures with --noAnim or --keepFrames. (default=tmp)",\
   type=str,default="tmp")
 parser.add_argument("-fa","--fileAnim", help="Name of the animation file. (default=anim.gif)",\
   type=str,default="anim.gif")
-parser.add_argument("-na", "--noAnim", help="Do not make an animation.",\
+parser.add_argument("-fps", "--fps", type=float, default=10.,\
+  help="Frames per second in the animation. Default=10")
+parser.add_argument("-nw", "--nWorkers", type=int, default=1,\
+  help="Number of rendering processes. Default=1")
+parser.add_argument("-k", "--keepFrames", help="Write also the png frames.",\
+  action="store_true", default=False) 
+parser.add_argument("-na", "--noAnim", help="Do not make an animation. Write the frames only.",\
   action="store_true", default=False) 
 args = parser.parse_args()    
 #==========================================================#
 strKey      = args.strKey
 figName     = args.figName
-fileAnim    = args.fileAnim
 noAnimation = args.noAnim
 ylims       = args.ylims
 
-n = 0
 fileNos, fileList = filesFromList( "*"+strKey+"*" )
+fileList = [ fileList[fn] for fn in fileNos ]
+if( len(fileList) == 0 ): sys.exit(' No files found. Exiting ...')
 
-for fn in fileNos:
-  n += 1
-  pfig = pl.figure(num=1, figsize=(18.,9.))
-  pfig = plotCSV( pfig, fileList[fn], args.yx, args.magy, args.reuse )
-  pl.grid(True)
-  pl.legend(loc=2)
-  ax = pfig.get_axes()[0]
-  ax.set_ylim( tuple(ylims) )
-  figStr = figName+'_{:04d}.png'.format(n)
-  print(' Saving fig: {}'.format(figStr))
-  pl.savefig(figStr)
-  ax.cla()
-  pfig.clf()
+# Select the variables once, from the first file.
+varList = csvVarNames( fileList[0] )
+xI = args.xIndex; yLst = args.yIndices
+if( xI is None or yLst is None ):
+  for n, v in enumerate( varList ):
+    print("  => ["+str(n)+"]: "+ v)
+  try:
+    if( xI is None ): xI = input(" X [index]  = ")
+    if( yLst is None ):
+      yLst = []
+      e = input(" Y [List] = ")
+      if( isinstance(e, int) ): yLst.append(e)
+      else:                     yLst.extend(e)
+  except:
+    yLst = []
+if( xI is None ):
+  print(' No selection. Exiting program. ')
+  sys.exit(1)
+if( len(yLst) == 0 ): yLst = range(len(varList))
+yLst = list(yLst)
+
+# The labels are asked once here; the rendering processes only use them.
+userLbls = None
+if( args.labels ):
+  userLbls = dict()
+  userLbls['title'] = strEntry( " Plot Title = " , " " )
+  userLbls['y']     = strEntry( " Y Label = "    , " Y " )
+  userLbls['x']     = strEntry( " X Label = "    , " X " )
 
-if( not noAnimation ):
-  cmd = 'convert {}_*  {} '.format(figName, fileAnim)
-  print ' Executing command: ${}'.format(cmd)
-  sb.call(cmd, shell=True)
+if( noAnimation ): fileAnim = None
+else:              fileAnim = args.fileAnim
 
+frames = renderFrames( initFrame, updateFrame, fileList, args.nWorkers, figsize=(18.,9.) )
+encodeFrames( frames, fileAnim, args.fps, figName, args.keepFrames )
@@ -15,23 +15,32 @@ Author: Mikko Auvinen
         University of Helsinki &
         Finnish Meteorological Institute
 '''
+# =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
+def coverCounts( starts, L, N ):
+  # Number of intervals [start, start+L) covering each of the N indices.
+  c = np.zeros( N+1 )
+  np.add.at( c, starts  ,  1. )
+  np.add.at( c, starts+L, -1. )
+  return np.cumsum( c )[:N]
+
 # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*
 def addBlocks( T, stride, Lx, h ):
   Tdims = T.shape
   sy = stride[0]; sx = stride[1]
   ly = Lx[0];     lx = Lx[1]
   
-  for i in xrange( int(np.ceil(Tdims[1]/sx)+1) ):
-    ix  = i*sx 
-    ix2 = ix + lx
-    for j in xrange( int( np.ceil(Tdims[0]/sy)+1) ):
-      jy = j*sy + int(np.mod(i,2)*(sy/2))
-      jy2 = jy+ly
-      if( ix2 > Tdims[1] or jy2 > Tdims[0] ):
-        break
-      else:
-        #print(' ix2 = {}, jy2 = {} '.format(ix2,jy2))
-        T[jy:jy2, ix:ix2] += h
+  # Block columns that fit entirely. Every other column is staggered by sy/2.
+  ix = np.arange( int(np.ceil(Tdims[1]//sx)+1) )*sx
+  ix = ix[ (ix+lx) <= Tdims[1] ]
+  jy = np.arange( int(np.ceil(Tdims[0]//sy)+1) )*sy
+  
+  # The block pattern is a sum of two outer products: even and odd block columns.
+  for p in [0, 1]:
+    jp = jy + p*(sy//2)
+    jp = jp[ (jp+ly) <= Tdims[0] ]
+    Cc = coverCounts( ix[p::2], lx, Tdims[1] )
+    Cr = coverCounts( jp, ly, Tdims[0] )
+    T += h*Cr[:,np.newaxis]*Cc[np.newaxis,:]
 
   return T
  # =*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=*=* 
@@ -109,9 +118,7 @@ if( not args.printOnly ):
   Rdict['R'] = R
   saveTileAsNumpyZ( fileout, Rdict )
   if( writeAscii ):
-    fx = open( 'TOPOGRAPHY_DATA_BLOCK' , 'w' )
-    np.savetxt(fx,np.round(R),fmt='%g')
-    fx.close()
+    saveTileAsAscii( 'TOPOGRAPHY_DATA_BLOCK', R, True )
   
 
 if( args.printOn or args.printOnly ):
@@ -6,6 +6,7 @@ import argparse
 import numpy as np
 from utilities import writeLog
 from mapTools import *
+from objectTools import randomLabelValues
 from plotTools import addImagePlot
 import matplotlib.pyplot as plt
 
@@ -51,6 +52,13 @@ parser.add_argument("-vx", "--vmfix", type=float, nargs='+', default=[None],\
   help="Prescribed values for the masks given by --imfix. (Optional).")
 parser.add_argument("-vz", "--valueForZeros", type=float, default=None, \
   help=" Value to replace remaining zeros. Mean value --mean used as default.")
+parser.add_argument("-sd", "--seed", type=int, default=None,\
+  help="Seed for reproducible random values. Default=None.")
+parser.add_argument("-ne", "--nEnsemble", type=int, default=1,\
+  help="Number of ensemble members written as <fileout>_<member>.npz (and .vtk with -v).\
+  With -pp the members are only computed and their statistics printed. Default=1.")
+parser.add_argument("-nw", "--nWorkers", type=int, default=1,\
+  help="Number of parallel processes for the ensemble members. Default=1.")
 parser.add_argument("-p", "--printOn", action="store_true", default=False,\
   help="Print the resulting raster data.")
 parser.add_argument("-pp", "--printOnly",action="store_true", default=False,\
@@ -73,6 +81,9 @@ varname      = args.name
 imfix        = args.imfix
 vmfix        = args.vmfix
 vfz          = args.valueForZeros
+seed         = args.seed
+nEnsemble    = args.nEnsemble
+nWorkers     = args.nWorkers
 mfixOn       = False
 #==========================================================#
 
@@ -89,6 +100,9 @@ if( vfz is None ):
 if(vtkOn and (filetopo is None)):
   sys.exit(' Error: VTK results require -ft/--filetopo. Exiting ...')
 
+if( (nEnsemble > 1) and printOn ):
+  sys.exit(' Error: -p/--printOn cannot plot an ensemble (-ne > 1). Exiting ...')
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - #
 
 # Read data into an ndarray
@@ -111,71 +125,76 @@ else:  # no need for labeling
 # - - - - - - - - - - - - - - - - - - - - - - - - - - #
 # Initialize a new array or read existing data
 if (fileaug is None):
-  Rx = np.zeros(Rdims)
+  Rx0 = None
   Rxdims = Rdims
 else:
   Rxdict = readNumpyZTile(fileaug)
-  Rx = Rxdict['R']
+  Rx0 = Rxdict['R']
   Rxdict = None
-  Rxdims = np.array(np.shape(Rx))
+  Rxdims = np.array(np.shape(Rx0))
   if (all(Rdims != Rxdims)):
     sys.exit(' Error: size mismatch between two data files when appending.')
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - #
-
-# Fill the areas with generated values
-if(None in distribution):  # Fill with a constant value
-  Rx[(LR>0)] = vmean
-elif (distribution[0] == "gaussian"):
-  for i in xrange(Nshapes):
-    rv = np.random.normal(vmean, distribution[1])
-    Rx[(LR ==(i + 1))] = np.random.normal(vmean, distribution[1])
-elif (distribution[0] == "uniform"):
-  for i in xrange(Nshapes):
-    rv = np.random.uniform(-1.*distribution[1], distribution[1]) 
-    Rx[(LR ==(i + 1))] = vmean + rv
-else:
-  sys.exit('Error: invalid distribution given.')
-
+# Indices of the labelled areas and of the mfix masks with fixed values.
+idl = (LR > 0)
+LRl = LR[idl]
 LR = None
 
-# - - - - - - - - - - - - - - - - - - - - - - - - - - #
-# Gather the indecies for a mfix mask with fixed value.
-idmm = None 
+idmfix = None
 if( mfixOn ):
+  idmfix = list()
   for i in xrange( len(imfix) ):
-    idxm = (R==imfix[i])
-    if( idmm is None):
-      idmm = idxm.copy()
-    else:
-      idmm = np.maximum( idmm, idxm )
-    Rx[idxm] = vmfix[i]
-  
-# - - - - - - - - - - - - - - - - - - - - - - - - - - #
+    idmfix.append( (R==imfix[i]) )
 
 # Clear memory
 R = None
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - #
 
-# Calculate mean and move nonzero values accordingly
-if( idmm is None ):
-  idmm = (Rx>0.)
-  
-offset = np.nanmean(Rx[idmm]) - vmean
-print(' Offset to ensure prescribed mean values. V_offset = {}'.format(offset))
-Rx[idmm] -= offset
-print(' V_max, V_min = {}, {}'.format(np.max(Rx[idmm]), np.min(Rx[idmm])))
-idmm = None
+def distributeValues( member ):
+  # Each ensemble member has its own reproducible random stream.
+  rng = np.random.RandomState( [seed, member] ) if seed is not None else np.random.RandomState()
 
-# - - - - - - - - - - - - - - - - - - - - - - - - - - #
+  if( Rx0 is None ): Rx = np.zeros(Rxdims)
+  else:              Rx = Rx0.copy()
+
+  # Fill the areas with generated values: one draw per area and a single lookup.
+  if(None in distribution):  # Fill with a constant value
+    Rx[idl] = vmean
+  else:
+    values = randomLabelValues( Nshapes, distribution, vmean, rng )
+    Rx[idl] = values[LRl]
+
+  # Gather the indecies for a mfix mask with fixed value.
+  idmm = None 
+  if( mfixOn ):
+    for i in xrange( len(imfix) ):
+      idxm = idmfix[i]
+      if( idmm is None):
+        idmm = idxm.copy()
+      else:
+        idmm = np.maximum( idmm, idxm )
+      Rx[idxm] = vmfix[i]
 
-# Replace remaining zero values. These do not influence the area average
-# imposed above. 
-Rx[~(Rx>0.)] = vfz 
+  # Calculate mean and move nonzero values accordingly
+  if( idmm is None ):
+    idmm = (Rx>0.)
+    
+  offset = np.nanmean(Rx[idmm]) - vmean
+  print(' Offset to ensure prescribed mean values. V_offset = {}'.format(offset))
+  Rx[idmm] -= offset
+  print(' V_max, V_min = {}, {}'.format(np.max(Rx[idmm]), np.min(Rx[idmm])))
+  idmm = None
 
+  # Replace remaining zero values. These do not influence the area average
+  # imposed above. 
+  Rx[~(Rx>0.)] = vfz 
+
+  return Rx
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
 # Read topography data
 if ( vtkOn and not printOnly):
   topoDict = readNumpyZTile(filetopo)
@@ -194,10 +213,12 @@ if ( vtkOn and not printOnly):
   xa = np.arange( Rdims[1] ).astype(float) * dPx[1]
   ya = np.arange( Rdims[0] ).astype(float) * dPx[0]
   X, Y = np.meshgrid(xa,ya)
-  
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+def writeVtk( Rx, fname ):
   # Write the data into a VTK file
   # N axis of (N,E) coordinates has to be reversed
-  fname = fileout.split('.')[0]+'.vtk'
   t_vtk = vtkWriteHeaderAndGridStructured2d(X, Y, topo[::-1, :], fname, 'VTK map');
   t_vtk = vtkWritePointDataHeader(t_vtk, Rx[::-1, :], 1)
   t_vtk = vtkWritePointDataStructured2D(t_vtk, Rx[::-1, :], X, varname)
@@ -206,6 +227,35 @@ if ( vtkOn and not printOnly):
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - #
 
+def ensembleMember( member ):
+  Rx = distributeValues( member )
+  if( printOnly ): return member
+  fname = '{}_{:03d}'.format(fileout.split('.npz')[0], member)
+  RxDict = {'R':Rx, 'dPx':dPx, 'GlobOrig':ROrig, 'Nshapes':Nshapes}
+  saveTileAsNumpyZ( fname, RxDict )
+  if( vtkOn ): writeVtk( Rx, fname+'.vtk' )
+  return member
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+if( nEnsemble > 1 ):
+  # Ensembles of perturbed rasters, one file (and VTK file) per member.
+  if( nWorkers > 1 ):
+    from multiprocessing import Pool
+    pool = Pool( nWorkers )
+    pool.map( ensembleMember, xrange(nEnsemble) )
+    pool.close(); pool.join()
+  else:
+    for m in xrange(nEnsemble): ensembleMember( m )
+  sys.exit(0)
+
+Rx = distributeValues( 0 )
+
+if ( vtkOn and not printOnly):
+  writeVtk( Rx, fileout.split('.')[0]+'.vtk' )
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
 # Save as npz
 if(not printOnly):
   Rdict['R'] = Rx; Rdict['dPx'] = dPx; Rdict['GlobOrig'] = ROrig
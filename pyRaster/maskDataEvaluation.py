@@ -3,6 +3,7 @@ import sys
 import argparse
 import numpy as np
 from mapTools import *
+from objectTools import *
 from utilities import filesFromList, writeLog
 from plotTools import addImagePlot
 import matplotlib.pyplot as plt
@@ -42,23 +43,19 @@ def histogram( Rm, Ri, mlist, threshold = 0. ):
 
   maxv  = int(np.ceil(np.max(Ri)))
   zbins = np.zeros( (len(mlist), maxv) )
+  bins  = np.arange( maxv+1 )   # Unit bins: pixel value v goes to bin int(v).
 
   j = 0
   for im in mlist:
     LR, labelCount = labelRaster(Rm, im)
-    #Np = float(np.count_nonzero( (LR > 0) ))#; print('Np={}'.format(Np))
-    #Np  = float(labelCount)
-    Np = 0
-    Av = np.zeros( labelCount )
-    for l in xrange(1,labelCount+1):
-      idx = (LR==l)
-      for v in Ri[idx]:
-      #v  = int( np.floor(np.percentile( Ri[idx], 96 )) )
-        nw = 1 # = np.count_nonzero(idx) #; print('w={}'.format(w))
-        Np += nw
-        Av[l-1] = float(v)
-        zbins[j,int(v)] += nw
-    zbins[j,:] /= Np
+    # Height histogram of all objects at once; the mask histogram is their sum.
+    H  = objectHistograms( LR, labelCount, np.minimum( Ri, maxv-1 ), bins )
+    Np = max( np.sum(H), 1 )
+    zbins[j,:] = np.sum( H, axis=0 )/float(Np)
+    
+    # Object heights.
+    Av = objectMaxValues( LR, labelCount, Ri )
+    LR = H = None
     
     idx = ( Av > threshold )
     print(' Mask {}: mean = {}, var = {}, std = {}'\
@@ -84,6 +81,8 @@ parser.add_argument("-ma", "--maskAbove", help="Mask all above given value.",\
   type=int, default=None)
 parser.add_argument("-ex", "--exBuffer", action="store_true", default=False,\
   help="Consider the effective area excluding frontal buffer.")
+parser.add_argument("-os", "--objectStats", type=str, default=None,\
+  help="Write per-object (area, perimeter, mean/max height) statistics of the masks into given file.")
 parser.add_argument("-p", "--printOn", help="Print the numpy array data.",\
   action="store_true", default=False)
 parser.add_argument("--lims", help="User specified colormap and limits for plot.",\
@@ -192,6 +191,13 @@ if( filedata ):
     np.c_[np.arange(1,len(zbins[0,:])+1), 100.*np.transpose(zbins) ])
   #print(' sum = {} '.format( np.sum(zbins[0,:])))
 
+if( args.objectStats ):
+  LR, nObj = labelObjects( Rxm, mskList )
+  odict = objectStatistics( LR, nObj, dPxm if filemask else dPxt, Rt )
+  LR = None
+  writeObjectStatistics( args.objectStats, odict )
+  odict = None
+
 
 # Create an empty mask id list
 if( Rxm is not None ):
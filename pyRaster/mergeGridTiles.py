@@ -26,6 +26,10 @@ parser.add_argument("-pp", "--printOnly", help="Only print the extracted tile. D
   action="store_true", default=False) 
 parser.add_argument("-s", "--scale",type=float,\
    help="Scale factor for the output. Default=1.", default=1.)   
+parser.add_argument("-n", "--nWorkers",type=int,\
+   help="Number of parallel processes for reading the tiles. Default=1.", default=1)
+parser.add_argument("-m", "--memmap",type=str, default=None,\
+   help="Assemble the mosaic into a memory-mapped .npy file of given name. Default=None.")
 args = parser.parse_args() 
 writeLog( parser, args )
 #==========================================================#
@@ -69,10 +73,8 @@ dPx = resolutionFromDicts( dictList )
 
 #print ' dictList = {} '.format(dictList)  
 
-gIJ, XOrig, Mrows, Mcols = arrangeTileGrid( dictList, [ascii,npz] )
-print 'gIJ : {} '.format( gIJ )
-
-Rdict = compileTileGrid( dictList, gIJ , Mrows, Mcols, [ascii, npz] )
+# The mosaic extent is obtained from the headers. Tiles are copied in place as they are read.
+Rdict, XOrig = assembleTileMosaic( dictList, [ascii, npz], args.nWorkers, args.memmap )
 Rdims = np.array(np.shape(Rdict['R']))
 Rdict['GlobOrig'] = XOrig
 Rdict['dPx'] = dPx
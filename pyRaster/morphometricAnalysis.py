@@ -16,7 +16,10 @@ Author: Sasu Karttunen
 #==========================================================#
 parser = argparse.ArgumentParser(prog='morphometricAnalysis.py', description='''Estimate values for z_0 and z_d using morphometric methods described by Macdonald et al. (1998), Kanda et al. (2013) and Kent et al. (2017).''')
 parser.add_argument("-bf","--buildings", type=str, help="Name of a raster map file of the buildings [npz].")
-parser.add_argument("-wd","--windDir", type=float, default=0.0, help="Offset of wind direction from x-axis in degrees. Wind along x-axis is 0, crosswind is 90.")
+parser.add_argument("-wd","--windDir", type=float, nargs='+', default=[0.0], help="Offset of wind direction(s) from x-axis in degrees. Wind along x-axis is 0, crosswind is 90.")
+parser.add_argument("-ns","--nSectors", type=int, default=None, help="Evaluate all wind sectors 0, 360/ns, ... deg in one run. Overrides --windDir.")
+parser.add_argument("-gw","--gridWindow", type=int, default=None, help="Compute gridded z_0 and z_d maps over cells of gridWindow x gridWindow pixels.")
+parser.add_argument("-fo","--fileout", type=str, default=None, help="Output file for the sector table (text) or the gridded maps (npz).")
 parser.add_argument("-vf","--vegetation", type=str, help="Name of a 3-dimensional mask file of the vegetation [npz]. Used for Kent et al. (2017) method.")
 parser.add_argument("--cdb", type=float, default=1.2, help="Drag coefficient for buildings.")
 parser.add_argument("--p3d", type=float, default=0.2, help="Porosity of the vegetation.")
@@ -53,7 +56,22 @@ alpha=args.alpha
 beta=args.beta
 cdb=args.cdb
 p3d=args.p3d
-windDir=args.windDir
+windDirs=np.array(args.windDir, float)
+if( args.nSectors is not None ):
+  windDirs = np.arange(args.nSectors)*(360./args.nSectors)
+sweepOn = ( len(windDirs) > 1 )
+
+def printOrSave( pdict, fileout ):
+  # A table of the sector results.
+  keys = ['windDir','frontalFrac','mac_z0','mac_zd','kanda_z0','kanda_zd']
+  hStr = ' '.join(keys)
+  M = np.column_stack([ np.ravel(pdict[k]*np.ones(len(windDirs))) for k in keys ])
+  print('\n '+hStr)
+  for row in M:
+    print(' {:7.1f} {:11.4f} {:6.2f} {:6.2f} {:8.2f} {:8.2f}'.format(*row))
+  if( fileout ):
+    np.savetxt( fileout, M, fmt='%.5g', header=hStr )
+    print(' Results written to {}'.format(fileout))
 
 # Read the building data.
 bDict = readNumpyZTile(args.buildings)
@@ -61,6 +79,47 @@ bR = bDict['R']
 bnPx = np.shape(bR)
 bdPx = bDict['dPx']
 
+if( args.gridWindow is not None ):
+  '''
+  Gridded (moving window) maps: the statistics are gathered over cells of
+  gridWindow x gridWindow pixels in one pass and z_0, z_d are evaluated
+  for all wind directions at once.
+  '''
+  W = args.gridWindow
+  gb = morphometricGridStats( bR, W, 2.0 )
+  Npx = float(W*W)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    h_av  = gb['h_sum']/gb['Npx']
+    std_h = np.sqrt( np.maximum( gb['h2_sum']/gb['Npx'] - h_av**2, 0. ) )
+    h_max = gb['h_max']
+    planFrac = gb['Npx']/Npx
+    frontalFrac = sectorFrontalAreas( gb['S'], windDirs )/Npx  # (nDirs, nr, nc)
+
+    if (args.vegetation):
+      print("\nIncluding vegetation:")
+      vR = readNumpyZTile(args.vegetation)['R']
+      gv = morphometricGridStats( vR, W, 2.0 ); vR = None
+      pv = (-1.251*p3d**2+0.489*p3d+0.803)/cdb
+      planFrac = (gb['Npx'] + gv['Npx']*(1.-p3d))/Npx
+      frontalFrac += sectorFrontalAreas( gv['S'], windDirs )/Npx * pv
+
+    mac_z0, mac_zd = morphMacdonald(alpha, beta, planFrac, frontalFrac, h_av, cdb)
+    kanda_z0, kanda_zd = morphKanda(h_av, h_max, std_h, planFrac, mac_z0)
+
+  # Cells without roughness elements.
+  for v in [mac_z0, mac_zd, kanda_z0, kanda_zd]:
+    v[~np.isfinite(v)] = 0.
+
+  gDict = {'windDirs':windDirs, 'planFrac':planFrac, 'frontalFrac':frontalFrac,\
+    'h_av':np.nan_to_num(h_av), 'h_max':h_max, 'std_h':std_h,\
+    'mac_z0':mac_z0, 'mac_zd':mac_zd, 'kanda_z0':kanda_z0, 'kanda_zd':kanda_zd,\
+    'GlobOrig':bDict['GlobOrig'], 'dPx':np.array(bdPx)*W}
+  print(" Gridded maps: {} wind directions, {} cells.".format(len(windDirs), planFrac.shape))
+  fileout = args.fileout
+  if( not fileout ): fileout = args.buildings.split('.npz')[0]+'_morph'
+  saveTileAsNumpyZ( fileout, gDict )
+  sys.exit(0)
+
 # Calculate h_av, average roughness element height (2 m threshold to ignore park benches, cars and such)
 h_av=np.mean(bR[np.where(bR>2.0)])
 print("\nAverage height of the buildings: {:.2f} m".format(h_av))
@@ -78,20 +137,24 @@ print("Standard deviation of the height of the buildings: {:.2f} m".format(std_h
 planFracb=float(len(bR[np.where(bR>2.0)]))/np.prod(bnPx)
 print("Plan area fraction of the builings: {:.4f}".format(planFracb))
 
-# Frontal area fraction of buildings
-frontalAreaXb, frontalAreaYb = frontalAreas(bR)
-frontalFracXb = frontalAreaXb*np.cos(np.deg2rad(windDir))/np.prod(bnPx)
-frontalFracYb = frontalAreaYb*np.sin(np.deg2rad(windDir))/np.prod(bnPx)
-frontalFracb = frontalFracXb+frontalFracYb
-print("Frontal area fraction of the buildlings: {:.4f}".format(frontalFracb))
+# Frontal area fraction of buildings for all wind directions at once.
+Sb = frontalAreaSums(bR)
+frontalFracb = sectorFrontalAreas( Sb, windDirs )/np.prod(bnPx)
+if( not sweepOn ):
+  frontalFracb = frontalFracb[0]
+  print("Frontal area fraction of the buildlings: {:.4f}".format(frontalFracb))
 
 mac_z0, mac_zd = morphMacdonald(alpha, beta, planFracb, frontalFracb, h_av, cdb)
-print("\nMac z_0: {:.2f} m".format(mac_z0))
-print("Mac z_d: {:.2f} m".format(mac_zd))
-
 kanda_z0, kanda_zd = morphKanda(h_av,h_max,std_h,planFracb,mac_z0)
-print("\nKanda z_0: {:.2f} m".format(kanda_z0))
-print("Kanda z_d: {:.2f} m".format(kanda_zd))
+if( sweepOn ):
+  printOrSave( {'windDir':windDirs, 'frontalFrac':frontalFracb, 'mac_z0':mac_z0, 'mac_zd':mac_zd,\
+    'kanda_z0':kanda_z0, 'kanda_zd':kanda_zd}, None if args.vegetation else args.fileout )
+else:
+  print("\nMac z_0: {:.2f} m".format(mac_z0))
+  print("Mac z_d: {:.2f} m".format(mac_zd))
+
+  print("\nKanda z_0: {:.2f} m".format(kanda_z0))
+  print("Kanda z_d: {:.2f} m".format(kanda_zd))
 
 # Inclusion of vegetation
 # Plan area and frontal area fraction of vegetation
@@ -105,16 +168,19 @@ if (args.vegetation):
 
   planFracvb = (float(len(bR[np.where(bR>2.0)]))+float(len(vR[np.where(vR>2.0)]))*(1.-p3d))/np.prod(bnPx)
   pv = (-1.251*p3d**2+0.489*p3d+0.803)/cdb
-  frontalAreaXv, frontalAreaYv = frontalAreas(vR)
-  frontalFracXv = frontalAreaXv*np.cos(np.deg2rad(windDir))/np.prod(vnPx)
-  frontalFracYv = frontalAreaYv*np.sin(np.deg2rad(windDir))/np.prod(vnPx)
-  frontalFracvb = frontalFracb+(frontalFracXv+frontalFracYv)*pv
+  frontalFracv = sectorFrontalAreas( frontalAreaSums(vR), windDirs )/np.prod(vnPx)
+  if( not sweepOn ): frontalFracv = frontalFracv[0]
+  frontalFracvb = frontalFracb+frontalFracv*pv
 
   mac_z0, mac_zd = morphMacdonald(alpha, beta, planFracvb, frontalFracvb, h_av, cdb)
   kanda_z0, kanda_zd = morphKanda(h_av,h_max,std_h,planFracvb,mac_z0)
 
-  print("\nMac z_0: {:.2f} m".format(mac_z0))
-  print("Mac z_d: {:.2f} m".format(mac_zd))
+  if( sweepOn ):
+    printOrSave( {'windDir':windDirs, 'frontalFrac':frontalFracvb, 'mac_z0':mac_z0, 'mac_zd':mac_zd,\
+      'kanda_z0':kanda_z0, 'kanda_zd':kanda_zd}, args.fileout )
+  else:
+    print("\nMac z_0: {:.2f} m".format(mac_z0))
+    print("Mac z_d: {:.2f} m".format(mac_zd))
 
-  print("\nKanda z_0: {:.2f} m".format(kanda_z0))
-  print("Kanda z_d: {:.2f} m".format(kanda_zd))
+    print("\nKanda z_0: {:.2f} m".format(kanda_z0))
+    print("Kanda z_d: {:.2f} m".format(kanda_zd))
@@ -31,9 +31,14 @@ parser.add_argument("-mh","--mrgnH", help="Margins heights: [L,R,B,T]. Default=0
   type=float,nargs=4,default=[0.,0.,0.,0.])
 helpFlt = ''' Filter type and its associated number. Available filters:
  median, percentile, rank, gaussian, local. Entering \"user, num\" allows the user
- to specify <num> different filters consecutively.
+ to specify <num> different filters consecutively. The same pipeline can be given
+ non-interactively as \"chain median:5,gauss:2\".
  Example entry: median 5'''
 parser.add_argument("-ft","--filter",type=str,nargs=2,default=[None,None], help=helpFlt)
+parser.add_argument("-nw","--nWorkers", type=int, default=1,\
+  help="Number of parallel processes for tiled filtering. Default=1.")
+parser.add_argument("-ts","--tileSize", type=int, default=None,\
+  help="Filter the raster in tiles of given size (pixels). Default=None (whole raster).")
 parser.add_argument("-rx","--rmax", type=float, default=None,\
   help="Recover peaks (after filtering) above given value.")
 parser.add_argument("-hx","--hmax", type=float, default=None,\
@@ -85,7 +90,7 @@ R = applyMargins( R , mw, mr, mh )
 
 # Apply desired filters.
 Rf = np.zeros( np.shape(R) , float)
-Rf =  filterAndScale(Rf, R, flt )
+Rf =  filterAndScale(Rf, R, flt, nWorkers=args.nWorkers, tileSize=args.tileSize )
 if( rmax is not None ):
   idv = (Rf > rmax)
   Rf[idv]  = np.maximum( Rf[idv], R[idv] )
@@ -88,25 +88,30 @@ print(' maxDims = {}'.format(maxDims))
 rr1 = int(dPc/dPx2)
 rr2 = int(dPc/dPx1)
 
-i1,j1 = np.ogrid[0:maxDims[0], 0:maxDims[1]]
-i1/=rr1; j1/=rr1
+# Migrate the coarser raster into the finer resolution without index arrays.
+if( rr1 > 1 ): R1 = refineRaster( R1, rr1 )
+if( rr2 > 1 ): R2 = refineRaster( R2, rr2 )
+R1 = R1[:maxDims[0],:maxDims[1]]; R2 = R2[:maxDims[0],:maxDims[1]]
 
-i2,j2 = np.ogrid[0:maxDims[0], 0:maxDims[1]]
-i2/=rr2; j2/=rr2
+print(' aligned dims 1: {} '.format(R1.shape))
+print(' aligned dims 2: {} '.format(R2.shape))
 
-print(' index dims 1: {}, {} '.format(np.max(i1),np.max(j1)))
-print(' index dims 2: {}, {} '.format(np.max(i2),np.max(j2)))
-
-# Initialize the new storage arrays which are of fine resolution.
-Rt1 = np.zeros( maxDims, float )
-Rt2 = np.zeros( maxDims, float )
+# Initialize the new storage array which is of fine resolution.
+Rt = np.zeros( maxDims, float )
 
 # Apply filtering if desired and perform the superposition with appropriate scaling.
-Rt1 = filterAndScale(Rt1, R1, flt1, s1 , i1, j1)
-Rt2 = filterAndScale(Rt2, R2, flt2, s2 , i2, j2)
-
-
-Rt = Rt1 + Rt2
+# The contributions are accumulated directly into views of Rt.
+Rt1 = filterAndScale(Rt[:R1.shape[0],:R1.shape[1]], R1, flt1, s1)
+if( (printOn or printOnly) and flt1.count(None) == 0 ): Rt1 = Rt1.copy()
+R1 = None
+
+Rt2 = Rt[:R2.shape[0],:R2.shape[1]]
+if( (printOn or printOnly) and flt2.count(None) == 0 ):
+  Rt2 = filterAndScale(np.zeros( R2.shape, float ), R2, flt2, s2)
+  Rt[:R2.shape[0],:R2.shape[1]] += Rt2
+else:
+  Rt2 = filterAndScale(Rt2, R2, flt2, s2)
+R2 = None
 
 '''
 In case two rasters need to be merged, but not superimposed.
@@ -23,6 +23,8 @@ parser.add_argument("-f", "--filename",type=str, help="Name of the comp domain d
 parser.add_argument("-fo", "--fileout",type=str, help="Name of output ASCII file.")
 parser.add_argument("-i", "--round2Int", help="Round the output data to nearest integers.",\
   action="store_true", default=False)
+parser.add_argument("-nw", "--nWorkers", type=int, default=1,\
+  help="Number of processes formatting the output rows. Default=1")
 parser.add_argument("-p", "--printOn", help="Print also the raster data.",\
   action="store_true", default=False)
 parser.add_argument("-pp", "--printOnly", help="Only print raster data. Don't write.",\
@@ -46,10 +48,7 @@ print(' Rdims = {} '.format(Rdims))
 print(' ROrig = {} '.format(ROrig))
 
 if( not printOnly ):
-  fx = open( fileout , 'w' )
-  if( round2Int ): np.savetxt(fx,np.round(R),fmt='%g')
-  else:            np.savetxt(fx,R,fmt='%g')
-  fx.close()
+  saveTileAsAscii( fileout, R, round2Int, nWorkers=args.nWorkers )
 
 if( args.printOn or args.printOnly ):
   figDims = 13.*(Rdims[::-1].astype(float)/np.max(Rdims))
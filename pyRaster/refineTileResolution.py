@@ -21,6 +21,10 @@ parser.add_argument("-f", "--filename",type=str, help="Name of the .npz data fil
 parser.add_argument("-fo", "--fileout",type=str, help="Name of output Palm/npz topography file.",\
   default="TOPOGRAPHY_MOD")
 parser.add_argument("-N","--refn", help="Refinement factor N in 2^N. Negative value coarsens.", type=float)
+parser.add_argument("-m","--method", type=str, default='mean', choices=['mean','max','min','mode'],\
+  help="Block reduction used when coarsening. Use mode for land use classes. Default=mean.")
+parser.add_argument("-nb","--nBlockRows", type=int, default=None,\
+  help="Number of rows processed at a time. Default=automatic.")
 parser.add_argument("-p", "--printOn", help="Print the resulting raster data.",\
   action="store_true", default=False)
 parser.add_argument("-pp", "--printOnly", help="Only print the resulting data. Don't save.",\
@@ -47,51 +51,19 @@ gridRot1 = Rdict['gridRot']
 # Resolution ratio (rr).
 rr = 2**N
 
-# Create the index arrays. The dims are always according to the larger one.
+# Integer refinement/coarsening factor.
 if( N > 0. ):
-  dr1 = rr; fr2 = 1        # dr1 > 1
-  maxDims = dr1 * R1dims   # Refinement, R2dims > R1dims
-  R2dims  = maxDims
-  s2 = 1.                   # Scale factor. If we refine, the R1 values always fill a new zero cell, see below.
-  n1,e1 = np.ogrid[ 0:maxDims[0] , 0:maxDims[1] ]  # northing, easting 
-  n2,e2 = np.ogrid[ 0:maxDims[0] , 0:maxDims[1] ]  # northing, easting
+  n = int(np.round(rr))
+  R2 = refineRaster( R1, n, args.nBlockRows ).astype(float, copy=False)
 else:
-  dr1 = 1; fr2 = rr    # fr2 < 1
-  maxDims = R1dims     # Coarsening, R2dims < R1dims
-  R2dims  = (rr * R1dims).astype(int); print(' Coarser dims = {}'.format(R2dims))
-  s2 = (2**(2*N))   # Scale factor. If we coarsen, the R1 values are appended. Same value to 2^2n cells.
-  n1 = np.arange(maxDims[0]); e1 = np.arange(maxDims[1])
-  n2 = np.arange(maxDims[0]); e2 = np.arange(maxDims[1])
-
-# Modify the integer list for refining/coarsening
-n1/=dr1; e1/=dr1
-n1 = n1.astype(int);  e1 = e1.astype(int)
-
-n2 = n2*fr2        ;  e2 = e2*fr2
-n2 = n2.astype(int);  e2 = e2.astype(int)
-
-#print ' n2 = {} '.format(n2)
-#print ' n1 = {} '.format(n1)
-
-
-
-# Create the output array.
-R2 = np.zeros( R2dims, float )
-
-if( N > 0 ):
-  R2[n2, e2] += R1[n1,e1]
-else:
-  n2 = np.minimum( n2 , R2dims[0]-1)
-  e2 = np.minimum( e2 , R2dims[1]-1)
-  for k in xrange(maxDims[0]):
-    for l in xrange(maxDims[1]):
-      R2[ n2[k], e2[l] ] +=  R1[ n1[k] ,e1[l] ]
+  n = int(np.round(1./rr))
+  R2 = coarsenRaster( R1, n, args.method, args.nBlockRows ).astype(float, copy=False)
+  print(' Coarser dims = {}'.format(np.array(R2.shape)))
 
 
 # NOTE! The global origin is the coordinate of the top left cell center. 
 # Therefore, it must be shifted by in accordance to the top left cc's new location.
 R1 = None
-R2 *= s2
 Rdict['R'] = R2
 
 dPx2 = dPx1/rr
@@ -109,9 +81,7 @@ Rdict['GlobOrig'] = R2Orig
 Rdict['dPx'] = dPx2
 
 if( not args.printOnly ):
-  fx = open( fileout , 'w' )
-  np.savetxt(fx,np.round(R2),fmt='%g')
-  fx.close()
+  saveTileAsAscii( fileout, R2, True )
   saveTileAsNumpyZ( fileout, Rdict )
 
 if( args.printOn or args.printOnly ):
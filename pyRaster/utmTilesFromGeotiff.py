@@ -26,8 +26,12 @@ parser.add_argument("-p", "--printOn", help="Print the extracted tile.",\
   action="store_true", default=False)
 parser.add_argument("-pp", "--printOnly", help="Only print the extracted tile. Don't save.",\
   action="store_true", default=False)
-parser.add_argument("-t", "--utmTile", help="Utm tile code (2 chars). For example: P5",\
-   type=str, default=None)
+parser.add_argument("-t", "--utmTile", help="Utm tile code(s). For example: P5 or L4131*."\
+  " A '*' expands to all sub-tiles of that level.", type=str, nargs='+', default=None)
+parser.add_argument("-n", "--nWorkers", type=int,\
+   help="Number of parallel processes writing the tiles. Default=1.", default=1)
+parser.add_argument("-nb", "--nBlockRows", type=int,\
+   help="Number of native raster block rows read per strip. Default=16.", default=16)
 parser.add_argument("-s", "--scale", type=float,\
    help="Scale factor for the output. Default=1.", default=1.)
 args = parser.parse_args()
@@ -60,37 +64,53 @@ printRasterBandStatistics(rb)
 #R, Rdims = readAsNumpyArray( rb )  # This is heavy and undesirable way to go!
 
 if( utmTile is not None ):
+  utmTile = expandUtmTileCodes( utmTile )
   # Define the bottom left (BL) origin of this tile, for example, P5.
   # This is redundant if the getGeoTransform() works.
-  XOrig_check = UtmReference( utmTile )
+  XOrig_check = UtmReference( utmTile[0] )
   print " XOrig: {} vs. {} ".format( XOrig, XOrig_check )
 
 # Determine the resolution of the raster data [dn,de].
 #resolution_check = UtmTileDims() / Rdims
 #print ' Pixel resolution (m): {} vs. {}'.format(resolution, resolution_check)
-Rdict = extractSubTile( rb, utmTile, XOrig, resolution)
+if( utmTile is not None ):
+  # All sub-tiles are extracted in one sweep over the raster band.
+  tiles = readSubTilesSweep( rb, utmTile, XOrig, resolution, args.nBlockRows )
+else:
+  tiles = [ ( filename.split('.')[0], extractSubTile( rb, None, XOrig, resolution) ) ]
 
-Rdict['dPx'] = resolution
-Rdict['rotation'] = 0.
+pool = None
+if( args.nWorkers > 1 and not args.printOnly ):
+  from multiprocessing import Pool
+  pool = Pool( args.nWorkers )
 
-Rdict['R'][Rdict['R']>32765] = 0.
+results = []
+for fileout, Rdict in tiles:
+  Rdict['dPx'] = resolution
+  Rdict['rotation'] = 0.
 
-if( args.scale != 1.):
-  Rdict['R']=Rdict['R']*args.scale
+  Rdict['R'][Rdict['R']>32765] = 0.
 
-if( utmTile is not None):
-  fileout = utmTile
-else:
-  fileout = filename.split('.')[0]
+  if( args.scale != 1.):
+    Rdict['R']=Rdict['R']*args.scale
+
+  if( not args.printOnly ):
+    if( pool is not None ):
+      results.append( pool.apply_async( saveTileAsNumpyZ, (fileout , Rdict) ) )
+    else:
+      saveTileAsNumpyZ( fileout , Rdict )
 
+  if( args.printOnly or args.printOn ):
+    Rdims = np.array( Rdict['R'].shape )
+    figDims = 13.*(Rdims[::-1].astype(float)/np.max(Rdims))
+    fig = plt.figure(figsize=figDims)
+    fig = addImagePlot( fig, Rdict['R'], fileout )
 
-if( not args.printOnly ):
-  saveTileAsNumpyZ( fileout , Rdict )
+  Rdict = None
 
+if( pool is not None ):
+  for r in results: r.get()
+  pool.close(); pool.join()
 
 if( args.printOnly or args.printOn ):
-  Rdims = np.array( Rdict['R'].shape )
-  figDims = 13.*(Rdims[::-1].astype(float)/np.max(Rdims))
-  fig = plt.figure(num=1, figsize=figDims)
-  fig = addImagePlot( fig, Rdict['R'], fileout )
   plt.show()